@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class AppRunConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_run'
+
+    def ready(self):
+        from django.db import connections
+
+        from . import metrics, signals  # noqa: F401
+
+        # подключения, открытые до ready(), connection_created уже пропустили
+        for connection in connections.all(initialized_only=True):
+            if connection.connection is not None:
+                metrics.install_sql_wrapper(connection)
@@ -0,0 +1,164 @@
+"""
+Асинхронные start / stop / создание точки, live-лента и выгрузки треков для
+ASGI (project_run.asgi).
+
+Под WSGI работают обычные DRF-вьюхи из app_run.views; ASGI-приложение
+подменяет только эти маршруты (project_run.urls_asgi). Ответы те же:
+тела рендерит тот же JSONRenderer, тексты ошибок — те же.
+
+Start — условный UPDATE через async ORM (transitions.astart), поиск
+предметов — geo.acollect_nearby (geodesic в пуле потоков). Stop и запись
+точки с блокировкой забега выполняются одним sync_to_async: транзакции
+async ORM не поддерживает. С POSITION_BUFFER точка, как и в PositionViewSet,
+уходит в буфер app_run.ingest и получает ответ 202. Выгрузки отдают куски
+app_run.export асинхронным итератором: синхронный Django под ASGI вычитал бы
+весь файл в память до первого байта.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from . import export, ingest, live, tracking, transitions
+from .geo import acollect_nearby
+from .models import Position, Run
+from .serializers import PositionSerializer
+from .views import PositionViewSet, award_items, live_response, nearby_items_queryset, position_buffer
+
+
+_renderer = JSONRenderer()
+_not_found = {"detail": "No Run matches the given query."}
+_position_list = PositionViewSet.as_view({"get": "list", "post": "create"})
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(_renderer.render(data), status=status_code, content_type="application/json")
+
+
+def _refused(exc):
+    return _json(
+        {"detail": "Run already started or finished!", "id": exc.run_id, "status": exc.status},
+        status.HTTP_400_BAD_REQUEST,
+    )
+
+
+@csrf_exempt
+async def start_run(request, run_id):
+    if request.method != "POST":
+        return _json({"detail": f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+    try:
+        await transitions.astart(run_id)
+    except Run.DoesNotExist:
+        return _json(_not_found, status.HTTP_404_NOT_FOUND)
+    except transitions.InvalidTransition as exc:
+        return _refused(exc)
+    return _json({"id": run_id, "status": transitions.IN_PROGRESS})
+
+
+@csrf_exempt
+async def stop_run(request, run_id):
+    if request.method != "POST":
+        return _json({"detail": f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+    try:
+        run = await sync_to_async(transitions.finish)(run_id)
+    except Run.DoesNotExist:
+        return _json(_not_found, status.HTTP_404_NOT_FOUND)
+    except transitions.InvalidTransition as exc:
+        return _refused(exc)
+    return _json({
+        "id": run.id,
+        "status": run.status,
+        "distance": run.distance,
+        "run_time_seconds": run.run_time_seconds,
+    })
+
+
+def _request_data(request):
+    if request.content_type == "application/json":
+        return json.loads(request.body or b"null")
+    return request.POST
+
+
+def _save_position(serializer, items):
+    with transaction.atomic():
+        position = serializer.save()
+        tracking.add_positions(position.run_id, [position])
+        award_items(position.run.athlete_id, items)
+    return position
+
+
+@csrf_exempt
+async def positions(request):
+    """POST — асинхронное создание точки, остальное — PositionViewSet как есть."""
+    if request.method != "POST":
+        return await sync_to_async(lambda: _position_list(request).render())()
+
+    try:
+        data = _request_data(request)
+    except ValueError as exc:
+        return _json({"detail": f"JSON parse error - {exc}"}, status.HTTP_400_BAD_REQUEST)
+    serializer = PositionSerializer(data=data)
+    # PrimaryKeyRelatedField достаёт забег синхронным запросом
+    if not await sync_to_async(serializer.is_valid)():
+        return _json(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    attrs = serializer.validated_data
+    if ingest.enabled():
+        # заполнившая буфер точка сбрасывает его сама — это запросы к БД
+        await sync_to_async(position_buffer.add)(Position(**attrs))
+        return _json(serializer.data, status.HTTP_202_ACCEPTED)
+    items = await acollect_nearby([(attrs["latitude"], attrs["longitude"])], nearby_items_queryset())
+    await sync_to_async(_save_position)(serializer, items)
+    return _json(serializer.data, status.HTTP_201_CREATED)
+
+
+async def run_live(request, run_id):
+    """SSE-лента забега: под ASGI поток не занимает, ждёт на asyncio.Queue."""
+    if request.method != "GET":
+        return _json({"detail": f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+    if not await Run.objects.filter(id=run_id).aexists():
+        return _json(_not_found, status.HTTP_404_NOT_FOUND)
+    watcher = live.AsyncWatcher(asyncio.get_running_loop())
+    try:
+        await sync_to_async(live.hub.subscribe)(run_id, watcher, live.last_event_id(request))
+    except live.TooManyWatchers:
+        response = _json({"detail": "Too many live watchers, retry later."}, status.HTTP_503_SERVICE_UNAVAILABLE)
+        response["Retry-After"] = "5"
+        return response
+    return live_response(live.astream(run_id, watcher))
+
+
+async def run_export(request, run_id, fmt):
+    """То же, что views.RunExportView."""
+    if request.method != "GET":
+        return _json({"detail": f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+    run = await Run.objects.filter(id=run_id).afirst()
+    if run is None:
+        return _json(_not_found, status.HTTP_404_NOT_FOUND)
+    response = StreamingHttpResponse(
+        export.achunks(export.encoded(export.FORMATS[fmt](run))), content_type=export.CONTENT_TYPES[fmt]
+    )
+    response["Content-Disposition"] = f'attachment; filename="run_{run.id}.{fmt}"'
+    return response
+
+
+async def athlete_runs_export(request, user_id):
+    """То же, что views.AthleteRunsExportView."""
+    if request.method != "GET":
+        return _json({"detail": f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+    user = await User.objects.filter(pk=user_id).afirst()
+    if user is None:
+        return _json({"detail": "No User matches the given query."}, status.HTTP_404_NOT_FOUND)
+    fmt = request.GET.get("type", "gpx")
+    if fmt not in export.FORMATS:
+        return _json({"detail": f"type must be one of: {', '.join(export.FORMATS)}"}, status.HTTP_400_BAD_REQUEST)
+    runs = Run.objects.filter(athlete=user).order_by("id").iterator()
+    response = StreamingHttpResponse(export.achunks(export.zip_chunks(runs, fmt)), content_type="application/zip")
+    response["Content-Disposition"] = f'attachment; filename="runs_{user.id}_{fmt}.zip"'
+    return response
@@ -0,0 +1,310 @@
+"""
+Выдача коллекционных предметов по уже записанным точкам.
+
+При POST точки предметы рядом выдаются сразу (views.award_collectibles), так
+что предмет, импортированный позже, не достаётся тем, кто уже пробегал мимо.
+run_pending() догоняет это одним проходом по Position, а не повтором логики
+POST на каждую точку:
+
+- предметы без backfilled_at загружаются в память, отсортированными по широте;
+- точки читаются диапазонами id в пуле потоков, уже отсечёнными в SQL по
+  общему bbox предметов;
+- кандидаты (точка, предмет) берутся бинарным поиском по широте и bbox
+  предмета, расстояние считается haversine векторно через NumPy (без NumPy —
+  тот же алгоритм циклом);
+- в узкой полосе у границы радиуса решает geodesic, как в geo.collect_nearby,
+  поэтому выдача совпадает с выдачей при POST.
+
+Новые пары (атлет, предмет) пишутся одним bulk_create под блокировкой
+атлетов (leaderboards.lock_athletes), их ценность идёт в лидерборды,
+предметам ставится backfilled_at. awarded_at пары — время самой ранней
+подходящей точки (date_time, без него — created_at): находка датируется
+пробежкой, а не проходом backfill, и не раздувает лидерборды текущей недели
+и месяца. Челленджи, как и при POST точки, пересчитываются при следующей
+остановке забега.
+
+Предметы, существовавшие до появления backfilled_at, миграция 0020 помечает
+уже пройденными; догнать по ним историю — backfill_collectibles --all.
+"""
+import datetime
+import math
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from django.db import connection, transaction
+from django.db.models import FloatField, Max, Min
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+from geopy.distance import geodesic
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy опционален
+    np = None
+
+from . import geo, leaderboards
+from .models import CollectibleAward, CollectibleItem, Position
+from .track_metrics import EARTH_RADIUS_KM
+
+
+BACKFILL_CHUNK_SIZE = 50_000
+BACKFILL_WORKERS = 4
+
+_R_M = EARTH_RADIUS_KM * 1000.0
+# haversine расходится с geodesic меньше чем на 0.6%: вне полосы ±1% вокруг
+# радиуса ответ тот же, внутри неё решает geodesic
+_EXACT_MARGIN = 0.01
+# сколько id уходит в один IN (...)
+_IN_BATCH = 500
+# шаг хранения координат в Position (decimal_places=4)
+_COORD_STEP = 1e-4
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_US = datetime.timedelta(microseconds=1)
+
+
+class BackfillResult(NamedTuple):
+    items: int
+    positions: int
+    awards: int
+
+
+class _Items(NamedTuple):
+    ids: list
+    lat: list
+    lon: list
+    dlon: list
+    dlat: float
+    values: dict
+
+
+def _load_items(queryset, radius_m):
+    """Предметы queryset, отсортированные по широте; массивы NumPy, если он есть."""
+    rows = sorted(
+        queryset.order_by().values_list(
+            "id", Cast("latitude", FloatField()), Cast("longitude", FloatField()), "value"
+        ),
+        key=lambda row: row[1],
+    )
+    ids = [row[0] for row in rows]
+    lat = [row[1] for row in rows]
+    lon = [row[2] for row in rows]
+    boxes = [geo.bbox(la, lo, radius_m) for la, lo in zip(lat, lon)]
+    dlat = max((box[1] - box[0] for box in boxes), default=0.0) / 2
+    dlon = [box[3] for box in boxes]
+    values = {row[0]: row[3] for row in rows}
+    if np is not None:
+        ids, lat, lon, dlon = (np.asarray(a) for a in (ids, lat, lon, dlon))
+    return _Items(ids, lat, lon, dlon, dlat, values)
+
+
+def _envelope(items):
+    """Фильтр Position по общему bbox предметов; границы округлены наружу до шага хранения."""
+    lat_min = math.floor((min(items.lat) - items.dlat) / _COORD_STEP) * _COORD_STEP
+    lat_max = math.ceil((max(items.lat) + items.dlat) / _COORD_STEP) * _COORD_STEP
+    envelope = {"latitude__gte": lat_min, "latitude__lte": lat_max}
+    lon_min = min(lo - d for lo, d in zip(items.lon, items.dlon))
+    lon_max = max(lo + d for lo, d in zip(items.lon, items.dlon))
+    # через антимеридиан одним диапазоном не отсечь — там хватит широты
+    if -180.0 <= lon_min and lon_max <= 180.0:
+        envelope["longitude__gte"] = math.floor(lon_min / _COORD_STEP) * _COORD_STEP
+        envelope["longitude__lte"] = math.ceil(lon_max / _COORD_STEP) * _COORD_STEP
+    return envelope
+
+
+def _exact(lat, lon, item_lat, item_lon, radius_m):
+    return geodesic((lat, lon), (item_lat, item_lon)).meters < radius_m
+
+
+def _earliest(hits, more):
+    """Сливает {пара: время} в hits, оставляя для пары самое раннее время."""
+    for pair, moment in more.items():
+        if moment < hits.get(pair, moment + 1):
+            hits[pair] = moment
+    return hits
+
+
+def _match_np(items, athletes, lat, lon, moments, radius_m):
+    athletes, lat, lon = np.asarray(athletes), np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    moments = np.asarray(moments, dtype=np.int64)
+    # для каждой точки — отрезок предметов по широте, затем все пары одним массивом
+    lo = np.searchsorted(items.lat, lat - items.dlat, "left")
+    hi = np.searchsorted(items.lat, lat + items.dlat, "right")
+    counts = hi - lo
+    pos = np.repeat(np.arange(len(lat)), counts)
+    idx = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts - lo, counts)
+
+    # долгота — через антимеридиан, как geo.in_bbox
+    keep = np.abs((lon[pos] - items.lon[idx] + 540.0) % 360.0 - 180.0) <= items.dlon[idx]
+    pos, idx = pos[keep], idx[keep]
+
+    plat, plon = np.radians(lat[pos]), np.radians(lon[pos])
+    ilat, ilon = np.radians(items.lat[idx]), np.radians(items.lon[idx])
+    d = (np.sin((ilat - plat) * 0.5) ** 2
+         + np.cos(plat) * np.cos(ilat) * np.sin((ilon - plon) * 0.5) ** 2)
+    d = 2 * _R_M * np.arcsin(np.sqrt(d))
+
+    sure = d < radius_m * (1 - _EXACT_MARGIN)
+    # самая ранняя точка каждой пары: сортировка по (атлет, предмет, время), первая в группе
+    a, it, m = athletes[pos[sure]], items.ids[idx[sure]], moments[pos[sure]]
+    order = np.lexsort((m, it, a))
+    a, it, m = a[order], it[order], m[order]
+    first = np.ones(len(a), dtype=bool)
+    first[1:] = (a[1:] != a[:-1]) | (it[1:] != it[:-1])
+    hits = dict(zip(zip(a[first].tolist(), it[first].tolist()), m[first].tolist()))
+    edge = ~sure & (d < radius_m * (1 + _EXACT_MARGIN))
+    for p, i in zip(pos[edge].tolist(), idx[edge].tolist()):
+        pair, moment = (int(athletes[p]), int(items.ids[i])), int(moments[p])
+        if moment < hits.get(pair, moment + 1) and _exact(lat[p], lon[p], items.lat[i], items.lon[i], radius_m):
+            hits[pair] = moment
+    return hits
+
+
+def _match_py(items, athletes, lat, lon, moments, radius_m):
+    radians, sin, cos, asin, sqrt = math.radians, math.sin, math.cos, math.asin, math.sqrt
+    sure_m, edge_m = radius_m * (1 - _EXACT_MARGIN), radius_m * (1 + _EXACT_MARGIN)
+    hits = {}
+    for athlete_id, la, lo, moment in zip(athletes, lat, lon, moments):
+        start = bisect_left(items.lat, la - items.dlat)
+        end = bisect_right(items.lat, la + items.dlat)
+        for i in range(start, end):
+            pair = (athlete_id, items.ids[i])
+            item_lat, item_lon = items.lat[i], items.lon[i]
+            if moment >= hits.get(pair, moment + 1) or abs((lo - item_lon + 540.0) % 360.0 - 180.0) > items.dlon[i]:
+                continue
+            p1, p2 = radians(la), radians(item_lat)
+            d = sin((p2 - p1) * 0.5) ** 2 + cos(p1) * cos(p2) * sin(radians(item_lon - lo) * 0.5) ** 2
+            d = 2 * _R_M * asin(sqrt(d))
+            if d < sure_m or (d < edge_m and _exact(la, lo, item_lat, item_lon, radius_m)):
+                hits[pair] = moment
+    return hits
+
+
+def _scan(items, envelope, id_range, radius_m):
+    """
+    (сколько точек прошло bbox, {(athlete_id, item_id): время самой ранней точки
+    в микросекундах от эпохи}) для диапазона id точек.
+    """
+    rows = list(
+        Position.objects
+        .filter(pk__gte=id_range[0], pk__lt=id_range[1], **envelope)
+        .order_by()
+        .values_list(
+            "run__athlete_id", Cast("latitude", FloatField()), Cast("longitude", FloatField()),
+            Coalesce("date_time", "created_at"),
+        )
+    )
+    if not rows:
+        return 0, {}
+    athletes, lat, lon, moments = zip(*rows)
+    moments = [(moment - _EPOCH) // _US for moment in moments]
+    match = _match_np if np is not None else _match_py
+    return len(rows), match(items, athletes, lat, lon, moments, radius_m)
+
+
+def _scan_in_thread(*args):
+    try:
+        return _scan(*args)
+    finally:
+        # у каждого потока пула своё соединение — закрываем, чтобы не копились
+        connection.close()
+
+
+def _id_ranges(chunk_size):
+    bounds = Position.objects.aggregate(lo=Min("id"), hi=Max("id"))
+    if bounds["lo"] is None:
+        return []
+    return [
+        (lo, min(lo + chunk_size, bounds["hi"] + 1))
+        for lo in range(bounds["lo"], bounds["hi"] + 1, chunk_size)
+    ]
+
+
+def _batches(values):
+    values = list(values)
+    for i in range(0, len(values), _IN_BATCH):
+        yield values[i:i + _IN_BATCH]
+
+
+def _store(items, pairs):
+    """
+    Пишет новые пары {(athlete_id, item_id): время находки в микросекундах} и их
+    ценность в лидерборды; возвращает число новых пар.
+    """
+    if not pairs:
+        return 0
+    with transaction.atomic():
+        # параллельный POST точки мог выдать ту же пару: под блокировкой атлетов
+        # он либо уже закоммичен и виден ниже, либо ждёт нашего коммита
+        for batch in _batches(sorted({athlete_id for athlete_id, _ in pairs})):
+            leaderboards.lock_athletes(batch)
+        existing = set()
+        for batch in _batches({item_id for _, item_id in pairs}):
+            existing.update(
+                CollectibleAward.objects
+                .filter(collectibleitem_id__in=batch)
+                .values_list("user_id", "collectibleitem_id")
+            )
+        new = sorted((pair, _EPOCH + pairs[pair] * _US) for pair in pairs.keys() - existing)
+        if not new:
+            return 0
+
+        # в лидерборд — одним инкрементом на атлета и пару вёдер (неделя, месяц) находки
+        totals, moments = defaultdict(int), {}
+        for (athlete_id, item_id), awarded_at in new:
+            key = (athlete_id, *(leaderboards.bucket(period, awarded_at) for period in ("week", "month")))
+            totals[key] += items.values[item_id]
+            moments.setdefault(key, awarded_at)
+        CollectibleAward.objects.bulk_create(
+            (CollectibleAward(collectibleitem_id=item_id, user_id=athlete_id, awarded_at=awarded_at)
+             for (athlete_id, item_id), awarded_at in new),
+            batch_size=5000,
+            # у SQLite нет select_for_update — там гонку отсекает unique_together
+            ignore_conflicts=True,
+        )
+        for key, value in totals.items():
+            leaderboards.record_awards(key[0], value, moments[key])
+    return len(new)
+
+
+def backfill(queryset, workers=BACKFILL_WORKERS, chunk_size=BACKFILL_CHUNK_SIZE, radius_m=geo.COLLECT_RADIUS_M):
+    """
+    Выдаёт предметы из queryset атлетам, у которых есть точка ближе radius_m.
+    workers > 1 — диапазоны точек читаются параллельно, каждый поток со своим
+    соединением (вызывать вне транзакции: потоки не видят её незакоммиченных строк).
+    """
+    items = _load_items(queryset, radius_m)
+    if not len(items.ids):
+        return BackfillResult(0, 0, 0)
+
+    envelope = _envelope(items)
+    tasks = [(items, envelope, id_range, radius_m) for id_range in _id_ranges(chunk_size)]
+    if workers > 1 and len(tasks) > 1:
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(lambda task: _scan_in_thread(*task), tasks))
+    else:
+        results = [_scan(*task) for task in tasks]
+
+    scanned, pairs = 0, {}
+    for count, hits in results:
+        scanned += count
+        _earliest(pairs, hits)
+    return BackfillResult(len(items.ids), scanned, _store(items, pairs))
+
+
+def pending_items():
+    return CollectibleItem.objects.filter(backfilled_at__isnull=True)
+
+
+def run_pending(**kwargs):
+    """backfill() для ещё не выданных по истории предметов с пометкой backfilled_at."""
+    started = timezone.now()
+    ids = list(pending_items().values_list("id", flat=True))
+    if not ids:
+        return BackfillResult(0, 0, 0)
+    # предмет, созданный уже после снимка ids, пройдёт и в следующий раз — повтор безвреден
+    result = backfill(pending_items(), **kwargs)
+    for batch in _batches(ids):
+        CollectibleItem.objects.filter(pk__in=batch).update(backfilled_at=started)
+    return result
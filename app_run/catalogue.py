@@ -0,0 +1,66 @@
+"""
+Кэш каталога коллекционных предметов.
+
+Каталог меняется только при импорте и правке предметов, поэтому ответ
+/api/collectible_item/ рендерится в JSON один раз на версию и лежит в кэше
+CATALOGUE_CACHE. Версия (токен + время изменения) сдвигается после коммита
+(bump_on_commit) сигналами save/delete и импортом после каждой пачки; по ней
+же отдаются ETag и Last-Modified.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+
+CATALOGUE_CACHE = "catalogue"
+
+
+def _cache():
+    return caches[CATALOGUE_CACHE]
+
+
+def _key(suffix):
+    # файловый кэш переживает пересоздание БД (тесты, бенчмарки) — привязываем ключи к ней
+    db = hashlib.md5(str(connection.settings_dict["NAME"]).encode()).hexdigest()[:8]
+    return f"catalogue:{db}:{suffix}"
+
+
+def bump():
+    """Новая версия каталога; старое тело просто перестаёт читаться и истекает само."""
+    state = (uuid.uuid4().hex, timezone.now().replace(microsecond=0))
+    _cache().set(_key("version"), state, None)
+    return state
+
+
+def bump_on_commit():
+    """
+    bump() после коммита: GET между сдвигом версии и коммитом ещё видит
+    старые строки и закэшировал бы старое тело под новым токеном.
+    """
+    transaction.on_commit(bump)
+
+
+def version():
+    """(token, last_modified) текущей версии."""
+    state = _cache().get(_key("version"))
+    if state is None:
+        state = bump()
+    return state
+
+
+def body(token):
+    """Готовый JSON каталога для версии token; ORM трогается только на промахе."""
+    key = _key(f"body:{token}")
+    data = _cache().get(key)
+    if data is None:
+        from .models import CollectibleItem
+        from .serializers import CollectibleItemSerializer
+
+        items = CollectibleItemSerializer(CollectibleItem.objects.order_by("id"), many=True).data
+        data = JSONRenderer().render(items)
+        _cache().set(key, data, 60 * 60 * 24)
+    return data
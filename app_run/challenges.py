@@ -0,0 +1,102 @@
+"""
+Реестр челленджей.
+
+Каждое правило — порог на одну метрику атлета. После остановки забега все
+метрики считаются одним запросом (строка AthleteStats + подзапросы), а все
+заработанные челленджи пишутся одним bulk_create: повторы отсекает
+unique_together (athlete, full_name). Новое правило не добавляет запросов.
+"""
+import datetime
+from typing import NamedTuple
+
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncDate
+
+from . import conditional
+from .models import AthleteStats, Challenge, CollectibleItem, Run
+
+
+TEN_RUNS_CHALLENGE = "Сделай 10 Забегов!"
+FIFTY_KM_CHALLENGE = "Пробеги 50 километров!"
+
+METRICS = ("runs_finished", "total_km", "total_seconds", "collectibles", "longest_run_km", "streak_days")
+
+
+class ChallengeRule(NamedTuple):
+    full_name: str
+    metric: str
+    threshold: float
+
+
+RULES = []
+
+
+def register(full_name, metric, threshold):
+    if metric not in METRICS:
+        raise ValueError(f"Unknown challenge metric: {metric}")
+    rule = ChallengeRule(full_name, metric, threshold)
+    RULES.append(rule)
+    return rule
+
+
+register(TEN_RUNS_CHALLENGE, "runs_finished", 10)
+register(FIFTY_KM_CHALLENGE, "total_km", 50)
+
+
+def athlete_metrics(athlete_id):
+    """Все метрики правил одним запросом; streak_days — отдельно и только если нужен."""
+    finished = Run.objects.filter(athlete_id=OuterRef("athlete_id"), status="finished")
+    items = CollectibleItem.athletes.through.objects.filter(user_id=OuterRef("athlete_id"))
+    row = (
+        AthleteStats.objects
+        .filter(athlete_id=athlete_id)
+        .annotate(
+            collectibles=Coalesce(Subquery(
+                items.values("user_id").annotate(n=Count("id")).values("n"),
+                output_field=IntegerField(),
+            ), 0),
+            longest_run_km=Coalesce(Subquery(
+                finished.values("athlete_id").annotate(m=Max("distance")).values("m"),
+            ), 0.0),
+        )
+        .values("runs_finished", "total_distance", "total_seconds", "collectibles", "longest_run_km")
+        .first()
+    ) or {"runs_finished": 0, "total_distance": 0.0, "total_seconds": 0,
+          "collectibles": 0, "longest_run_km": 0.0}
+    row["total_km"] = row.pop("total_distance")
+
+    streak_rules = [r.threshold for r in RULES if r.metric == "streak_days"]
+    if streak_rules:
+        row["streak_days"] = streak_days(athlete_id, limit=int(max(streak_rules)))
+    return row
+
+
+def streak_days(athlete_id, limit):
+    """Сколько дней подряд (UTC) атлет завершал забеги, считая от последнего; не больше limit."""
+    days = (
+        Run.objects
+        .filter(athlete_id=athlete_id, status="finished")
+        .annotate(day=TruncDate(Coalesce("last_date_time", "created_at")))
+        .values_list("day", flat=True)
+        .distinct()
+        .order_by("-day")[:limit]
+    )
+    streak, prev = 0, None
+    for day in days:
+        if prev is not None and prev - day != datetime.timedelta(days=1):
+            break
+        streak, prev = streak + 1, day
+    return streak
+
+
+def award_challenges(athlete_id):
+    """Выдаёт все заработанные челленджи; возвращает названия выполненных правил."""
+    metrics = athlete_metrics(athlete_id)
+    earned = [rule.full_name for rule in RULES if metrics[rule.metric] >= rule.threshold]
+    if earned:
+        Challenge.objects.bulk_create(
+            [Challenge(athlete_id=athlete_id, full_name=name) for name in earned],
+            ignore_conflicts=True,
+        )
+        conditional.bump_on_commit(conditional.CHALLENGES)
+    return earned
@@ -0,0 +1,103 @@
+"""
+Условные GET (ETag / If-None-Match) для вьюсетов.
+
+ETag строится из «версии» ресурса (get_etag_parts) и полного пути запроса —
+фильтры и страницы дают разные тела. Совпал If-None-Match — отвечаем 304 до
+выборки и сериализации.
+
+Версия карточки — её строка, один запрос по первичному ключу. Версия списка —
+токен version(name) без запросов к БД: агрегат по всей таблице на каждый
+запрос стоил бы скана. Токен сдвигает bump_on_commit(name) из сигналов
+save/delete и из кода, который пишет в обход них (update(), bulk_create).
+Токены лежат в общем для процессов кэше VERSIONS_CACHE.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import caches
+from django.db import connection, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+
+VERSIONS_CACHE = "versions"
+# список забегов: Run и имена атлетов
+RUNS = "runs"
+# список пользователей: User и его AthleteStats
+USERS = "users"
+CHALLENGES = "challenges"
+
+
+def _version_key(name):
+    # кэш переживает пересоздание БД — привязываем ключи к ней, как catalogue._key
+    db = hashlib.md5(str(connection.settings_dict["NAME"]).encode()).hexdigest()[:8]
+    return f"version:{db}:{name}"
+
+
+def version(name):
+    cache, key = caches[VERSIONS_CACHE], _version_key(name)
+    token = cache.get(key)
+    if token is None:
+        # add, а не set: не затираем токен, выставленный bump_version другого процесса
+        cache.add(key, uuid.uuid4().hex, None)
+        token = cache.get(key)
+    return token
+
+
+def bump_version(name):
+    caches[VERSIONS_CACHE].set(_version_key(name), uuid.uuid4().hex, None)
+
+
+def bump_on_commit(*names):
+    """
+    bump_version после коммита: сдвинутый раньше токен успел бы прочитать
+    GET, видящий ещё старые строки, и закрепить старое тело под новым ETag.
+    """
+    def bump():
+        for name in names:
+            bump_version(name)
+
+    transaction.on_commit(bump)
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def etag_matches(request, etag):
+    header = request.headers.get("If-None-Match")
+    if header is None:
+        return False
+    return header.strip() == "*" or etag in (t.strip() for t in header.split(","))
+
+
+class ConditionalGetMixin:
+    def get_etag_parts(self):
+        """Кортеж, меняющийся вместе с ответом; None — без ETag (например, объекта нет)."""
+        raise NotImplementedError
+
+    def get_etag_object_filter(self):
+        """{lookup: value} для retrieve или None, если значение заведомо не подходит."""
+        value = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        try:
+            return {self.lookup_field: int(value)}
+        except (TypeError, ValueError):
+            return None
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(super().retrieve, request, *args, **kwargs)
+
+    def _conditional(self, handler, request, *args, **kwargs):
+        parts = self.get_etag_parts()
+        if parts is None:
+            return handler(request, *args, **kwargs)
+        etag = make_etag(request.get_full_path(), request.accepted_renderer.format, *parts)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response["ETag"] = etag
+        return response
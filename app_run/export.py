@@ -0,0 +1,134 @@
+"""
+Потоковая выгрузка треков в GPX / GeoJSON и zip-архив всех забегов атлета.
+
+Точки читаются .iterator(chunk_size=EXPORT_CHUNK_SIZE) и отдаются кусками,
+поэтому память не зависит от длины трека, а первый байт уходит сразу.
+
+Под ASGI синхронный генератор StreamingHttpResponse Django вычитывает целиком
+до отправки, поэтому async_views отдаёт те же куски через achunks().
+"""
+import json
+import zipfile
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+
+from .track_metrics import ordered_track
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    "gpx": "application/gpx+xml",
+    "geojson": "application/geo+json",
+}
+
+
+def _iso(dt):
+    value = dt.isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+
+def _batches(run_id, fields):
+    rows = ordered_track(run_id).values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    while True:
+        batch = list(islice(rows, EXPORT_CHUNK_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def gpx_chunks(run):
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="project_run" xmlns="http://www.topografix.com/GPX/1/1">\n'
+        f"<trk><name>{escape(f'Run {run.id}')}</name><trkseg>\n"
+    )
+    for batch in _batches(run.id, ("latitude", "longitude", "date_time")):
+        yield "".join(
+            f'<trkpt lat="{lat}" lon="{lon}">'
+            + (f"<time>{_iso(dt)}</time>" if dt is not None else "")
+            + "</trkpt>\n"
+            for lat, lon, dt in batch
+        )
+    yield "</trkseg></trk>\n</gpx>\n"
+
+
+def geojson_chunks(run):
+    """Feature с LineString; время точек — в properties.coordTimes (второй проход по треку)."""
+    properties = {
+        "run": run.id,
+        "athlete": run.athlete_id,
+        "status": run.status,
+        "distance": run.distance,
+        "run_time_seconds": run.run_time_seconds,
+    }
+    yield '{"type":"Feature","geometry":{"type":"LineString","coordinates":['
+    sep = ""
+    for batch in _batches(run.id, ("latitude", "longitude")):
+        yield sep + ",".join(f"[{lon},{lat}]" for lat, lon in batch)
+        sep = ","
+    yield ']},"properties":' + json.dumps(properties, separators=(",", ":"))[:-1] + ',"coordTimes":['
+    sep = ""
+    for batch in _batches(run.id, ("date_time",)):
+        yield sep + ",".join(f'"{_iso(dt)}"' if dt is not None else "null" for (dt,) in batch)
+        sep = ","
+    yield "]}}\n"
+
+
+FORMATS = {
+    "gpx": gpx_chunks,
+    "geojson": geojson_chunks,
+}
+
+
+def encoded(chunks):
+    for chunk in chunks:
+        yield chunk.encode()
+
+
+_DONE = object()
+
+
+async def achunks(chunks):
+    """Асинхронный итератор по синхронному генератору: каждый кусок — в потоке для sync-кода."""
+    # thread_sensitive: курсор .iterator() живёт в соединении одного потока
+    step = sync_to_async(lambda: next(chunks, _DONE))
+    try:
+        while (chunk := await step()) is not _DONE:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
+
+
+class _Sink:
+    """Неперематываемый файл для zipfile: копит байты, которые генератор тут же отдаёт."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def zip_chunks(runs, fmt):
+    """Zip со всеми runs в формате fmt; пишется потоково, без перемотки (data descriptors)."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for run in runs:
+            with zf.open(f"run_{run.id}.{fmt}", mode="w", force_zip64=True) as entry:
+                for chunk in FORMATS[fmt](run):
+                    entry.write(chunk.encode())
+                    data = sink.drain()
+                    if data:
+                        yield data
+    yield sink.drain()
@@ -0,0 +1,185 @@
+"""
+Быстрый путь list-экшенов: строки из .values() вместо сериализатора на объект.
+
+По полям сериализатора один раз на ответ собирается план: какие колонки
+взять из .values() и чем отформатировать каждую. Простые поля отдаются как
+есть, DateTimeField/DecimalField/ChoiceField — заранее собранными
+форматтерами (часовой пояс, точность и формат берутся из самого поля),
+вложенный сериализатор — из колонок через join. Рендер — FastJSONRenderer:
+orjson, если он установлен, иначе обычный JSONRenderer.
+
+Ответ побайтно совпадает с ответом через сериализатор (это проверяет
+bench_fast_list). Если у сериализатора есть поле, которое план не умеет
+(SerializerMethodField, source через точку, many=True и т.п.), или значение
+нельзя отдать один в один (float в экспоненциальной записи), list идёт
+обычным путём.
+
+Включается FastListMixin на вьюсете и настройкой FAST_LIST_JSON.
+"""
+import decimal
+
+from django.conf import settings
+from rest_framework import ISO_8601, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - без orjson рендерит stdlib json
+    orjson = None
+
+
+class Unsupported(Exception):
+    """Поле или значение, которое быстрый путь не отдаст так же, как сериализатор."""
+
+
+# форматы, которые orjson пишет иначе, чем json из stdlib, — пусть падают в JSONRenderer
+_ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS
+    if orjson is not None else 0
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson для данных из простых типов; всё прочее — как в DRF."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, option=_ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # как JSONRenderer: U+2028/U+2029 экранируем для встраивания в <script>
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+def _plain_float(value):
+    # repr и orjson расходятся только в экспоненциальной записи (1e-05 / 1e-5); nan/inf туда же
+    value = float(value)
+    if value == 0 or 1e-4 <= abs(value) < 1e16:
+        return value
+    raise Unsupported(value)
+
+
+def _datetime_formatter(field):
+    output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+    tz = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+    if output_format is None or tz is None:
+        raise Unsupported(field)
+    if output_format.lower() == ISO_8601:
+        def iso(value):
+            value = value.astimezone(tz).isoformat()
+            return value[:-6] + "Z" if value.endswith("+00:00") else value
+        return iso
+    return lambda value: value.astimezone(tz).strftime(output_format)
+
+
+def _decimal_formatter(field):
+    coerce = getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce or field.localize or field.normalize_output:
+        raise Unsupported(field)
+    if field.decimal_places is None:
+        return "{:f}".format
+    exp = decimal.Decimal(".1") ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def fmt(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return "{:f}".format(value.quantize(exp, rounding=rounding, context=context))
+    return fmt
+
+
+def _formatter(field):
+    """Форматтер значения колонки; None — отдать как есть."""
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime_formatter(field)
+    if isinstance(field, serializers.DecimalField):
+        return _decimal_formatter(field)
+    if isinstance(field, serializers.ChoiceField):
+        return field.to_representation
+    if isinstance(field, serializers.FloatField):
+        return _plain_float
+    if isinstance(field, (serializers.CharField, serializers.IntegerField, serializers.BooleanField)):
+        # ORM уже отдаёт str/int/bool — to_representation вернул бы то же
+        return None
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        return None
+    raise Unsupported(field)
+
+
+def compile_rows(serializer, prefix=""):
+    """
+    (колонки для .values(), строка .values() -> dict ответа) по полям serializer.
+    Unsupported — если ответ так не собрать.
+    """
+    columns, plan = [], []
+    for field in serializer._readable_fields:
+        source = field.source
+        if source == "*" or "." in source:
+            raise Unsupported(field)
+        key = prefix + source
+        if isinstance(field, serializers.ModelSerializer):
+            # по ключу самой связи (athlete -> athlete_id) видно, есть ли вложенный объект
+            nested_columns, nested_build = compile_rows(field, f"{key}__")
+            columns += [key, *nested_columns]
+            plan.append((field.field_name, key, nested_build, True))
+        elif isinstance(field, serializers.BaseSerializer):
+            raise Unsupported(field)
+        else:
+            columns.append(key)
+            plan.append((field.field_name, key, _formatter(field), False))
+    if not plan:
+        raise Unsupported(serializer)
+
+    def build(row):
+        out = {}
+        for name, key, fmt, nested in plan:
+            value = row[key]
+            if value is None:
+                out[name] = None
+            elif nested:
+                out[name] = fmt(row)
+            else:
+                out[name] = value if fmt is None else fmt(value)
+        return out
+
+    return columns, build
+
+
+def enabled():
+    return getattr(settings, "FAST_LIST_JSON", False)
+
+
+class FastListMixin:
+    """
+    list() через compile_rows и FastJSONRenderer. Ставится перед базовым
+    вьюсетом: фильтры, пагинация (в т.ч. keyset) и ETag работают как обычно.
+    """
+    fast_list_renderer = FastJSONRenderer()
+
+    def list(self, request, *args, **kwargs):
+        if not enabled() or not isinstance(request.accepted_renderer, JSONRenderer):
+            return super().list(request, *args, **kwargs)
+        try:
+            columns, build = compile_rows(self.get_serializer())
+            queryset = self.filter_queryset(self.get_queryset())
+            keys = [f.lstrip("-") for f in getattr(self.pagination_class, "keyset_fields", ())]
+            queryset = queryset.values(*dict.fromkeys([*columns, *keys]))
+            page = self.paginate_queryset(queryset)
+            data = [build(row) for row in (queryset if page is None else page)]
+        except Unsupported:
+            return super().list(request, *args, **kwargs)
+
+        request.accepted_renderer = self.fast_list_renderer
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
@@ -0,0 +1,142 @@
+"""
+Пространственный индекс для коллекционных предметов.
+
+Земля режется на ячейки GRID_CELL_DEG x GRID_CELL_DEG градусов, номер ячейки
+хранится в CollectibleItem.grid_cell. Номер строится как row * _LON_CELLS + col,
+поэтому все ячейки одной широтной полосы образуют непрерывный диапазон целых
+чисел и окрестность точки выбирается парой BETWEEN по индексу.
+"""
+import asyncio
+import math
+
+from django.db.models import Q
+from geopy.distance import geodesic
+
+
+COLLECT_RADIUS_M = 100
+GRID_CELL_DEG = 0.01
+
+_LAT_CELLS = int(round(180 / GRID_CELL_DEG))
+_LON_CELLS = int(round(360 / GRID_CELL_DEG))
+# минимальная длина градуса широты (на экваторе ~110.57 км) с запасом,
+# чтобы bbox гарантированно накрывал круг радиуса radius_m
+_MIN_M_PER_DEG = 110_000.0
+# сколько диапазонов ячеек уходит в один SQL-запрос
+_MAX_RANGES_PER_QUERY = 100
+
+
+def _row(lat):
+    return min(max(int(math.floor((lat + 90.0) / GRID_CELL_DEG)), 0), _LAT_CELLS)
+
+
+def _col(lon):
+    return min(max(int(math.floor((lon + 180.0) / GRID_CELL_DEG)), 0), _LON_CELLS - 1)
+
+
+def grid_cell(lat, lon):
+    """Номер ячейки сетки для точки (lat, lon)."""
+    lat, lon = float(lat), float(lon)
+    lon = (lon + 180.0) % 360.0 - 180.0
+    return _row(lat) * _LON_CELLS + _col(lon)
+
+
+def bbox(lat, lon, radius_m):
+    """
+    Прямоугольник, гарантированно содержащий круг radius_m вокруг точки:
+    (lat_min, lat_max, lon, dlon). Долгота задаётся центром и полушириной,
+    чтобы корректно работать через антимеридиан; dlon == 180 — вся полоса.
+    """
+    dlat = radius_m / _MIN_M_PER_DEG
+    lat_min, lat_max = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(lat_min), abs(lat_max))))
+    if cos_lat * 180.0 <= dlat:
+        return lat_min, lat_max, lon, 180.0
+    return lat_min, lat_max, lon, dlat / cos_lat
+
+
+def in_bbox(box, lat, lon):
+    lat_min, lat_max, lon_c, dlon = box
+    if not (lat_min <= lat <= lat_max):
+        return False
+    return abs((lon - lon_c + 540.0) % 360.0 - 180.0) <= dlon
+
+
+def _col_spans(lon_min, lon_max):
+    if lon_max - lon_min >= 360.0:
+        return [(0, _LON_CELLS - 1)]
+    if lon_min < -180.0:
+        return _col_spans(lon_min + 360.0, 180.0) + _col_spans(-180.0, lon_max)
+    if lon_max > 180.0:
+        return _col_spans(lon_min, 180.0) + _col_spans(-180.0, lon_max - 360.0)
+    return [(_col(lon_min), _col(lon_max))]
+
+
+def cell_ranges(box):
+    """Диапазоны номеров ячеек [lo, hi], покрывающие bbox."""
+    lat_min, lat_max, lon_c, dlon = box
+    spans = _col_spans(lon_c - dlon, lon_c + dlon)
+    return [
+        (row * _LON_CELLS + lo, row * _LON_CELLS + hi)
+        for row in range(_row(lat_min), _row(lat_max) + 1)
+        for lo, hi in spans
+    ]
+
+
+def merge_ranges(ranges):
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            if hi > merged[-1][1]:
+                merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def _nearby_queries(points, queryset, radius_m):
+    """(points, boxes, querysets): кандидаты из соседних ячеек, порциями диапазонов."""
+    points = [(float(lat), float(lon)) for lat, lon in points]
+    boxes = [bbox(lat, lon, radius_m) for lat, lon in points]
+    ranges = merge_ranges(r for box in boxes for r in cell_ranges(box))
+
+    querysets = []
+    for i in range(0, len(ranges), _MAX_RANGES_PER_QUERY):
+        q = Q()
+        for lo, hi in ranges[i:i + _MAX_RANGES_PER_QUERY]:
+            q |= Q(grid_cell__range=(lo, hi))
+        querysets.append(queryset.filter(q))
+    return points, boxes, querysets
+
+
+def _within(points, boxes, candidates, radius_m):
+    """Кандидаты, прошедшие bbox и точную проверку geodesic, без повторов."""
+    found = {}
+    for item in candidates:
+        if item.pk in found:
+            continue
+        item_pt = (float(item.latitude), float(item.longitude))
+        for pt, box in zip(points, boxes):
+            if in_bbox(box, *item_pt) and geodesic(pt, item_pt).meters < radius_m:
+                found[item.pk] = item
+                break
+    return list(found.values())
+
+
+def collect_nearby(points, queryset, radius_m=COLLECT_RADIUS_M):
+    """
+    Предметы из queryset, лежащие ближе radius_m хотя бы к одной из points.
+
+    Из БД берутся только предметы из соседних ячеек, затем отсекаются по bbox,
+    и лишь оставшиеся кандидаты проверяются точным geodesic.
+    """
+    points, boxes, querysets = _nearby_queries(points, queryset, radius_m)
+    candidates = (item for qs in querysets for item in qs)
+    return _within(points, boxes, candidates, radius_m)
+
+
+async def acollect_nearby(points, queryset, radius_m=COLLECT_RADIUS_M):
+    """collect_nearby для async-вьюх: кандидаты — async ORM, geodesic — в пуле потоков."""
+    points, boxes, querysets = _nearby_queries(points, queryset, radius_m)
+    candidates = [item for qs in querysets async for item in qs]
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _within, points, boxes, candidates, radius_m)
@@ -0,0 +1,270 @@
+"""
+Потоковый импорт коллекционных предметов из xlsx.
+
+Строки читаются openpyxl в read_only режиме и обрабатываются пачками по
+chunk_size: существующие UID выбираются одним запросом uid__in на пачку,
+строки проверяются validate_collectible_row, валидные вставляются одним
+bulk_create в короткой транзакции. В памяти держится только текущая пачка.
+
+Большие файлы можно импортировать в фоне: enqueue() кладёт файл в ImportJob,
+команда run_import_worker забирает задачи и обновляет счётчики по пачкам.
+Захват задачи выдаёт ей новый lease; пока воркер работает, фоновый поток раз
+в heartbeat секунд обновляет heartbeat_at, так что медленная пачка не
+выглядит зависшей. Все записи воркера в задачу идут с условием на свой lease:
+если задачу всё же вернули в очередь (воркер завис дольше stale_after), он
+узнаёт об этом на следующей записи и прекращает работу, не трогая задачу.
+
+Прогресс задачи (rows_read, счётчики, невалидные строки) пишется в той же
+транзакции, что и пачка, поэтому закоммиченные пачки и прогресс не расходятся:
+следующий воркер продолжает с rows_read, а не перечитывает уже вставленные
+строки как «существующие UID».
+"""
+import contextlib
+import io
+import logging
+import threading
+import uuid
+from itertools import islice
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from openpyxl.reader.excel import load_workbook
+
+from . import catalogue
+from .models import CollectibleItem, ImportJob
+from .serializers import validate_collectible_row
+
+
+IMPORT_CHUNK_SIZE = 1000
+HEARTBEAT_SECONDS = 30
+
+logger = logging.getLogger("app_run.importing")
+
+COLUMNS = {
+    "Name": "name",
+    "UID": "uid",
+    "Value": "value",
+    "Latitude": "latitude",
+    "Longitude": "longitude",
+    "URL": "picture",
+}
+
+
+class WorkbookError(Exception):
+    pass
+
+
+def open_rows(file):
+    """Итератор строк активного листа (values_only)."""
+    try:
+        wb = load_workbook(filename=file, read_only=True, data_only=True)
+    except Exception as e:
+        raise WorkbookError(f"Failed to read workbook: {e}")
+    return wb.active.iter_rows(values_only=True)
+
+
+def _is_empty(row):
+    return row is None or all(cell is None for cell in row)
+
+
+def import_collectibles(file, chunk_size=IMPORT_CHUNK_SIZE, on_chunk=None, skip=0):
+    """
+    Импортирует предметы и возвращает невалидные строки в формате UploadFileView.
+
+    skip — сколько строк данных уже закоммитил прошлый запуск: они не
+    импортируются, их UID только запоминаются для проверки дублей в файле.
+    on_chunk(read, processed, inserted, invalid_rows) вызывается внутри
+    транзакции пачки: read — строк данных прочитано с начала файла (вместе
+    с пустыми и пропущенными), processed и inserted — нарастающие счётчики
+    этого запуска, invalid_rows — невалидные строки пачки. Исключение из
+    on_chunk откатывает пачку.
+    """
+    rows_iter = open_rows(file)
+    try:
+        header = next(rows_iter)
+    except StopIteration:
+        return []
+
+    header_map = {str(h).strip(): idx for idx, h in enumerate(header)}
+    if any(column not in header_map for column in COLUMNS):
+        rows = list(rows_iter)
+        invalid_rows = [list(r) for r in rows[skip:] if not _is_empty(r)]
+        if on_chunk:
+            on_chunk(len(rows), len(invalid_rows), 0, invalid_rows)
+        return invalid_rows
+
+    seen_uids = set()
+    read = 0
+    for row in islice(rows_iter, skip):
+        read += 1
+        uid_val = "" if _is_empty(row) else str(row[header_map["UID"]] or "").strip()
+        if uid_val:
+            seen_uids.add(uid_val)
+
+    invalid_rows = []
+    processed = inserted = 0
+    while True:
+        raw = list(islice(rows_iter, chunk_size))
+        if not raw:
+            break
+        read += len(raw)
+        chunk = [r for r in raw if not _is_empty(r)]
+        # с on_chunk пачка и прогресс задачи коммитятся вместе
+        with transaction.atomic() if on_chunk else contextlib.nullcontext():
+            chunk_invalid, created = _import_chunk(chunk, header_map, seen_uids)
+            processed += len(chunk)
+            inserted += created
+            if on_chunk:
+                on_chunk(read, processed, inserted, chunk_invalid)
+            if created:
+                # bulk_create не шлёт post_save — версию сдвигаем сами, за каждую пачку:
+                # сбой на следующей не должен прятать уже вставленные предметы за кэшем
+                catalogue.bump_on_commit()
+        invalid_rows.extend(chunk_invalid)
+    return invalid_rows
+
+
+def _import_chunk(chunk, header_map, seen_uids):
+    records = [
+        {field: row[header_map[column]] for column, field in COLUMNS.items()}
+        for row in chunk
+    ]
+    chunk_uids = {str(r["uid"] or "").strip() for r in records} - {""}
+    existing = set(
+        CollectibleItem.objects.filter(uid__in=chunk_uids).values_list("uid", flat=True)
+    )
+
+    invalid_rows, valid = [], []
+    for row, data in zip(chunk, records):
+        uid_val = str(data.get("uid") or "").strip()
+        if uid_val in seen_uids:
+            invalid_rows.append(list(row))
+            continue
+        if uid_val:
+            seen_uids.add(uid_val)
+
+        attrs = validate_collectible_row(data)
+        if attrs is None or attrs["uid"] in existing:
+            invalid_rows.append(list(row))
+            continue
+        item = CollectibleItem(**attrs)
+        item.fill_grid_cell()
+        valid.append(item)
+
+    try:
+        with transaction.atomic():
+            CollectibleItem.objects.bulk_create(valid)
+        return invalid_rows, len(valid)
+    except IntegrityError:
+        pass
+
+    # пачку перехватил параллельный импорт — досохраняем по одной, как раньше
+    created = 0
+    for inst in valid:
+        try:
+            with transaction.atomic():
+                inst.save()
+            created += 1
+        except Exception:
+            invalid_rows.append([
+                inst.name, inst.uid, inst.value, inst.latitude, inst.longitude, inst.picture
+            ])
+    return invalid_rows, created
+
+
+def enqueue(file):
+    return ImportJob.objects.create(file_name=getattr(file, "name", "") or "", payload=file.read())
+
+
+def claim_next_job():
+    """Забирает самую старую queued-задачу условным UPDATE — без блокировок, на любой БД."""
+    for job_id in ImportJob.objects.filter(status="queued").order_by("id").values_list("id", flat=True)[:10]:
+        now = timezone.now()
+        claimed = ImportJob.objects.filter(pk=job_id, status="queued").update(
+            status="running", started_at=now, heartbeat_at=now, lease=uuid.uuid4().hex
+        )
+        if claimed:
+            return ImportJob.objects.get(pk=job_id)
+    return None
+
+
+def requeue_stale(older_than):
+    """
+    Возвращает в очередь running-задачи, чей воркер не подавал heartbeat дольше
+    older_than. Прогресс не сбрасывается: он закоммичен вместе с пачками, и
+    следующий воркер продолжит с rows_read.
+    """
+    return ImportJob.objects.filter(
+        status="running", heartbeat_at__lt=timezone.now() - older_than
+    ).update(status="queued", lease="")
+
+
+class LeaseLost(Exception):
+    """Задачу вернули в очередь, пока этот воркер её выполнял."""
+
+
+def _touch(job, **fields):
+    """Запись в задачу от имени её lease; LeaseLost, если lease уже не наш."""
+    updated = ImportJob.objects.filter(pk=job.pk, status="running", lease=job.lease).update(
+        heartbeat_at=timezone.now(), **fields
+    )
+    if not updated:
+        raise LeaseLost(job.pk)
+
+
+class _Heartbeat(threading.Thread):
+    def __init__(self, job, every):
+        super().__init__(name=f"import-heartbeat-{job.pk}", daemon=True)
+        self.job, self.every = job, every
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            while not self.done.wait(self.every):
+                try:
+                    _touch(self.job)
+                except LeaseLost:
+                    return
+                except Exception:
+                    # сбой БД — попробуем на следующем такте, до stale_after время есть
+                    logger.exception("import job %s: heartbeat failed", self.job.pk)
+        finally:
+            connection.close()
+
+
+def run_job(job, chunk_size=IMPORT_CHUNK_SIZE, heartbeat=HEARTBEAT_SECONDS):
+    """
+    Выполняет захваченную задачу с rows_read — с начала файла или с места,
+    где остановился прошлый воркер. Если lease потерян — возвращает задачу
+    как есть из БД: её уже выполняет или выполнит другой воркер.
+    """
+    done_processed, done_inserted = job.rows_processed, job.rows_inserted
+    job.invalid_rows = list(job.invalid_rows or [])
+
+    def on_chunk(read, processed, inserted, chunk_invalid):
+        fields = {}
+        if chunk_invalid:
+            job.invalid_rows.extend(chunk_invalid)
+            fields["invalid_rows"] = job.invalid_rows
+        _touch(job, rows_read=read, rows_processed=done_processed + processed,
+               rows_inserted=done_inserted + inserted, invalid_count=len(job.invalid_rows), **fields)
+
+    beat = _Heartbeat(job, heartbeat)
+    beat.start()
+    try:
+        try:
+            import_collectibles(io.BytesIO(bytes(job.payload)), chunk_size, on_chunk, skip=job.rows_read)
+        except LeaseLost:
+            raise
+        except Exception as e:
+            _touch(job, status="failed", error=str(e), finished_at=timezone.now())
+        else:
+            _touch(job, status="done", invalid_rows=job.invalid_rows, invalid_count=len(job.invalid_rows),
+                   payload=None, finished_at=timezone.now())
+    except LeaseLost:
+        pass
+    finally:
+        beat.done.set()
+        beat.join()
+    job.refresh_from_db()
+    return job
@@ -0,0 +1,151 @@
+"""
+Буфер приёма одиночных точек (POSITION_BUFFER).
+
+Вместо INSERT и транзакции на каждую точку POST /api/positions/ проверяет
+точку, кладёт её в буфер процесса и сразу отвечает 202. Буфер пишет одним
+вызовом write(batch) фоновый поток: как только набралось
+POSITION_BUFFER_MAX_POINTS точек или прошло POSITION_BUFFER_MAX_DELAY_MS
+после первой точки пачки. Если поток не успевает и точек вдвое больше,
+буфер сбрасывает сам принимающий запрос.
+
+Сбросы идут строго по одному: flush_all() из transitions.finish дожидается
+сброса, начатого другим потоком, поэтому остановка забега видит все точки,
+принятые этим процессом до неё. При выходе процесса буферы сбрасываются
+через atexit.
+
+Если запись пачки упала, пачка возвращается в начало буфера и пишется
+снова через MAX_DELAY_MS: точки уже получили 202, терять их нельзя. Сбой
+сброса из finish доходит до остановки — она отвечает ошибкой, а не
+завершает забег без точек.
+
+Буфер живёт в памяти процесса, поэтому режим рассчитан на один процесс
+приёма (один воркер gunicorn/uvicorn, потоки — сколько угодно). При
+нескольких воркерах stop в одном не сбросит точки, ждущие в другом, и
+запись их отбросит как опоздавшие к остановленному забегу.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+logger = logging.getLogger("app_run.ingest")
+
+_buffers = []
+
+
+def enabled():
+    return getattr(settings, "POSITION_BUFFER", False)
+
+
+def _max_points():
+    return getattr(settings, "POSITION_BUFFER_MAX_POINTS", 500)
+
+
+def _max_delay():
+    return getattr(settings, "POSITION_BUFFER_MAX_DELAY_MS", 200) / 1000.0
+
+
+class PositionBuffer:
+    """
+    Точки, ожидающие записи. write(batch) пишет пачку несохранённых Position
+    и возвращает, сколько из них записано (остальные отброшены).
+    """
+
+    def __init__(self, write):
+        self._write = write
+        self._cond = threading.Condition()
+        self._pending = []
+        self._oldest = None
+        # после сбоя записи таймер ждёт MAX_DELAY_MS и при полном буфере
+        self._retrying = False
+        self._flushing = threading.Lock()
+        self._timer = None
+        _buffers.append(self)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    def add(self, position):
+        with self._cond:
+            self._pending.append(position)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                self._cond.notify()
+            size = len(self._pending)
+            if size >= _max_points():
+                self._cond.notify()
+            if self._timer is None:
+                self._timer = threading.Thread(target=self._run_timer, name="position-buffer", daemon=True)
+                self._timer.start()
+            # фоновый поток не успевает — пишет сам запрос, буфер не растёт без предела;
+            # после сбоя записи повторяет только таймер, а не каждый запрос
+            inline = size >= 2 * _max_points() and not self._retrying
+        if inline:
+            try:
+                self.flush()
+            except Exception:
+                # точка уже в буфере, пачка вернулась в его начало — запрос отвечает 202
+                logger.exception("position buffer: inline flush failed")
+
+    def flush(self):
+        """
+        Пишет всё накопленное; возвращает число записанных точек. Если запись
+        упала, пачка возвращается в буфер, а исключение пробрасывается.
+        """
+        with self._flushing:
+            with self._cond:
+                batch, self._pending, self._oldest = self._pending, [], None
+            if not batch:
+                return 0
+            try:
+                stored = self._write(batch)
+            except BaseException:
+                self._requeue(batch)
+                raise
+            self._retrying = False
+            if stored < len(batch):
+                logger.warning("position buffer: dropped %d points of stopped runs", len(batch) - stored)
+            return stored
+
+    def _requeue(self, batch):
+        with self._cond:
+            self._pending = batch + self._pending
+            self._oldest = time.monotonic()
+            self._retrying = True
+            self._cond.notify()
+
+    def _run_timer(self):
+        while True:
+            with self._cond:
+                while self._oldest is None:
+                    self._cond.wait()
+                delay = self._oldest + _max_delay() - time.monotonic()
+                if delay > 0 and (len(self._pending) < _max_points() or self._retrying):
+                    self._cond.wait(delay)
+                    continue
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("position buffer: flush failed")
+            finally:
+                close_old_connections()
+
+
+def flush_all():
+    for buffer in _buffers:
+        buffer.flush()
+
+
+def _flush_at_exit():
+    try:
+        flush_all()
+    except Exception:
+        logger.exception("position buffer: flush at exit failed")
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,177 @@
+"""
+Лидерборды: дистанция, число забегов и ценность собранных предметов
+за неделю, месяц и всё время.
+
+Каждая строка LeaderboardEntry — значение метрики атлета в одном «ведре»
+(начало недели / месяца, для общего зачёта — date.min). Строки копятся
+инкрементально: при остановке забега (record_finished_run) и при выдаче
+предметов (record_awards). Чтение — top-N и ранг атлета по индексу
+(metric, period, bucket, -value). Любые правки задним числом
+(удаление/PUT забега) пересчитывают строки атлета целиком — refresh_athlete;
+полная перестройка — команда rebuild_leaderboards.
+
+Предметы выдаются под блокировкой строки атлета (lock_athletes): иначе две
+параллельные выдачи одного предмета обе сочли бы его новым и дважды
+прибавили его ценность.
+"""
+import datetime
+
+from django.contrib.auth.models import User
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import CollectibleAward, LeaderboardEntry, Run
+from .stats import FINISHED
+
+METRICS = [m for m, _ in LeaderboardEntry.METRIC_CHOICES]
+PERIODS = [p for p, _ in LeaderboardEntry.PERIOD_CHOICES]
+ALL_TIME = datetime.date.min
+
+# метрики, которые отдаются целыми числами
+INTEGER_METRICS = {"runs", "collectibles"}
+
+
+def bucket(period, moment):
+    """Начало периода, в который попадает moment (в текущей таймзоне)."""
+    if period == "all":
+        return ALL_TIME
+    day = timezone.localtime(moment).date()
+    if period == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _add(athlete_id, moment, increments):
+    """increments: {metric: delta} в вёдра всех периодов, куда попадает moment."""
+    increments = {m: d for m, d in increments.items() if d}
+    if not increments:
+        return
+    keys = [(p, bucket(p, moment)) for p in PERIODS]
+    LeaderboardEntry.objects.bulk_create(
+        [
+            LeaderboardEntry(metric=m, period=p, bucket=b, athlete_id=athlete_id)
+            for m in increments
+            for p, b in keys
+        ],
+        ignore_conflicts=True,
+    )
+    in_buckets = Q()
+    for p, b in keys:
+        in_buckets |= Q(period=p, bucket=b)
+    for metric, delta in increments.items():
+        LeaderboardEntry.objects.filter(in_buckets, athlete_id=athlete_id, metric=metric).update(
+            value=F("value") + delta
+        )
+
+
+def finished_at(run):
+    return run.last_date_time or run.created_at
+
+
+def record_finished_run(run):
+    """Учитывает только что завершённый run. Вызывать внутри transaction.atomic()."""
+    _add(run.athlete_id, finished_at(run), {"distance": run.distance or 0.0, "runs": 1})
+
+
+def lock_athletes(athlete_ids):
+    """
+    select_for_update строк атлетов по возрастанию id — порядок один у всех,
+    кто выдаёт предметы, поэтому взаимных блокировок нет. Вызывать внутри
+    transaction.atomic() до проверки, какие предметы у атлетов уже есть.
+    """
+    list(User.objects.select_for_update().filter(pk__in=athlete_ids).order_by("pk").values_list("pk", flat=True))
+
+
+def record_awards(athlete_id, value, awarded_at=None):
+    """Суммарная ценность только что выданных (новых для атлета) предметов."""
+    _add(athlete_id, awarded_at or timezone.now(), {"collectibles": value})
+
+
+def _totals(period, athlete_id=None):
+    """(metric, bucket, athlete_id, value) из сырых данных для одного периода."""
+    trunc = {"week": TruncWeek, "month": TruncMonth}.get(period)
+    moment = Coalesce("last_date_time", "created_at")
+
+    runs = Run.objects.filter(status=FINISHED)
+    awards = CollectibleAward.objects.all()
+    if athlete_id is not None:
+        runs = runs.filter(athlete_id=athlete_id)
+        awards = awards.filter(user_id=athlete_id)
+    if trunc is not None:
+        # выданные до появления awarded_at в недели/месяцы не попадают
+        awards = awards.filter(awarded_at__isnull=False)
+        runs = runs.annotate(b=trunc(moment)).values("athlete_id", "b")
+        awards = awards.annotate(b=trunc("awarded_at")).values("user_id", "b")
+    else:
+        runs = runs.values("athlete_id")
+        awards = awards.values("user_id")
+
+    for row in runs.annotate(distance=Coalesce(Sum("distance"), 0.0), runs=Count("id")).order_by():
+        b = _as_date(row.get("b", ALL_TIME))
+        yield "distance", b, row["athlete_id"], row["distance"]
+        yield "runs", b, row["athlete_id"], row["runs"]
+    for row in awards.annotate(value=Sum("collectibleitem__value")).order_by():
+        yield "collectibles", _as_date(row.get("b", ALL_TIME)), row["user_id"], row["value"] or 0
+
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _entries(athlete_id=None):
+    for period in PERIODS:
+        for metric, b, athlete, value in _totals(period, athlete_id):
+            if value:
+                yield LeaderboardEntry(metric=metric, period=period, bucket=b, athlete_id=athlete, value=value)
+
+
+def refresh_athlete(athlete_id):
+    """Пересчитывает все строки атлета из сырых данных. Вызывать внутри transaction.atomic()."""
+    LeaderboardEntry.objects.filter(athlete_id=athlete_id).delete()
+    LeaderboardEntry.objects.bulk_create(_entries(athlete_id=athlete_id), batch_size=1000)
+
+
+def rebuild():
+    """Полная перестройка; возвращает число строк."""
+    LeaderboardEntry.objects.all().delete()
+    return len(LeaderboardEntry.objects.bulk_create(_entries(), batch_size=1000))
+
+
+def top(metric, period, bucket_start, limit):
+    """Первые limit строк; ранг — «олимпийский» (равные значения делят место)."""
+    rows = (
+        LeaderboardEntry.objects
+        .filter(metric=metric, period=period, bucket=bucket_start)
+        .order_by("-value", "athlete_id")
+        .values_list("athlete_id", "athlete__username", "value")[:limit]
+    )
+    out, rank, prev = [], 0, None
+    for i, (athlete_id, username, value) in enumerate(rows, start=1):
+        if value != prev:
+            rank, prev = i, value
+        out.append({
+            "rank": rank,
+            "athlete": athlete_id,
+            "username": username,
+            "value": _display(metric, value),
+        })
+    return out
+
+
+def rank_of(metric, period, bucket_start, athlete_id):
+    """{"rank", "value"} атлета или None, если в этом ведре у него ничего нет."""
+    board = LeaderboardEntry.objects.filter(metric=metric, period=period, bucket=bucket_start)
+    value = board.filter(athlete_id=athlete_id).values_list("value", flat=True).first()
+    if not value:
+        return None
+    return {
+        "rank": board.filter(value__gt=value).count() + 1,
+        "value": _display(metric, value),
+    }
+
+
+def _display(metric, value):
+    return int(round(value)) if metric in INTEGER_METRICS else round(value, 4)
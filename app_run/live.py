@@ -0,0 +1,266 @@
+"""
+Живая лента забега: /api/runs/<id>/live/ (Server-Sent Events).
+
+Внутри процесса у каждого просматриваемого забега есть канал. Запись точек
+(tracking.add_positions) и остановка забега после коммита зовут publish();
+канал одним чтением забирает из БД новые точки (id > последнего отданного)
+и текущую дистанцию и раскладывает событие по очередям всех зрителей —
+N зрителей одного забега стоят одно чтение на новую порцию, а не N.
+
+Точки, записанные другим процессом, этот не услышит: зритель, не получавший
+событий KEEPALIVE_SECONDS, сам дёргает poll() — та же выборка, не чаще раза
+в KEEPALIVE_SECONDS на канал — и шлёт комментарий-keepalive.
+
+Число зрителей на процесс ограничено MAX_WATCHERS (под WSGI каждый держит
+поток). Когда забег становится finished, зрители получают событие finished
+и поток закрывается.
+"""
+import asyncio
+import json
+import queue
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from .models import Position, Run
+from .serializers import DATETIME_FMT
+
+
+MAX_WATCHERS = 200
+KEEPALIVE_SECONDS = 15
+RETRY_MS = 3000
+
+_FINISHED = Run.STATUS_CHOICES[2][0]
+_CLOSE = object()
+
+
+class TooManyWatchers(Exception):
+    pass
+
+
+def _event(name, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _position(row):
+    return {
+        "id": row["id"],
+        "latitude": str(row["latitude"]),
+        "longitude": str(row["longitude"]),
+        "date_time": row["date_time"].strftime(DATETIME_FMT) if row["date_time"] else None,
+    }
+
+
+class _Channel:
+    def __init__(self, run_id, last_id):
+        self.run_id = run_id
+        self.last_id = last_id
+        self.watchers = set()
+        # подписки, которые ещё читают snapshot: пока они есть, канал не удаляется
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.fetched_at = time.monotonic()
+
+
+class Hub:
+    def __init__(self, max_watchers=MAX_WATCHERS):
+        self.max_watchers = max_watchers
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._count = 0
+
+    @property
+    def watchers(self):
+        return self._count
+
+    def is_watched(self, run_id):
+        return run_id in self._channels
+
+    def subscribe(self, run_id, watcher, last_event_id=None):
+        """
+        Регистрирует watcher и кладёт ему начальные события: snapshot и, если
+        пришёл Last-Event-ID, пропущенные точки. Синхронный, ходит в БД.
+        """
+        with self._lock:
+            if self._count >= self.max_watchers:
+                raise TooManyWatchers
+            self._count += 1
+            channel = self._channels.get(run_id)
+            if channel is None:
+                channel = self._channels[run_id] = _Channel(run_id, None)
+            channel.pending += 1
+        registered = False
+        try:
+            with channel.lock:
+                if channel.last_id is None:
+                    channel.last_id = (
+                        Position.objects.filter(run_id=run_id).order_by("-id").values_list("id", flat=True).first()
+                        or 0
+                    )
+                run = Run.objects.filter(pk=run_id).values(
+                    "status", "track_distance", "distance", "run_time_seconds"
+                ).first()
+                watcher.push(_event("snapshot", {
+                    "run": run_id,
+                    "status": run["status"],
+                    "distance": round(run["track_distance"], 4),
+                }))
+                if last_event_id is not None and last_event_id < channel.last_id:
+                    rows = self._rows(run_id, last_event_id, upto=channel.last_id)
+                    if rows:
+                        watcher.push(self._positions_event(rows, run))
+                if run["status"] == _FINISHED:
+                    watcher.push(self._finished_event(run_id, run))
+                    watcher.push(_CLOSE)
+                # под _lock: unsubscribe не увидит канал пустым между pending и watchers
+                with self._lock:
+                    channel.pending -= 1
+                    channel.watchers.add(watcher)
+                    registered = True
+        except BaseException:
+            if not registered:
+                with self._lock:
+                    channel.pending -= 1
+            self.unsubscribe(run_id, watcher)
+            raise
+
+    def unsubscribe(self, run_id, watcher):
+        with self._lock:
+            self._count -= 1
+            channel = self._channels.get(run_id)
+            if channel is None:
+                return
+            channel.watchers.discard(watcher)
+            if not channel.watchers and not channel.pending:
+                del self._channels[run_id]
+
+    def publish(self, run_id):
+        """Новые точки / смена статуса забега: одно чтение и рассылка всем зрителям."""
+        channel = self._channels.get(run_id)
+        if channel is None:
+            return
+        with channel.lock:
+            channel.fetched_at = time.monotonic()
+            run = Run.objects.filter(pk=run_id).values(
+                "status", "track_distance", "distance", "run_time_seconds"
+            ).first()
+            rows = self._rows(run_id, channel.last_id or 0)
+            events = []
+            if rows:
+                channel.last_id = rows[-1]["id"]
+                events.append(self._positions_event(rows, run))
+            if run is None or run["status"] == _FINISHED:
+                events.append(self._finished_event(run_id, run))
+                events.append(_CLOSE)
+            for watcher in list(channel.watchers):
+                for event in events:
+                    watcher.push(event)
+
+    def poll(self, run_id):
+        """publish(), если канал давно не читал БД (точки могли прийти в другой процесс)."""
+        channel = self._channels.get(run_id)
+        if channel is not None and time.monotonic() - channel.fetched_at >= KEEPALIVE_SECONDS:
+            self.publish(run_id)
+
+    @staticmethod
+    def _rows(run_id, after_id, upto=None):
+        rows = Position.objects.filter(run_id=run_id, id__gt=after_id)
+        if upto is not None:
+            rows = rows.filter(id__lte=upto)
+        return list(rows.order_by("id").values("id", "latitude", "longitude", "date_time"))
+
+    @staticmethod
+    def _positions_event(rows, run):
+        return _event(
+            "positions",
+            {
+                "positions": [_position(row) for row in rows],
+                "distance": round(run["track_distance"], 4) if run else None,
+            },
+            event_id=rows[-1]["id"],
+        )
+
+    @staticmethod
+    def _finished_event(run_id, run):
+        return _event("finished", {
+            "run": run_id,
+            "distance": run["distance"] if run else None,
+            "run_time_seconds": run["run_time_seconds"] if run else None,
+        })
+
+
+hub = Hub()
+
+
+def publish_on_commit(run_id):
+    """Для вызова внутри транзакции записи; без зрителей ничего не стоит."""
+    if hub.is_watched(run_id):
+        transaction.on_commit(lambda: hub.publish(run_id))
+
+
+def last_event_id(request):
+    """Last-Event-ID, с которым EventSource переподключается, или None."""
+    try:
+        return int(request.headers["Last-Event-ID"])
+    except (KeyError, ValueError):
+        return None
+
+
+class SyncWatcher:
+    """Зритель для WSGI: поток ждёт на queue.Queue."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def push(self, event):
+        self.queue.put(event)
+
+
+class AsyncWatcher:
+    """Зритель для ASGI: события приходят из потоков записи через call_soon_threadsafe."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def push(self, event):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+
+def stream(run_id, watcher):
+    """Генератор SSE для WSGI; watcher уже подписан, отписывается при закрытии."""
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            try:
+                event = watcher.queue.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                hub.poll(run_id)
+                yield ": keepalive\n\n"
+                continue
+            if event is _CLOSE:
+                return
+            yield event
+    finally:
+        hub.unsubscribe(run_id, watcher)
+
+
+async def astream(run_id, watcher):
+    """То же для ASGI."""
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(watcher.queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await sync_to_async(hub.poll)(run_id)
+                yield ": keepalive\n\n"
+                continue
+            if event is _CLOSE:
+                return
+            yield event
+    finally:
+        hub.unsubscribe(run_id, watcher)
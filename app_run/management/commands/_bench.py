@@ -0,0 +1,51 @@
+"""Общие помощники для bench_* команд: временная БД и перцентили."""
+import math
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def benchmark_database(verbosity=0, concurrent=False):
+    """
+    Поднимает чистую тестовую БД на время замера, рабочую не трогает.
+
+    concurrent=True — для замеров с параллельной записью из нескольких потоков:
+    тестовая SQLite тогда создаётся файлом, а не в памяти (shared cache in-memory
+    базы отвечает на конкурентную запись "table is locked"), транзакции берут
+    блокировку сразу (IMMEDIATE) и ждут её, а не падают.
+    """
+    settings_dict = connection.settings_dict
+    old_name = settings_dict["NAME"]
+    old_test, old_options = dict(settings_dict["TEST"]), dict(settings_dict["OPTIONS"])
+    if concurrent and connection.vendor == "sqlite":
+        settings_dict["TEST"]["NAME"] = os.path.join(tempfile.gettempdir(), "project_run_bench.sqlite3")
+        settings_dict["OPTIONS"].update(timeout=60, transaction_mode="IMMEDIATE")
+    setup_test_environment(debug=False)
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+        settings_dict["TEST"], settings_dict["OPTIONS"] = old_test, old_options
+
+
+def percentile(values, p):
+    """Перцентиль по методу nearest-rank, p в [0, 100]."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(int(math.ceil(p / 100.0 * len(ordered))) - 1, 0)
+    return ordered[k]
+
+
+def timed(fn, *args, **kwargs):
+    """(результат, секунды)"""
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from app_run import backfill
+from app_run.models import CollectibleItem
+
+
+class Command(BaseCommand):
+    help = "Выдаёт коллекционные предметы по уже записанным точкам (app_run.backfill)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="пройти весь каталог, а не только предметы без backfilled_at")
+        parser.add_argument("--workers", type=int, default=backfill.BACKFILL_WORKERS)
+        parser.add_argument("--chunk-size", type=int, default=backfill.BACKFILL_CHUNK_SIZE,
+                            help="диапазон id точек на одну задачу пула")
+
+    def handle(self, *args, **opts):
+        kwargs = {"workers": opts["workers"], "chunk_size": opts["chunk_size"]}
+        if opts["all"]:
+            result = backfill.backfill(CollectibleItem.objects.all(), **kwargs)
+        else:
+            result = backfill.run_pending(**kwargs)
+        self.stdout.write(
+            f"{result.items} items, {result.positions} positions in bbox, {result.awards} awarded"
+        )
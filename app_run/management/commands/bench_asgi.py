@@ -0,0 +1,160 @@
+import asyncio
+import datetime
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.test import Client
+
+from app_run.models import CollectibleItem, Run
+
+from ._bench import benchmark_database, percentile
+
+
+def _session(athlete_id, points):
+    """Запросы одного клиента: (method, path, json-тело); run_id подставляется после создания."""
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    yield "POST", "/api/runs/{run}/start/", None
+    for i in range(points):
+        yield "POST", "/api/positions/", {
+            "run": "{run}",
+            "latitude": round(55.75 + 0.0005 * i, 4),
+            "longitude": 37.62,
+            "date_time": (start + datetime.timedelta(seconds=5 * i)).strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        }
+    yield "POST", "/api/runs/{run}/stop/", None
+
+
+def _fill(body, run_id):
+    if body is None:
+        return b""
+    return json.dumps({k: run_id if v == "{run}" else v for k, v in body.items()}).encode()
+
+
+class Command(BaseCommand):
+    help = "Пропускная способность ingest (start, точки, stop) при N параллельных клиентах: WSGI против ASGI."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", default="1,8,32")
+        parser.add_argument("--points", type=int, default=50)
+        parser.add_argument("--items", type=int, default=5000)
+
+    def handle(self, *args, **opts):
+        with benchmark_database(concurrent=True):
+            user = self._seed(opts["items"])
+            from project_run.asgi import application
+
+            self.stdout.write(f"{opts['points']} positions per client, req/s and p95 ms")
+            self.stdout.write(f"{'clients':>7} {'wsgi req/s':>11} {'wsgi p95':>9} {'asgi req/s':>11} {'asgi p95':>9}")
+            for clients in [int(c) for c in opts["clients"].split(",")]:
+                wsgi = self._wsgi(user, clients, opts["points"])
+                asgi = asyncio.run(self._asgi(application, user, clients, opts["points"]))
+                self.stdout.write(
+                    f"{clients:>7} {wsgi[0]:>11.1f} {wsgi[1]:>9.2f} {asgi[0]:>11.1f} {asgi[1]:>9.2f}"
+                )
+
+    def _runs(self, user, clients):
+        return [Run.objects.create(athlete=user, comment="bench").id for _ in range(clients)]
+
+    def _wsgi(self, user, clients, points):
+        """Как многопоточный WSGI-сервер: по потоку на клиента, синхронные DRF-вьюхи."""
+        runs = self._runs(user, clients)
+        latencies, lock = [], threading.Lock()
+
+        def client(run_id):
+            http, mine = Client(), []
+            try:
+                for method, path, body in _session(user.id, points):
+                    t0 = time.perf_counter()
+                    resp = http.generic(method, path.format(run=run_id), _fill(body, run_id),
+                                        content_type="application/json")
+                    mine.append(time.perf_counter() - t0)
+                    assert resp.status_code < 300, resp.content
+            finally:
+                connections.close_all()
+            with lock:
+                latencies.extend(mine)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            list(pool.map(client, runs))
+        elapsed = time.perf_counter() - started
+        close_old_connections()
+        return len(latencies) / elapsed, percentile(latencies, 95) * 1000
+
+    async def _asgi(self, application, user, clients, points):
+        """Все клиенты в одном event loop, запросы идут прямо в ASGI-приложение."""
+        from asgiref.sync import sync_to_async
+
+        runs = await sync_to_async(self._runs)(user, clients)
+        latencies = []
+
+        async def client(run_id):
+            for method, path, body in _session(user.id, points):
+                t0 = time.perf_counter()
+                code, content = await _asgi_call(application, method, path.format(run=run_id), _fill(body, run_id))
+                latencies.append(time.perf_counter() - t0)
+                assert code < 300, content
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(run_id) for run_id in runs))
+        elapsed = time.perf_counter() - started
+        return len(latencies) / elapsed, percentile(latencies, 95) * 1000
+
+    def _seed(self, items):
+        user = User.objects.create(username="bench")
+        CollectibleItem.objects.bulk_create(
+            CollectibleItem(
+                name=f"item {i}", uid=f"bench-{i}", picture="https://example.com/item.png", value=1,
+                latitude=round(55.0 + (i % 100) * 0.02, 4), longitude=round(37.0 + (i // 100) * 0.02, 4),
+                grid_cell=None,
+            )
+            for i in range(items)
+        )
+        for item in CollectibleItem.objects.all():
+            item.save(update_fields=["grid_cell"])
+        return user
+
+
+async def _asgi_call(application, method, path, body):
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [
+            (b"host", b"testserver"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    }
+    sent = False
+    status_code, chunks = None, []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # клиент не отключается
+
+    async def send(message):
+        nonlocal status_code
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await application(scope, receive, send)
+    return status_code, b"".join(chunks)
@@ -0,0 +1,103 @@
+import datetime
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from app_run import backfill
+from app_run.geo import collect_nearby
+from app_run.models import CollectibleAward, CollectibleItem, LeaderboardEntry, Position, Run
+from app_run.views import nearby_items_queryset
+
+from ._bench import benchmark_database, timed
+
+
+CENTER = (55.75, 37.62)
+SPREAD_DEG = 0.2
+STEP_DEG = 0.0003
+START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        "app_run.backfill на синтетической истории: точек в секунду при разном числе "
+        "потоков против повтора логики POST (collect_nearby на каждую точку)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--positions", type=int, default=1_000_000)
+        parser.add_argument("--items", type=int, default=2000)
+        parser.add_argument("--athletes", type=int, default=100)
+        parser.add_argument("--track", type=int, default=2000, help="точек на забег")
+        parser.add_argument("--workers", default="1,4")
+        parser.add_argument("--replay-sample", type=int, default=2000,
+                            help="сколько точек прогнать через collect_nearby для сравнения")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **opts):
+        rnd = random.Random(opts["seed"])
+        with benchmark_database(concurrent=True):
+            _, seed_s = timed(self._seed, rnd, opts)
+            self.stdout.write(f"seeded {opts['positions']} positions, {opts['items']} items in {seed_s:.1f}s")
+
+            self.stdout.write(f"{'workers':>8} {'seconds':>9} {'positions/s':>12} {'in bbox':>9} {'awards':>8}")
+            awards = None
+            for workers in (int(w) for w in opts["workers"].split(",")):
+                CollectibleAward.objects.all().delete()
+                LeaderboardEntry.objects.all().delete()
+                result, dt = timed(backfill.backfill, CollectibleItem.objects.all(), workers=workers)
+                if awards is not None and result.awards != awards:
+                    raise CommandError(f"workers={workers}: {result.awards} awards, expected {awards}")
+                awards = result.awards
+                self.stdout.write(
+                    f"{workers:>8} {dt:>9.2f} {opts['positions'] / dt:>12.0f} {result.positions:>9} {result.awards:>8}"
+                )
+
+            replay_s, missed = self._replay(opts["replay_sample"])
+            self.stdout.write(
+                f"replay: {opts['replay_sample'] / replay_s:.0f} positions/s, "
+                f"{opts['positions'] * replay_s / opts['replay_sample'] / 60:.1f} min extrapolated"
+            )
+            if missed:
+                raise CommandError(f"{missed} awards from replay are missing after backfill")
+
+    def _replay(self, sample):
+        """Логика POST на первых sample точках; заодно проверка, что backfill выдал то же."""
+        rows = Position.objects.order_by("id").values_list("run__athlete_id", "latitude", "longitude")[:sample]
+        awarded = set(CollectibleAward.objects.values_list("user_id", "collectibleitem_id"))
+        missed, seconds = 0, 0.0
+        for athlete_id, lat, lon in rows:
+            items, dt = timed(collect_nearby, [(lat, lon)], nearby_items_queryset())
+            seconds += dt
+            missed += sum((athlete_id, item.pk) not in awarded for item in items)
+        return seconds, missed
+
+    def _seed(self, rnd, opts):
+        athletes = User.objects.bulk_create(User(username=f"bench{i}") for i in range(opts["athletes"]))
+        items = []
+        for i in range(opts["items"]):
+            item = CollectibleItem(
+                name=f"item {i}", uid=f"bench-{i}", picture="https://example.com/item.png",
+                value=rnd.randint(1, 100),
+                latitude=round(CENTER[0] + rnd.uniform(-SPREAD_DEG, SPREAD_DEG), 4),
+                longitude=round(CENTER[1] + rnd.uniform(-SPREAD_DEG, SPREAD_DEG), 4),
+            )
+            item.fill_grid_cell()
+            items.append(item)
+        CollectibleItem.objects.bulk_create(items, batch_size=5000)
+
+        left, i = opts["positions"], 0
+        while left > 0:
+            count = min(opts["track"], left)
+            run = Run.objects.create(athlete=athletes[i % len(athletes)], comment="bench", status="finished")
+            lat = CENTER[0] + rnd.uniform(-SPREAD_DEG, SPREAD_DEG)
+            lon = CENTER[1] + rnd.uniform(-SPREAD_DEG, SPREAD_DEG)
+            points = []
+            for k in range(count):
+                lat += rnd.uniform(-STEP_DEG, STEP_DEG)
+                lon += rnd.uniform(-STEP_DEG, STEP_DEG)
+                points.append(Position(run=run, latitude=round(lat, 4), longitude=round(lon, 4),
+                                       date_time=START + datetime.timedelta(seconds=5 * k)))
+            Position.objects.bulk_create(points, batch_size=5000)
+            left -= count
+            i += 1
@@ -0,0 +1,63 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from app_run.models import Challenge, CollectibleItem, Run
+
+from ._bench import benchmark_database, percentile, timed
+
+
+class Command(BaseCommand):
+    help = "Чтение run/user/challenge: полный ответ против 304 по If-None-Match (p95, запросы к БД)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=20_000)
+        parser.add_argument("--items", type=int, default=2_000)
+        parser.add_argument("--repeat", type=int, default=50)
+
+    def handle(self, *args, **opts):
+        with benchmark_database():
+            user, run = self._seed(opts["runs"], opts["items"])
+            client = Client()
+            urls = [
+                "/api/runs/",
+                f"/api/runs/{run.id}/",
+                "/api/users/",
+                f"/api/users/{user.id}/",
+                f"/api/challenges/?athlete={user.id}",
+            ]
+            self.stdout.write(f"p95 of {opts['repeat']} requests, ms (queries)")
+            self.stdout.write(f"{'url':<28} {'200':>14} {'304':>14}")
+            for url in urls:
+                etag = client.get(url)["ETag"]
+                full = self._measure(client, url, opts["repeat"], 200)
+                cached = self._measure(client, url, opts["repeat"], 304, HTTP_IF_NONE_MATCH=etag)
+                self.stdout.write(
+                    f"{url:<28} {full[0]:>9.2f} ({full[1]:>2}) {cached[0]:>9.2f} ({cached[1]:>2})"
+                )
+
+    def _measure(self, client, url, repeat, expected, **headers):
+        samples = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                resp, dt = timed(client.get, url, **headers)
+            assert resp.status_code == expected, (url, resp.status_code)
+            samples.append(dt)
+        return percentile(samples, 95) * 1000, len(ctx.captured_queries)
+
+    def _seed(self, runs, items):
+        user = User.objects.create(username="bench", first_name="Bench")
+        Run.objects.bulk_create(
+            (Run(athlete=user, comment="bench", status="finished") for _ in range(runs)),
+            batch_size=5000,
+        )
+        collectibles = CollectibleItem.objects.bulk_create(
+            CollectibleItem(name=f"item {i}", uid=f"bench-{i}", latitude=55.75, longitude=37.62,
+                            picture="https://example.com/item.png", value=1)
+            for i in range(items)
+        )
+        user.items.add(*collectibles)
+        Challenge.objects.create(athlete=user, full_name="Сделай 10 Забегов!")
+        return user, Run.objects.create(athlete=user, comment="single", status="finished")
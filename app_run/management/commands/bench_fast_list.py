@@ -0,0 +1,82 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from app_run.models import Challenge, Position, Run
+
+from ._bench import benchmark_database, percentile, timed
+
+
+class Command(BaseCommand):
+    help = (
+        "List-эндпоинты через сериализатор и через app_run.fastlist: "
+        "строк в секунду и побайтное сравнение ответов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000, help="забегов, челленджей и точек трека")
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def handle(self, *args, **opts):
+        rows, repeat = opts["rows"], opts["repeat"]
+        with benchmark_database():
+            run = self._seed(rows)
+            client = Client()
+            urls = [
+                ("/api/runs/", rows + 1),
+                ("/api/runs/?cursor=&size=1000", min(rows + 1, 1000)),
+                ("/api/challenges/", rows),
+                (f"/api/positions/?run={run.id}", rows),
+                (f"/api/positions/?run={run.id}&cursor=&size=1000", min(rows, 1000)),
+            ]
+            self.stdout.write(f"p50 of {repeat} requests; rows/s")
+            self.stdout.write(f"{'url':<46} {'rows':>6} {'serializer':>11} {'fastlist':>11} {'x':>6}")
+            for url, count in urls:
+                slow, slow_body = self._measure(client, url, repeat, fast=False)
+                fast, fast_body = self._measure(client, url, repeat, fast=True)
+                if slow_body != fast_body:
+                    raise CommandError(f"{url}: fastlist response differs from serializer response")
+                self.stdout.write(
+                    f"{url:<46} {count:>6} {count / slow:>11.0f} {count / fast:>11.0f} {slow / fast:>5.1f}x"
+                )
+
+    def _measure(self, client, url, repeat, fast):
+        samples, body = [], None
+        with override_settings(FAST_LIST_JSON=fast):
+            for _ in range(repeat):
+                resp, dt = timed(client.get, url)
+                assert resp.status_code == 200, resp.content
+                body = resp.content
+                samples.append(dt)
+        return percentile(samples, 50), body
+
+    def _seed(self, rows):
+        users = User.objects.bulk_create(
+            User(username=f"bench{i}", first_name=f"Имя{i}", last_name=f"Фамилия{i}") for i in range(50)
+        )
+        Run.objects.bulk_create(
+            (
+                Run(athlete=users[i % len(users)], comment=f"bench {i}", status="finished",
+                    distance=round(i * 0.137, 4), run_time_seconds=i * 7)
+                for i in range(rows)
+            ),
+            batch_size=5000,
+        )
+        Challenge.objects.bulk_create(
+            (Challenge(full_name=f"Челлендж {i}", athlete=users[i % len(users)]) for i in range(rows)),
+            batch_size=5000,
+        )
+        # забег в процессе: его точки list отдаёт из строк Position, а не из RunTrack
+        run = Run.objects.create(athlete=users[0], comment="track", status="in_progress")
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        Position.objects.bulk_create(
+            (
+                Position(run=run, latitude=f"{55.75 + i * 1e-4:.4f}", longitude=f"{37.62 - i * 1e-4:.4f}",
+                         date_time=start + datetime.timedelta(seconds=i, microseconds=i))
+                for i in range(rows)
+            ),
+            batch_size=5000,
+        )
+        return run
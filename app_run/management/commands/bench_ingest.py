@@ -0,0 +1,85 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from geopy.distance import geodesic
+
+from app_run.geo import COLLECT_RADIUS_M, collect_nearby
+from app_run.models import CollectibleItem, Run
+
+from ._bench import benchmark_database, percentile, timed
+
+
+CENTER = (55.75, 37.62)
+SPREAD_DEG = 0.5
+DT_FMT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def _random_point(rnd):
+    return (
+        Decimal(str(round(CENTER[0] + rnd.uniform(-SPREAD_DEG, SPREAD_DEG), 4))),
+        Decimal(str(round(CENTER[1] + rnd.uniform(-SPREAD_DEG, SPREAD_DEG), 4))),
+    )
+
+
+def legacy_scan(lat, lon):
+    """Старый алгоритм: geodesic до каждого предмета каталога."""
+    return [
+        item for item in CollectibleItem.objects.all()
+        if geodesic((lat, lon), (float(item.latitude), float(item.longitude))).meters < COLLECT_RADIUS_M
+    ]
+
+
+class Command(BaseCommand):
+    help = "Замер p50/p95 POST /api/positions/ в зависимости от размера каталога предметов."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="100,1000,10000,100000")
+        parser.add_argument("--samples", type=int, default=200)
+        parser.add_argument("--legacy-samples", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **opts):
+        sizes = [int(s) for s in opts["sizes"].split(",")]
+        rnd = random.Random(opts["seed"])
+        with benchmark_database():
+            user = User.objects.create(username="bench")
+            run = Run.objects.create(athlete=user, comment="bench", status="in_progress")
+            client = Client()
+            self.stdout.write(
+                f"{'items':>8} {'post p50 ms':>12} {'post p95 ms':>12} "
+                f"{'index p95 ms':>13} {'legacy p95 ms':>14}"
+            )
+            for size in sizes:
+                self._fill_catalogue(size, rnd)
+                post, index, legacy = [], [], []
+                for i in range(opts["samples"]):
+                    lat, lon = _random_point(rnd)
+                    body = {"run": run.id, "latitude": str(lat), "longitude": str(lon),
+                            "date_time": f"2024-10-12T14:30:{i % 60:02d}.000000"}
+                    resp, dt = timed(client.post, "/api/positions/", body, content_type="application/json")
+                    assert resp.status_code == 201, resp.content
+                    post.append(dt)
+                    _, dt = timed(collect_nearby, [(lat, lon)], CollectibleItem.objects.all())
+                    index.append(dt)
+                for _ in range(opts["legacy_samples"]):
+                    lat, lon = _random_point(rnd)
+                    _, dt = timed(legacy_scan, float(lat), float(lon))
+                    legacy.append(dt)
+                self.stdout.write(
+                    f"{size:>8} {percentile(post, 50) * 1000:>12.2f} {percentile(post, 95) * 1000:>12.2f} "
+                    f"{percentile(index, 95) * 1000:>13.2f} {percentile(legacy, 95) * 1000:>14.2f}"
+                )
+
+    def _fill_catalogue(self, size, rnd):
+        CollectibleItem.objects.all().delete()
+        items = []
+        for i in range(size):
+            lat, lon = _random_point(rnd)
+            item = CollectibleItem(name=f"item {i}", uid=f"bench-{i}", latitude=lat, longitude=lon,
+                                   picture="https://example.com/i.png", value=1)
+            item.fill_grid_cell()
+            items.append(item)
+        CollectibleItem.objects.bulk_create(items, batch_size=2000)
@@ -0,0 +1,84 @@
+import datetime
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+
+from app_run import packed_track
+from app_run.models import Position, Run, RunTrack
+
+from ._bench import benchmark_database, percentile, timed
+
+
+class Command(BaseCommand):
+    help = "Размер и латентность чтения трека: строки Position против RunTrack."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000")
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def handle(self, *args, **opts):
+        rnd = random.Random(42)
+        client = Client()
+        with benchmark_database():
+            user = User.objects.create(username="bench")
+            self.stdout.write(
+                f"{'points':>8} {'rows B/pt':>10} {'raw B/pt':>9} {'zlib B/pt':>10} "
+                f"{'rows p50 ms':>12} {'packed p50 ms':>14} {'equal':>6}"
+            )
+            for size in (int(s) for s in opts["sizes"].split(",")):
+                run = self._seed(user, size, rnd)
+                url = f"/api/positions/?run={run.id}"
+                rows_resp, rows_ms = self._p50(client, url, opts["repeat"])
+                rows_bytes = self._table_bytes()
+
+                raw = packed_track.compact_run(run.id, compress=False)
+                raw_size = len(raw.data)
+                packed = packed_track.compact_run(run.id, compress=True)
+                packed_resp, packed_ms = self._p50(client, url, opts["repeat"])
+                rows_per_point = f"{rows_bytes / size:.1f}" if rows_bytes else "n/a"
+                self.stdout.write(
+                    f"{size:>8} {rows_per_point:>10} {raw_size / size:>9.1f} {len(packed.data) / size:>10.1f} "
+                    f"{rows_ms:>12.1f} {packed_ms:>14.1f} {str(rows_resp == packed_resp):>6}"
+                )
+                RunTrack.objects.all().delete()
+                Position.objects.all().delete()
+
+    def _p50(self, client, url, repeat):
+        samples, body = [], None
+        for _ in range(repeat):
+            resp, dt = timed(client.get, url)
+            samples.append(dt)
+            body = resp.content
+        return body, percentile(samples, 50) * 1000
+
+    def _table_bytes(self):
+        # sqlite: dbstat есть не во всех сборках; postgres: размер таблицы с индексами
+        with connection.cursor() as cursor:
+            try:
+                if connection.vendor == "postgresql":
+                    cursor.execute("SELECT pg_total_relation_size('app_run_position')")
+                else:
+                    cursor.execute(
+                        "SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'app_run_position%'"
+                    )
+                return cursor.fetchone()[0]
+            except Exception:
+                return None
+
+    def _seed(self, user, size, rnd):
+        run = Run.objects.create(athlete=user, comment="bench", status="finished")
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        lat, lon = 55.75, 37.62
+        points = []
+        for i in range(size):
+            lat += rnd.uniform(-0.0003, 0.0003)
+            lon += rnd.uniform(-0.0003, 0.0003)
+            points.append(Position(
+                run=run, latitude=f"{lat:.4f}", longitude=f"{lon:.4f}",
+                date_time=start + datetime.timedelta(seconds=i, microseconds=rnd.randint(0, 999_999)),
+            ))
+        Position.objects.bulk_create(points, batch_size=5000)
+        return run
@@ -0,0 +1,69 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from app_run.models import Position, Run
+from app_run.views import PositionKeysetPagination, RunKeysetPagination
+
+from ._bench import benchmark_database, percentile, timed
+
+
+class Command(BaseCommand):
+    help = "Латентность страницы на разной глубине: offset (?page=) против keyset (?cursor=)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200_000)
+        parser.add_argument("--size", type=int, default=50)
+        parser.add_argument("--depths", default="1,100,1000,3900")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **opts):
+        rows, size = opts["rows"], opts["size"]
+        depths = [int(d) for d in opts["depths"].split(",")]
+        with benchmark_database():
+            run = self._seed(rows)
+            client = Client()
+            runs_key, pos_key = RunKeysetPagination(), PositionKeysetPagination()
+            runs_order = list(Run.objects.order_by("created_at", "id").values_list("created_at", "id"))
+            pos_order = list(
+                Position.objects.filter(run=run).order_by("date_time", "id").values_list("date_time", "id")
+            )
+
+            self.stdout.write(f"{rows} rows, page size {size}, p95 of {opts['repeat']} requests, ms")
+            self.stdout.write(f"{'page':>6} {'runs offset':>12} {'runs keyset':>12} {'pos keyset':>11}")
+            for page in depths:
+                offset = (page - 1) * size
+                runs_cursor = runs_key._encode(runs_order[offset - 1]) if offset else ""
+                pos_cursor = pos_key._encode(pos_order[offset - 1]) if offset else ""
+                cols = [
+                    self._p95(client, f"/api/runs/?page={page}&size={size}", opts["repeat"]),
+                    self._p95(client, f"/api/runs/?cursor={runs_cursor}&size={size}", opts["repeat"]),
+                    self._p95(client, f"/api/positions/?run={run.id}&cursor={pos_cursor}&size={size}",
+                              opts["repeat"]),
+                ]
+                self.stdout.write(f"{page:>6} {cols[0]:>12.2f} {cols[1]:>12.2f} {cols[2]:>11.2f}")
+
+    def _p95(self, client, url, repeat):
+        samples = []
+        for _ in range(repeat):
+            resp, dt = timed(client.get, url)
+            assert resp.status_code == 200, resp.content
+            samples.append(dt)
+        return percentile(samples, 95) * 1000
+
+    def _seed(self, rows):
+        user = User.objects.create(username="bench")
+        Run.objects.bulk_create(
+            (Run(athlete=user, comment="bench", status="finished") for _ in range(rows)),
+            batch_size=5000,
+        )
+        run = Run.objects.create(athlete=user, comment="track", status="in_progress")
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        Position.objects.bulk_create(
+            (Position(run=run, latitude="55.7500", longitude="37.6200",
+                      date_time=start + datetime.timedelta(seconds=i)) for i in range(rows)),
+            batch_size=5000,
+        )
+        return run
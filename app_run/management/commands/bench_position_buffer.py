@@ -0,0 +1,97 @@
+import datetime
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test import Client, override_settings
+
+from app_run.models import CollectibleItem, Position, Run
+
+from ._bench import benchmark_database, percentile
+
+
+DT_FMT = "%Y-%m-%dT%H:%M:%S.%f"
+START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        "POST /api/positions/ при N параллельных клиентах: INSERT на запрос против "
+        "буфера app_run.ingest. Точек в секунду до stop включительно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", default="1,8,32")
+        parser.add_argument("--points", type=int, default=200, help="точек на клиента")
+        parser.add_argument("--items", type=int, default=5000)
+        parser.add_argument("--max-points", type=int, default=500)
+        parser.add_argument("--max-delay-ms", type=int, default=200)
+
+    def handle(self, *args, **opts):
+        with benchmark_database(concurrent=True):
+            user = self._seed(opts["items"])
+            self.stdout.write(f"{opts['points']} positions per client, then stop; points/s and POST p95 ms")
+            self.stdout.write(
+                f"{'clients':>7} {'insert pts/s':>13} {'insert p95':>11} {'buffer pts/s':>13} {'buffer p95':>11} {'x':>6}"
+            )
+            for clients in [int(c) for c in opts["clients"].split(",")]:
+                direct = self._drive(user, clients, opts["points"], buffered=False)
+                with override_settings(POSITION_BUFFER_MAX_POINTS=opts["max_points"],
+                                       POSITION_BUFFER_MAX_DELAY_MS=opts["max_delay_ms"]):
+                    buffered = self._drive(user, clients, opts["points"], buffered=True)
+                self.stdout.write(
+                    f"{clients:>7} {direct[0]:>13.0f} {direct[1]:>11.2f} "
+                    f"{buffered[0]:>13.0f} {buffered[1]:>11.2f} {buffered[0] / direct[0]:>5.1f}x"
+                )
+
+    def _drive(self, user, clients, points, buffered):
+        runs = [Run.objects.create(athlete=user, comment="bench", status="in_progress").id for _ in range(clients)]
+        latencies, lock = [], threading.Lock()
+
+        def client(run_id):
+            http, mine = Client(), []
+            try:
+                for i in range(points):
+                    body = json.dumps({
+                        "run": run_id, "latitude": round(55.75 + 0.0005 * i, 4), "longitude": 37.62,
+                        "date_time": (START + datetime.timedelta(seconds=5 * i)).strftime(DT_FMT),
+                    })
+                    t0 = time.perf_counter()
+                    resp = http.post("/api/positions/", body, content_type="application/json")
+                    mine.append(time.perf_counter() - t0)
+                    assert resp.status_code < 300, resp.content
+                resp = http.post(f"/api/runs/{run_id}/stop/")
+                assert resp.status_code == 200, resp.content
+            finally:
+                connections.close_all()
+            with lock:
+                latencies.extend(mine)
+
+        with override_settings(POSITION_BUFFER=buffered):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(clients) as pool:
+                list(pool.map(client, runs))
+            elapsed = time.perf_counter() - started
+        close_old_connections()
+
+        stored = Position.objects.filter(run_id__in=runs).count()
+        if stored != clients * points:
+            raise CommandError(f"stored {stored} positions, expected {clients * points}")
+        return len(latencies) / elapsed, percentile(latencies, 95) * 1000
+
+    def _seed(self, items):
+        user = User.objects.create(username="bench")
+        catalogue = []
+        for i in range(items):
+            item = CollectibleItem(
+                name=f"item {i}", uid=f"bench-{i}", picture="https://example.com/item.png", value=1,
+                latitude=round(55.0 + (i % 100) * 0.02, 4), longitude=round(37.0 + (i // 100) * 0.02, 4),
+            )
+            item.fill_grid_cell()
+            catalogue.append(item)
+        CollectibleItem.objects.bulk_create(catalogue)
+        return user
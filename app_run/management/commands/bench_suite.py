@@ -0,0 +1,250 @@
+import datetime
+import io
+import json
+import platform
+import random
+import subprocess
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from openpyxl import Workbook
+
+from app_run import leaderboards, tracking
+from app_run.models import CollectibleItem, Position, Run
+
+from ._bench import benchmark_database, percentile
+
+
+CENTER = (55.75, 37.62)
+SPREAD_DEG = 0.2
+STEP_DEG = 0.0003
+DT_FMT = "%Y-%m-%dT%H:%M:%S.%f"
+START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        "Набор замеров горячих эндпоинтов на синтетических данных: "
+        "throughput и p50/p95/p99 в JSON-отчёт для сравнения между коммитами."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--athletes", type=int, default=50)
+        parser.add_argument("--runs", type=int, default=200, help="всего завершённых забегов")
+        parser.add_argument("--positions", type=int, default=300, help="точек на забег")
+        parser.add_argument("--items", type=int, default=5000)
+        parser.add_argument("--requests", type=int, default=200, help="запросов на эндпоинт")
+        parser.add_argument("--upload-requests", type=int, default=5)
+        parser.add_argument("--upload-rows", type=int, default=500)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", help="куда записать JSON-отчёт")
+        parser.add_argument("--compare", help="JSON-отчёт прошлого прогона для сравнения")
+
+    def handle(self, *args, **opts):
+        rnd = random.Random(opts["seed"])
+        with benchmark_database():
+            started = time.perf_counter()
+            data = self._seed(rnd, opts)
+            seed_seconds = time.perf_counter() - started
+
+            client = Client()
+            results = {}
+            for name, requests in self._scenarios(client, rnd, data, opts):
+                results[name] = self._drive(requests)
+                self.stderr.write(f"{name}: done")
+
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": data["vendor"],
+                "seed_seconds": round(seed_seconds, 2),
+                "dataset": {k: opts[k] for k in ("athletes", "runs", "positions", "items", "seed")},
+                "requests": opts["requests"],
+            },
+            "endpoints": results,
+        }
+        if opts["output"]:
+            with open(opts["output"], "w") as fh:
+                json.dump(report, fh, indent=2)
+        self._print(results, opts["compare"])
+
+    # --- данные ---
+
+    def _seed(self, rnd, opts):
+        athletes = User.objects.bulk_create(
+            User(username=f"athlete{i}", first_name=f"First{i}", last_name=f"Last{i}")
+            for i in range(opts["athletes"])
+        )
+        items = []
+        for i in range(opts["items"]):
+            item = CollectibleItem(
+                name=f"item {i}", uid=f"bench-{i}", picture="https://example.com/item.png",
+                value=rnd.randint(1, 100),
+                latitude=round(CENTER[0] + rnd.uniform(-SPREAD_DEG, SPREAD_DEG), 4),
+                longitude=round(CENTER[1] + rnd.uniform(-SPREAD_DEG, SPREAD_DEG), 4),
+            )
+            item.fill_grid_cell()
+            items.append(item)
+        CollectibleItem.objects.bulk_create(items, batch_size=5000)
+
+        finished = self._runs(rnd, athletes, opts["runs"], opts["positions"], "finished")
+        # забеги для POST точек и для stop: в процессе, у stop — уже с треком
+        open_runs = self._runs(rnd, athletes, len(athletes), 0, "in_progress")
+        to_stop = self._runs(rnd, athletes, opts["requests"], opts["positions"], "in_progress")
+        call_command("rebuild_athlete_stats", stdout=io.StringIO())
+        leaderboards.rebuild()
+        return {
+            "vendor": connection.vendor,
+            "finished": [r.id for r in finished],
+            "open": [(r.id, r.athlete_id) for r in open_runs],
+            "to_stop": [r.id for r in to_stop],
+        }
+
+    def _runs(self, rnd, athletes, count, positions, status):
+        runs = Run.objects.bulk_create(
+            Run(athlete=athletes[i % len(athletes)], comment="bench", status=status) for i in range(count)
+        )
+        for run in runs:
+            Position.objects.bulk_create(
+                (
+                    Position(run=run, latitude=round(lat, 4), longitude=round(lon, 4), date_time=dt)
+                    for lat, lon, dt in _track(rnd, positions, START)
+                ),
+                batch_size=5000,
+            )
+            if positions:
+                tracking.recompute_totals(run)
+                if status == "finished":
+                    run.distance, run.run_time_seconds = tracking.finalize(run)
+                    run.save(update_fields=["distance", "run_time_seconds"])
+        return runs
+
+    # --- сценарии ---
+
+    def _scenarios(self, client, rnd, data, opts):
+        n = opts["requests"]
+
+        def position_posts():
+            open_runs = data["open"]
+            clock = {run_id: START for run_id, _ in open_runs}
+            for i in range(n):
+                run_id, _ = open_runs[i % len(open_runs)]
+                clock[run_id] += datetime.timedelta(seconds=5)
+                lat, lon = _random_point(rnd)
+                body = {"run": run_id, "latitude": lat, "longitude": lon,
+                        "date_time": clock[run_id].strftime(DT_FMT)}
+                yield lambda body=body: client.post("/api/positions/", body, content_type="application/json")
+
+        def run_stops():
+            for run_id in data["to_stop"][:n]:
+                yield lambda run_id=run_id: client.post(f"/api/runs/{run_id}/stop/")
+
+        def users_list():
+            for _ in range(n):
+                yield lambda: client.get("/api/users/")
+
+        def positions_list():
+            finished = data["finished"]
+            for i in range(n):
+                run_id = finished[i % len(finished)]
+                yield lambda run_id=run_id: client.get(f"/api/positions/?run={run_id}")
+
+        def uploads():
+            for i in range(opts["upload_requests"]):
+                payload = _workbook(rnd, f"upload{i}", opts["upload_rows"])
+                yield lambda payload=payload: client.post(
+                    "/api/upload_file/", {"file": io.BytesIO(payload)}, format="multipart"
+                )
+
+        return [
+            ("position_post", position_posts()),
+            ("run_stop", run_stops()),
+            ("users_list", users_list()),
+            ("positions_list", positions_list()),
+            ("upload_file", uploads()),
+        ]
+
+    def _drive(self, requests):
+        latencies, errors = [], 0
+        for request in requests:
+            t0 = time.perf_counter()
+            response = request()
+            latencies.append(time.perf_counter() - t0)
+            if response.status_code >= 400:
+                errors += 1
+        total = sum(latencies)
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "seconds": round(total, 4),
+            "rps": round(len(latencies) / total, 2) if total else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        }
+
+    # --- вывод ---
+
+    def _print(self, results, compare):
+        baseline = {}
+        if compare:
+            with open(compare) as fh:
+                baseline = json.load(fh)["endpoints"]
+        self.stdout.write(
+            f"{'endpoint':<16} {'req':>5} {'err':>4} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+            + (f" {'p95 vs base':>12}" if baseline else "")
+        )
+        for name, r in results.items():
+            line = (
+                f"{name:<16} {r['requests']:>5} {r['errors']:>4} {r['rps']:>9.1f} "
+                f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}"
+            )
+            base = baseline.get(name)
+            if base and base["p95_ms"]:
+                line += f" {(r['p95_ms'] / base['p95_ms'] - 1) * 100:>+11.1f}%"
+            self.stdout.write(line)
+
+
+def _random_point(rnd):
+    return (
+        round(CENTER[0] + rnd.uniform(-SPREAD_DEG, SPREAD_DEG), 4),
+        round(CENTER[1] + rnd.uniform(-SPREAD_DEG, SPREAD_DEG), 4),
+    )
+
+
+def _track(rnd, count, start):
+    lat, lon = _random_point(rnd)
+    for i in range(count):
+        lat += rnd.uniform(-STEP_DEG, STEP_DEG)
+        lon += rnd.uniform(-STEP_DEG, STEP_DEG)
+        yield lat, lon, start + datetime.timedelta(seconds=5 * i)
+
+
+def _workbook(rnd, prefix, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Name", "UID", "Value", "Latitude", "Longitude", "URL"])
+    for i in range(rows):
+        lat, lon = _random_point(rnd)
+        ws.append([f"{prefix} item {i}", f"{prefix}-{i}", rnd.randint(1, 100), lat, lon,
+                   "https://example.com/item.png"])
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
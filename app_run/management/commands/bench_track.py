@@ -0,0 +1,59 @@
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from haversine import haversine, Unit
+
+from app_run import track_metrics
+
+from ._bench import timed
+
+
+def legacy_distance(pts):
+    """Цикл из StopRunApiView до track_metrics."""
+    distance_km = 0.0
+    if len(pts) >= 2:
+        prev = (float(pts[0][0]), float(pts[0][1]))
+        for lat, lon in pts[1:]:
+            cur = (float(lat), float(lon))
+            distance_km += haversine(prev, cur, unit=Unit.KILOMETERS)
+            prev = cur
+    return distance_km
+
+
+class Command(BaseCommand):
+    help = "Сравнивает поточечный haversine-цикл с track_metrics (NumPy и чистый Python)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **opts):
+        rnd = random.Random(opts["seed"])
+        self.stdout.write(
+            f"{'points':>8} {'legacy ms':>10} {'python ms':>10} {'numpy ms':>10} {'distance km':>14} {'match':>6}"
+        )
+        for size in (int(s) for s in opts["sizes"].split(",")):
+            lat, lon = 55.75, 37.62
+            pts, lats, lons, ts = [], [], [], []
+            for i in range(size):
+                lat += rnd.uniform(-0.0005, 0.0005)
+                lon += rnd.uniform(-0.0005, 0.0005)
+                pts.append((Decimal(f"{lat:.4f}"), Decimal(f"{lon:.4f}")))
+                lats.append(float(pts[-1][0]))
+                lons.append(float(pts[-1][1]))
+                ts.append(1_700_000_000.0 + i)
+
+            legacy, legacy_s = timed(legacy_distance, pts)
+            py, py_s = timed(track_metrics._metrics_py, lats, lons, ts)
+            if track_metrics.np is not None:
+                np_ = track_metrics.np
+                arrays = np_.asarray(lats), np_.asarray(lons), np_.asarray(ts)
+                vec, vec_s = timed(track_metrics._metrics_np, *arrays)
+                vec_ms, results = f"{vec_s * 1000:.1f}", (py.distance_km, vec.distance_km)
+            else:
+                vec_ms, results = "n/a", (py.distance_km,)
+            match = all(round(r, 4) == round(legacy, 4) for r in results)
+            self.stdout.write(
+                f"{size:>8} {legacy_s * 1000:>10.1f} {py_s * 1000:>10.1f} {vec_ms:>10} {legacy:>14.4f} {str(match):>6}"
+            )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from app_run import packed_track
+from app_run.models import Run
+
+
+class Command(BaseCommand):
+    help = "Упаковывает треки завершённых забегов в RunTrack."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--run", type=int, action="append", dest="runs")
+        parser.add_argument("--all", action="store_true", help="переупаковать и уже упакованные")
+        parser.add_argument("--no-compress", action="store_true")
+
+    def handle(self, *args, **opts):
+        qs = Run.objects.filter(status=Run.STATUS_CHOICES[2][0]).order_by("id")
+        if opts["runs"]:
+            qs = qs.filter(id__in=opts["runs"])
+        if not opts["all"]:
+            qs = qs.filter(packed_track__isnull=True)
+
+        runs = points = size = skipped = 0
+        for run_id in qs.values_list("id", flat=True).iterator():
+            try:
+                track = packed_track.compact_run(run_id, compress=not opts["no_compress"])
+            except packed_track.PackError as e:
+                skipped += 1
+                self.stdout.write(f"run {run_id}: skipped, {e}")
+                continue
+            runs += 1
+            points += track.points
+            size += len(track.data)
+
+        per_point = size / points if points else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"compacted {runs} runs, {points} points, {size} bytes ({per_point:.2f} B/point), skipped {skipped}"
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app_run import conditional, stats
+from app_run.models import AthleteStats
+
+
+class Command(BaseCommand):
+    help = "Пересобирает AthleteStats по завершённым забегам."
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            AthleteStats.objects.all().delete()
+            rows = AthleteStats.objects.bulk_create(
+                (AthleteStats(**row) for row in stats.aggregate_finished_runs().iterator()),
+                batch_size=1000,
+            )
+            conditional.bump_on_commit(conditional.USERS)
+        self.stdout.write(self.style.SUCCESS(f"rebuilt stats for {len(rows)} athletes"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app_run import leaderboards
+
+
+class Command(BaseCommand):
+    help = "Пересобирает LeaderboardEntry по завершённым забегам и выданным предметам."
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            count = leaderboards.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"rebuilt {count} leaderboard entries"))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app_run import tracking
+from app_run.models import Run
+
+
+DISTANCE_EPS_KM = 1e-6
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает накопленные итоги треков по сырым точкам и исправляет расхождения."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--run", type=int, action="append", dest="runs",
+                            help="id забега, можно несколько раз")
+        parser.add_argument("--status", choices=[c[0] for c in Run.STATUS_CHOICES])
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        qs = Run.objects.order_by("id")
+        if opts["runs"]:
+            qs = qs.filter(id__in=opts["runs"])
+        if opts["status"]:
+            qs = qs.filter(status=opts["status"])
+
+        checked = drifted = 0
+        for run_id in qs.values_list("id", flat=True).iterator():
+            checked += 1
+            with transaction.atomic():
+                run = Run.objects.select_for_update().get(pk=run_id)
+                fresh = tracking.compute_totals(run_id)
+                changed = [f for f in Run.TRACK_FIELDS if not _same(getattr(run, f), fresh[f])]
+                for field in changed:
+                    setattr(run, field, fresh[field])
+                update_fields = list(changed)
+                if run.status == Run.STATUS_CHOICES[2][0]:
+                    distance, run_time_seconds = tracking.finalize(run)
+                    if run.distance != distance:
+                        run.distance = distance
+                        update_fields.append("distance")
+                    if run.run_time_seconds != run_time_seconds:
+                        run.run_time_seconds = run_time_seconds
+                        update_fields.append("run_time_seconds")
+                if not update_fields:
+                    continue
+                drifted += 1
+                self.stdout.write(f"run {run_id}: {', '.join(update_fields)}")
+                if not opts["dry_run"]:
+                    run.save(update_fields=update_fields)
+
+        verb = "would fix" if opts["dry_run"] else "fixed"
+        self.stdout.write(self.style.SUCCESS(f"checked {checked} runs, {verb} {drifted}"))
+
+
+def _same(stored, fresh):
+    if isinstance(stored, float) or isinstance(fresh, float):
+        return abs((stored or 0.0) - (fresh or 0.0)) < DISTANCE_EPS_KM
+    return stored == fresh
@@ -0,0 +1,52 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+
+from app_run import backfill, importing, packed_track
+
+
+class Command(BaseCommand):
+    help = (
+        "Воркер фонового импорта: разбирает очередь ImportJob, а когда она пуста — "
+        "выдаёт новые предметы по уже записанным точкам (app_run.backfill) и упаковывает "
+        "треки завершённых забегов (app_run.packed_track)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="обработать очередь и выйти")
+        parser.add_argument("--poll-interval", type=float, default=2.0)
+        parser.add_argument("--chunk-size", type=int, default=importing.IMPORT_CHUNK_SIZE)
+        parser.add_argument("--stale-after", type=int, default=600,
+                            help="через сколько секунд без heartbeat воркера running-задача возвращается в очередь")
+
+    def handle(self, *args, **opts):
+        stale_after = datetime.timedelta(seconds=opts["stale_after"])
+        heartbeat = min(importing.HEARTBEAT_SECONDS, opts["stale_after"] / 3)
+        while True:
+            requeued = importing.requeue_stale(stale_after)
+            if requeued:
+                self.stdout.write(f"requeued {requeued} stale jobs")
+
+            job = importing.claim_next_job()
+            if job is None:
+                # предметы из синхронных загрузок и только что разобранных задач
+                result = backfill.run_pending()
+                if result.items:
+                    self.stdout.write(
+                        f"backfill: {result.items} items, {result.positions} positions, {result.awards} awarded"
+                    )
+                runs, points = packed_track.compact_pending()
+                if runs:
+                    self.stdout.write(f"packed {runs} tracks, {points} points")
+                if opts["once"]:
+                    return
+                time.sleep(opts["poll_interval"])
+                continue
+
+            self.stdout.write(f"job {job.id}: started")
+            job = importing.run_job(job, chunk_size=opts["chunk_size"], heartbeat=heartbeat)
+            self.stdout.write(
+                f"job {job.id}: {job.status}, {job.rows_processed} rows, "
+                f"{job.rows_inserted} inserted, {job.invalid_count} invalid"
+            )
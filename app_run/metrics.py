@@ -0,0 +1,228 @@
+"""
+Метрики запросов: латентность по маршрутам, число и время SQL, размер ответа.
+
+MetricsMiddleware (первая в MIDDLEWARE) меряет каждый запрос и складывает
+числа в реестр процесса; /api/metrics/ отдаёт их в текстовом формате
+Prometheus. Реестр свой у каждого процесса — Prometheus опрашивает воркеры
+по отдельности.
+
+SQL считается обёрткой из connection.execute_wrappers, которую
+signals.py вешает на каждое новое подключение. Сборщик текущего запроса
+лежит в ContextVar, поэтому запросы из sync_to_async-потоков async-вьюх
+попадают в свой HTTP-запрос. Вне HTTP-запроса обёртка только проверяет
+ContextVar.
+
+Лог медленных запросов включается настройкой METRICS_SLOW_REQUEST_MS:
+запросы дольше порога пишутся в логгер app_run.metrics вместе с самыми
+дорогими SQL. Тексты SQL копятся только при включённом логе.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+logger = logging.getLogger("app_run.metrics")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_LOG_TOP_SQL = 5
+UNMATCHED = "<unmatched>"
+
+_current = contextvars.ContextVar("app_run_metrics_request", default=None)
+
+
+class _RequestStats:
+    __slots__ = ("queries", "sql_seconds", "statements")
+
+    def __init__(self, keep_statements):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = [] if keep_statements else None
+
+
+def record_sql(execute, sql, params, many, context):
+    """Обёртка для connection.execute_wrappers."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.sql_seconds += elapsed
+        if stats.statements is not None:
+            stats.statements.append((sql, elapsed))
+
+
+def install_sql_wrapper(connection):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+class _Route:
+    __slots__ = ("buckets", "count", "seconds", "queries", "sql_seconds", "bytes", "statuses")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.bytes = 0
+        self.statuses = defaultdict(int)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(_Route)
+
+    def observe(self, method, route, status_code, seconds, queries, sql_seconds, size):
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            r = self._routes[(method, route)]
+            r.buckets[bucket] += 1
+            r.count += 1
+            r.seconds += seconds
+            r.queries += queries
+            r.sql_seconds += sql_seconds
+            r.bytes += size
+            r.statuses[status_code] += 1
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        """Текстовый формат Prometheus 0.0.4."""
+        with self._lock:
+            routes = sorted(
+                (key, r.buckets[:], r.count, r.seconds, r.queries, r.sql_seconds, r.bytes, sorted(r.statuses.items()))
+                for key, r in self._routes.items()
+            )
+        out = []
+        _header(out, "http_request_duration_seconds", "histogram", "Request latency by route.")
+        for (method, route), buckets, count, seconds, *_ in routes:
+            labels = _labels(method=method, route=route)
+            cumulative = 0
+            for le, n in zip((*BUCKETS, "+Inf"), buckets):
+                cumulative += n
+                out.append(f'http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            out.append(f"http_request_duration_seconds_sum{{{labels}}} {seconds!r}")
+            out.append(f"http_request_duration_seconds_count{{{labels}}} {count}")
+
+        _header(out, "http_responses_total", "counter", "Responses by route and status code.")
+        for (method, route), *_, statuses in routes:
+            for code, n in statuses:
+                out.append(f'http_responses_total{{{_labels(method=method, route=route, status=code)}}} {n}')
+
+        sums = (
+            ("http_request_db_queries_total", 4, "SQL queries executed while serving the route."),
+            ("http_request_db_seconds_total", 5, "Time spent in SQL while serving the route."),
+            ("http_response_bytes_total", 6, "Response body bytes (streaming: Content-Length if set)."),
+        )
+        for name, column, text in sums:
+            _header(out, name, "counter", text)
+            for row in routes:
+                method, route = row[0]
+                out.append(f"{name}{{{_labels(method=method, route=route)}}} {row[column]!r}")
+        return "\n".join(out) + "\n"
+
+
+def _header(out, name, kind, text):
+    out.append(f"# HELP {name} {text}")
+    out.append(f"# TYPE {name} {kind}")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+registry = Registry()
+
+
+def _route(request):
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None and match.route else UNMATCHED
+
+
+def _size(response):
+    if response.streaming:
+        return int(response.get("Content-Length") or 0)
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, started)
+        return response
+
+    @staticmethod
+    def _start():
+        stats = _RequestStats(keep_statements=_slow_threshold() is not None)
+        return stats, _current.set(stats), time.perf_counter()
+
+    @staticmethod
+    def _finish(request, response, stats, started):
+        elapsed = time.perf_counter() - started
+        route = _route(request)
+        registry.observe(
+            request.method, route, response.status_code, elapsed, stats.queries, stats.sql_seconds, _size(response)
+        )
+        threshold = _slow_threshold()
+        if threshold is not None and elapsed * 1000 >= threshold:
+            _log_slow(request, route, response, elapsed, stats)
+
+
+def _slow_threshold():
+    return getattr(settings, "METRICS_SLOW_REQUEST_MS", None)
+
+
+def _log_slow(request, route, response, elapsed, stats):
+    by_sql = defaultdict(lambda: [0, 0.0])
+    for sql, seconds in stats.statements or ():
+        by_sql[sql][0] += 1
+        by_sql[sql][1] += seconds
+    top = sorted(by_sql.items(), key=lambda item: item[1][1], reverse=True)[:SLOW_LOG_TOP_SQL]
+    lines = [
+        f"slow request {request.method} {request.get_full_path()} (route {route}) -> {response.status_code}: "
+        f"{elapsed * 1000:.1f} ms, {stats.queries} queries, {stats.sql_seconds * 1000:.1f} ms in SQL"
+    ]
+    lines += [f"  {seconds * 1000:8.1f} ms x{n:<4} {sql}" for sql, (n, seconds) in top]
+    logger.warning("\n".join(lines))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 03:28
+
+from django.db import migrations, models
+
+from app_run.geo import grid_cell
+
+
+def fill_grid_cells(apps, schema_editor):
+    CollectibleItem = apps.get_model('app_run', 'CollectibleItem')
+    items = list(CollectibleItem.objects.only('id', 'latitude', 'longitude'))
+    for item in items:
+        item.grid_cell = grid_cell(item.latitude, item.longitude)
+    CollectibleItem.objects.bulk_update(items, ['grid_cell'], batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0010_position_date_time_run_run_time_seconds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collectibleitem',
+            name='grid_cell',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_grid_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2 on 2026-10-18 03:31
+
+from django.db import migrations, models
+from django.db.models import F
+from haversine import haversine, Unit
+
+
+def fill_track_totals(apps, schema_editor):
+    # только для идущих забегов: остановка теперь опирается на итоги.
+    # завершённые досчитываются командой reconcile_runs.
+    Run = apps.get_model('app_run', 'Run')
+    Position = apps.get_model('app_run', 'Position')
+    for run in Run.objects.filter(status='in_progress'):
+        rows = (Position.objects.filter(run_id=run.pk)
+                .order_by(F('date_time').asc(nulls_first=True), 'id')
+                .values_list('latitude', 'longitude', 'date_time'))
+        prev = None
+        for lat, lon, dt in rows.iterator(chunk_size=2000):
+            if prev is not None:
+                run.track_distance += haversine(
+                    (float(prev[0]), float(prev[1])), (float(lat), float(lon)), unit=Unit.KILOMETERS)
+            prev = (lat, lon)
+            if dt is not None:
+                run.first_date_time = run.first_date_time or dt
+                run.last_date_time = dt
+        if prev is not None:
+            run.last_latitude, run.last_longitude = prev
+        run.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0011_collectibleitem_grid_cell'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='first_date_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='last_date_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='last_latitude',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='last_longitude',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='track_distance',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='position',
+            index=models.Index(fields=['run', 'date_time'], name='app_run_pos_run_id_c8a227_idx'),
+        ),
+        migrations.RunPython(fill_track_totals, migrations.RunPython.noop),
+    ]
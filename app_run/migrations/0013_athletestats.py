@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 03:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_athlete_stats(apps, schema_editor):
+    Run = apps.get_model('app_run', 'Run')
+    AthleteStats = apps.get_model('app_run', 'AthleteStats')
+    rows = (Run.objects.filter(status='finished').values('athlete_id')
+            .annotate(runs_finished=Count('id'),
+                      total_distance=Coalesce(Sum('distance'), 0.0),
+                      total_seconds=Coalesce(Sum('run_time_seconds'), 0),
+                      last_run_at=Coalesce(Max('last_date_time'), Max('created_at')))
+            .order_by())
+    AthleteStats.objects.bulk_create([AthleteStats(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0012_run_track_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AthleteStats',
+            fields=[
+                ('athlete', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='athlete_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('runs_finished', models.IntegerField(default=0)),
+                ('total_distance', models.FloatField(default=0.0)),
+                ('total_seconds', models.BigIntegerField(default=0)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(fill_athlete_stats, migrations.RunPython.noop),
+    ]
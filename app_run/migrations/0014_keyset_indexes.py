@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 03:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0013_athletestats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='challenge',
+            index=models.Index(fields=['created_at', 'id'], name='app_run_cha_created_b8e59d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='run',
+            index=models.Index(fields=['created_at', 'id'], name='app_run_run_created_dedccc_idx'),
+        ),
+    ]
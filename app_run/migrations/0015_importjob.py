@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 03:38
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0014_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], db_index=True, default='queued', max_length=16)),
+                ('file_name', models.CharField(blank=True, default='', max_length=255)),
+                ('payload', models.BinaryField(blank=True, null=True)),
+                ('rows_processed', models.IntegerField(default=0)),
+                ('rows_inserted', models.IntegerField(default=0)),
+                ('invalid_count', models.IntegerField(default=0)),
+                ('invalid_rows', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
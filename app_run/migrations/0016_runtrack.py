@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 03:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0015_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunTrack',
+            fields=[
+                ('run', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='packed_track', serialize=False, to='app_run.run')),
+                ('points', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
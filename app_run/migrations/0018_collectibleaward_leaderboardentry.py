@@ -0,0 +1,65 @@
+# Generated by Django 5.2 on 2026-10-18 03:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0017_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # таблица M2M уже есть — переводим её в явную through-модель только в состоянии
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='CollectibleAward',
+                    fields=[
+                        ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                        ('collectibleitem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app_run.collectibleitem')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'app_run_collectibleitem_athletes',
+                        'unique_together': {('collectibleitem', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='collectibleitem',
+                    name='athletes',
+                    field=models.ManyToManyField(blank=True, related_name='items', through='app_run.CollectibleAward', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        # сначала без default, чтобы уже выданные остались с NULL, а не с датой миграции
+        migrations.AddField(
+            model_name='collectibleaward',
+            name='awarded_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='collectibleaward',
+            name='awarded_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('distance', 'distance'), ('runs', 'runs'), ('collectibles', 'collectibles')], max_length=16)),
+                ('period', models.CharField(choices=[('week', 'week'), ('month', 'month'), ('all', 'all')], max_length=8)),
+                ('bucket', models.DateField()),
+                ('value', models.FloatField(default=0.0)),
+                ('athlete', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['metric', 'period', 'bucket', '-value', 'athlete'], name='app_run_lea_metric_a809cc_idx')],
+                'unique_together': {('metric', 'period', 'bucket', 'athlete')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 03:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0018_collectibleaward_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunSplit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('distance', models.FloatField()),
+                ('elapsed_seconds', models.FloatField()),
+                ('moving_seconds', models.FloatField()),
+                ('pace', models.FloatField(blank=True, null=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='splits', to='app_run.run')),
+            ],
+            options={
+                'ordering': ['run', 'index'],
+                'unique_together': {('run', 'index')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 04:09
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_existing_backfilled(apps, schema_editor):
+    # существующие предметы уже выдавались при POST точек; полный проход по
+    # истории для них — явно, командой backfill_collectibles --all
+    CollectibleItem = apps.get_model('app_run', 'CollectibleItem')
+    CollectibleItem.objects.update(backfilled_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0019_runsplit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collectibleitem',
+            name='backfilled_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_existing_backfilled, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 04:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0020_collectibleitem_backfilled_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='lease',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
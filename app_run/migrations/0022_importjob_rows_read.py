@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 04:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_run', '0021_importjob_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_read',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,5 +1,9 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .geo import grid_cell
 
 # Create your models here.
 class Run(models.Model):
@@ -14,6 +18,27 @@ class Run(models.Model):
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='init')
     distance = models.FloatField(null=True, blank=True)
     run_time_seconds = models.IntegerField(null=True, blank=True, default=None)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # накопительные итоги по треку, обновляются при приёме точек (app_run.tracking)
+    TRACK_FIELDS = (
+        "track_distance", "first_date_time", "last_date_time", "last_latitude", "last_longitude",
+    )
+    track_distance = models.FloatField(default=0.0)
+    first_date_time = models.DateTimeField(null=True, blank=True)
+    last_date_time = models.DateTimeField(null=True, blank=True)
+    last_latitude = models.DecimalField(max_digits=8, decimal_places=4, null=True, blank=True)
+    last_longitude = models.DecimalField(max_digits=9, decimal_places=4, null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["created_at", "id"])]
+
+    def save(self, *args, **kwargs):
+        # auto_now не срабатывает, если updated_at не попал в update_fields
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "updated_at"}
+        super().save(*args, **kwargs)
 
 
 class AthleteInfo(models.Model):
@@ -27,6 +52,21 @@ class AthleteInfo(models.Model):
     weight = models.IntegerField(null=True, blank=True)
 
 
+class AthleteStats(models.Model):
+    """Итоги по завершённым забегам атлета, обновляются при остановке забега."""
+    athlete = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="athlete_stats",
+    )
+    runs_finished = models.IntegerField(default=0)
+    total_distance = models.FloatField(default=0.0)
+    total_seconds = models.BigIntegerField(default=0)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
 class Challenge(models.Model):
     full_name = models.CharField(max_length=255)
     athlete = models.ForeignKey(
@@ -36,6 +76,7 @@ class Challenge(models.Model):
 
     class Meta:
         unique_together = (("athlete", "full_name"),)
+        indexes = [models.Index(fields=["created_at", "id"])]
 
 
 class Position(models.Model):
@@ -45,6 +86,31 @@ class Position(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     date_time = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["run", "date_time"])]
+
+
+class RunTrack(models.Model):
+    """Упакованный трек завершённого забега (app_run.packed_track) для быстрого чтения."""
+    run = models.OneToOneField(Run, on_delete=models.CASCADE, primary_key=True, related_name="packed_track")
+    points = models.IntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class RunSplit(models.Model):
+    """Отрезок забега длиной SPLIT_KM (последний — остаток), считается при первом чтении (app_run.splits)."""
+    run = models.ForeignKey(Run, on_delete=models.CASCADE, related_name="splits")
+    index = models.PositiveIntegerField()
+    distance = models.FloatField()
+    elapsed_seconds = models.FloatField()
+    moving_seconds = models.FloatField()
+    pace = models.FloatField(null=True, blank=True)  # секунд на км по elapsed_seconds
+
+    class Meta:
+        unique_together = (("run", "index"),)
+        ordering = ["run", "index"]
+
 
 class CollectibleItem(models.Model):
     name = models.CharField(max_length=255)
@@ -55,6 +121,87 @@ class CollectibleItem(models.Model):
     value = models.IntegerField()
     athletes = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
+        through='CollectibleAward',
         related_name='items',
         blank=True
     )
+    # ячейка сетки app_run.geo — заполняется в save(), для bulk_create вручную
+    grid_cell = models.IntegerField(null=True, blank=True, editable=False, db_index=True)
+    # когда предмет выдан по историческим точкам (app_run.backfill); NULL — ещё не выдан
+    backfilled_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.fill_grid_cell()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "grid_cell"}
+        super().save(*args, **kwargs)
+
+    def fill_grid_cell(self):
+        if self.latitude is not None and self.longitude is not None:
+            self.grid_cell = grid_cell(self.latitude, self.longitude)
+
+
+class CollectibleAward(models.Model):
+    """Связь предмет—атлет (таблица прежнего auto-created M2M) с моментом выдачи."""
+    id = models.BigAutoField(primary_key=True)
+    collectibleitem = models.ForeignKey(CollectibleItem, on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # у выданных до появления поля — NULL, они идут только в общий зачёт
+    awarded_at = models.DateTimeField(null=True, blank=True, default=timezone.now, editable=False)
+
+    class Meta:
+        db_table = "app_run_collectibleitem_athletes"
+        unique_together = (("collectibleitem", "user"),)
+
+
+class LeaderboardEntry(models.Model):
+    """Значение метрики атлета за период (app_run.leaderboards), копится инкрементально."""
+    METRIC_CHOICES = [
+        ("distance", "distance"),
+        ("runs", "runs"),
+        ("collectibles", "collectibles"),
+    ]
+    PERIOD_CHOICES = [
+        ("week", "week"),
+        ("month", "month"),
+        ("all", "all"),
+    ]
+    metric = models.CharField(max_length=16, choices=METRIC_CHOICES)
+    period = models.CharField(max_length=8, choices=PERIOD_CHOICES)
+    # начало периода; для "all" — date.min
+    bucket = models.DateField()
+    athlete = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="leaderboard_entries"
+    )
+    value = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = (("metric", "period", "bucket", "athlete"),)
+        indexes = [models.Index(fields=["metric", "period", "bucket", "-value", "athlete"])]
+
+
+class ImportJob(models.Model):
+    """Фоновый импорт xlsx; очередь — сама таблица, разбирает run_import_worker."""
+    STATUS_CHOICES = [
+        ("queued", "queued"),
+        ("running", "running"),
+        ("done", "done"),
+        ("failed", "failed"),
+    ]
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="queued", db_index=True)
+    file_name = models.CharField(max_length=255, blank=True, default="")
+    payload = models.BinaryField(null=True, blank=True)
+    # строк данных (после заголовка) в закоммиченных пачках — отсюда продолжает следующий воркер
+    rows_read = models.IntegerField(default=0, editable=False)
+    rows_processed = models.IntegerField(default=0)
+    rows_inserted = models.IntegerField(default=0)
+    invalid_count = models.IntegerField(default=0)
+    invalid_rows = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    # выдаётся при захвате; записи воркера в задачу идут только со своим lease (app_run.importing)
+    lease = models.CharField(max_length=32, blank=True, default="", editable=False)
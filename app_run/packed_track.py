@@ -0,0 +1,179 @@
+"""
+Упакованное хранение треков завершённых забегов (RunTrack).
+
+Формат: заголовок struct "<4sBBxxI" (magic, версия, флаги, число точек), за ним
+пять колонок array в little-endian, каждая — дельты от предыдущего значения:
+  id          int64
+  latitude    int32, микроградусы
+  longitude   int32, микроградусы
+  date_time   int64, микросекунды от эпохи
+  created_at  int64, микросекунды от эпохи
+Флаг FLAG_ZLIB — колонки сжаты zlib. Время хранится в микросекундах, а не в
+миллисекундах: API отдаёт date_time/created_at с микросекундами, и ответ из
+упакованного трека должен совпадать с ответом из строк Position.
+
+Строки Position остаются в БД (по ним работают метрики, удаление точек и т.п.),
+RunTrack — read-копия: список точек завершённого забега читается одним
+запросом и декодируется без создания моделей. Упаковка читает весь трек,
+поэтому в запрос остановки она не входит: завершённые забеги без RunTrack
+упаковывает воркер (run_import_worker, compact_pending в паузах очереди)
+или команда compact_tracks. До упаковки список точек читается из строк.
+"""
+import datetime
+import logging
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+
+from .models import Position, Run, RunTrack
+from .serializers import DATETIME_FMT
+
+
+MAGIC = b"RTRK"
+VERSION = 1
+FLAG_ZLIB = 1
+
+_HEADER = struct.Struct("<4sBBxxI")
+_COLUMNS = (("id", "q"), ("latitude", "i"), ("longitude", "i"), ("date_time", "q"), ("created_at", "q"))
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_US = datetime.timedelta(microseconds=1)
+
+logger = logging.getLogger("app_run.packed_track")
+
+
+class PackError(ValueError):
+    pass
+
+
+def _deltas(values):
+    prev, out = 0, []
+    for v in values:
+        out.append(v - prev)
+        prev = v
+    return out
+
+
+def _to_us(dt):
+    return (dt - _EPOCH) // _US
+
+
+def pack(rows, compress=True):
+    """rows — (id, latitude, longitude, date_time, created_at) в порядке id."""
+    cols = [[] for _ in _COLUMNS]
+    for pk, lat, lon, dt, created in rows:
+        if dt is None:
+            raise PackError(f"position {pk} has no date_time")
+        cols[0].append(pk)
+        cols[1].append(int(lat * 1_000_000))
+        cols[2].append(int(lon * 1_000_000))
+        cols[3].append(_to_us(dt))
+        cols[4].append(_to_us(created))
+
+    body = bytearray()
+    for (_, code), values in zip(_COLUMNS, cols):
+        arr = array(code, _deltas(values))
+        if sys.byteorder == "big":
+            arr.byteswap()
+        body += arr.tobytes()
+    flags = 0
+    if compress:
+        body, flags = zlib.compress(bytes(body), 6), FLAG_ZLIB
+    return _HEADER.pack(MAGIC, VERSION, flags, len(cols[0])) + bytes(body)
+
+
+def unpack(data):
+    """Словарь колонок с абсолютными значениями (целые числа)."""
+    data = bytes(data)
+    magic, version, flags, n = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise PackError("unknown packed track format")
+    body = data[_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+
+    columns, offset = {}, 0
+    for name, code in _COLUMNS:
+        arr = array(code)
+        size = arr.itemsize * n
+        arr.frombytes(body[offset:offset + size])
+        if sys.byteorder == "big":
+            arr.byteswap()
+        columns[name] = list(accumulate(arr))
+        offset += size
+    return columns
+
+
+def _degrees(micro):
+    # координаты хранятся с 4 знаками, как DecimalField(decimal_places=4)
+    ten_thousandths = micro // 100
+    sign = "-" if ten_thousandths < 0 else ""
+    whole, frac = divmod(abs(ten_thousandths), 10_000)
+    return f"{sign}{whole}.{frac:04d}"
+
+
+def _iso(us):
+    # как DRF DateTimeField без format: isoformat() с Z вместо +00:00
+    value = (_EPOCH + us * _US).isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+
+def serialized_positions(run_id, data):
+    """То же, что PositionSerializer(many=True).data для точек забега в порядке id."""
+    c = unpack(data)
+    return [
+        {
+            "id": pk,
+            "run": run_id,
+            "latitude": _degrees(lat),
+            "longitude": _degrees(lon),
+            "created_at": _iso(created),
+            "date_time": (_EPOCH + dt * _US).strftime(DATETIME_FMT),
+        }
+        for pk, lat, lon, dt, created in zip(
+            c["id"], c["latitude"], c["longitude"], c["date_time"], c["created_at"]
+        )
+    ]
+
+
+def compact_run(run_id, compress=True):
+    rows = (
+        Position.objects
+        .filter(run_id=run_id)
+        .order_by("id")
+        .values_list("id", "latitude", "longitude", "date_time", "created_at")
+    )
+    rows = list(rows.iterator(chunk_size=5000))
+    track, _ = RunTrack.objects.update_or_create(
+        run_id=run_id, defaults={"points": len(rows), "data": pack(rows, compress)}
+    )
+    return track
+
+
+def pending_runs():
+    """
+    Завершённые забеги без RunTrack. Забеги с точками без date_time не
+    упаковываются (PackError) и сюда не попадают, чтобы воркер не повторял их
+    на каждом проходе.
+    """
+    return (
+        Run.objects
+        .filter(status=Run.STATUS_CHOICES[2][0], packed_track__isnull=True)
+        .exclude(id__in=Position.objects.filter(date_time__isnull=True).values("run_id"))
+    )
+
+
+def compact_pending(limit=100):
+    """Упаковывает до limit забегов из pending_runs(); возвращает (забегов, точек)."""
+    runs = points = 0
+    for run_id in pending_runs().order_by("id").values_list("id", flat=True)[:limit]:
+        try:
+            track = compact_run(run_id)
+        except PackError as e:
+            # точку без date_time записали после выборки — следующий проход забег пропустит
+            logger.warning("run %s: track not packed, %s", run_id, e)
+            continue
+        runs += 1
+        points += track.points
+    return runs, points
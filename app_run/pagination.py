@@ -0,0 +1,131 @@
+import base64
+import datetime
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PagePagination(PageNumberPagination):
+    page_size = 5
+    page_size_query_param = 'size'
+    max_page_size = 50
+
+class OptionalPagePagination(PageNumberPagination):
+    page_size = None
+    page_size_query_param = 'size'
+    max_page_size = 50
+
+    def get_page_size(self, request):
+        if self.page_size_query_param in request.query_params:
+            try:
+                return self._get_size_from_query(request)
+            except ValueError:
+                return None
+        return None
+
+    def _get_size_from_query(self, request):
+        raw = request.query_params[self.page_size_query_param]
+        size = int(raw)
+        if size <= 0:
+            raise ValueError("size must be positive")
+        if self.max_page_size:
+            size = min(size, self.max_page_size)
+        return size
+
+
+
+
+class KeysetPagination(OptionalPagePagination):
+    """
+    Keyset (cursor) пагинация, включается параметром ?cursor= (пустой — первая
+    страница). Страница выбирается условием по ключу keyset_fields, а не OFFSET,
+    поэтому глубокие страницы стоят столько же, сколько первая. Без ?cursor=
+    работает как OptionalPagePagination, если offset_fallback, иначе без пагинации.
+    Поля ключа — NOT NULL даты или числа, последнее уникально (id).
+    """
+    cursor_query_param = "cursor"
+    keyset_fields = ("created_at", "id")
+    keyset_page_size = 100
+    keyset_max_page_size = 1000
+    offset_fallback = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            if not self.offset_fallback:
+                return None
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        size = self._keyset_size(request)
+        queryset = queryset.order_by(*self.keyset_fields)
+        raw = request.query_params[self.cursor_query_param]
+        if raw:
+            queryset = queryset.filter(self._after(self._decode(raw)))
+
+        rows = list(queryset[:size + 1])
+        self.next_key = None
+        if len(rows) > size:
+            rows = rows[:size]
+            last = rows[-1]
+            # строки бывают и словарями .values() (fastlist)
+            get = last.get if isinstance(last, dict) else lambda name: getattr(last, name)
+            self.next_key = [get(f.lstrip("-")) for f in self.keyset_fields]
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_key is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self._encode(self.next_key))
+
+    def _keyset_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.keyset_page_size))
+        except ValueError:
+            size = self.keyset_page_size
+        if size <= 0:
+            size = self.keyset_page_size
+        return min(size, self.keyset_max_page_size)
+
+    def _after(self, values):
+        """
+        Условие «строго после values» в порядке keyset_fields. Лишняя граница по
+        первому полю (>= / <=) нужна, чтобы БД начинала с позиции в индексе,
+        а не сканировала его от начала.
+        """
+        condition, equal = Q(pk__in=[]), Q()
+        for field, value in zip(self.keyset_fields, values):
+            name, op = field.lstrip("-"), "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{op}": value})
+            equal &= Q(**{name: value})
+        first = self.keyset_fields[0]
+        bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+        return bound & condition
+
+    def _encode(self, values):
+        payload = [v.isoformat() if isinstance(v, datetime.datetime) else v for v in values]
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def _decode(self, raw):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(raw.encode()))
+            if not isinstance(payload, list) or len(payload) != len(self.keyset_fields):
+                raise ValueError
+            return [
+                datetime.datetime.fromisoformat(v) if isinstance(v, str) else v
+                for v in payload
+            ]
+        except (ValueError, TypeError):
+            raise NotFound("Invalid cursor")
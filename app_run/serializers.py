@@ -1,6 +1,9 @@
 import datetime
+import functools
+from decimal import Decimal, InvalidOperation
 from rest_framework import serializers
-from .models import Challenge, Position, Run, AthleteInfo, CollectibleItem
+from rest_framework.validators import UniqueValidator
+from .models import Challenge, Position, Run, RunSplit, AthleteInfo, CollectibleItem, ImportJob
 from django.contrib.auth.models import User
 from datetime import timezone as dt_timezone
 
@@ -18,7 +21,13 @@ class RunSerializer(serializers.ModelSerializer):
     athlete_data = UserSerializerInner(source='athlete', read_only=True)
     class Meta:
         model = Run
-        fields = '__all__'
+        exclude = (*Run.TRACK_FIELDS, 'updated_at')
+
+
+class RunSplitSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RunSplit
+        fields = ('index', 'distance', 'elapsed_seconds', 'moving_seconds', 'pace')
 
 
 class CollectibleItemSerializer(serializers.ModelSerializer):
@@ -64,7 +73,8 @@ class UserDetailSerializer(serializers.ModelSerializer):
         annotated = getattr(obj, "runs_finished", None)
         if annotated is not None:
             return annotated
-        return obj.runs.filter(status="finished").count()
+        athlete_stats = getattr(obj, "athlete_stats", None)
+        return athlete_stats.runs_finished if athlete_stats else 0
 
 
 class AthleteInfoSerializer(serializers.ModelSerializer):
@@ -90,6 +100,16 @@ class ChallengeSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = (
+            "id", "status", "file_name", "rows_processed", "rows_inserted", "invalid_count",
+            "error", "created_at", "started_at", "finished_at",
+        )
+        read_only_fields = fields
+
+
 class PositionSerializer(serializers.ModelSerializer):
     date_time = serializers.DateTimeField(
         input_formats=[DATETIME_FMT],
@@ -140,3 +160,78 @@ class PositionSerializer(serializers.ModelSerializer):
                 dt = dt.astimezone(dt_timezone.utc)
 
         return dt
+
+
+_POINT_RANGES = (("latitude", 90), ("longitude", 180))
+
+
+def validate_position_point(raw):
+    """
+    Облегчённая проверка одной точки для пакетной загрузки — без создания
+    PositionSerializer на каждую точку. Правила и тексты ошибок те же.
+    Возвращает (attrs, errors), ровно одно из них не None.
+    """
+    if not isinstance(raw, dict):
+        return None, {"non_field_errors": ["Expected an object."]}
+
+    attrs, errors = {}, {}
+    for field, bound in _POINT_RANGES:
+        value = raw.get(field)
+        if value is None or isinstance(value, bool):
+            errors[field] = ["This field is required."]
+            continue
+        try:
+            dec = Decimal(str(value).strip())
+        except InvalidOperation:
+            errors[field] = ["A valid number is required."]
+            continue
+        if not dec.is_finite():
+            errors[field] = ["A valid number is required."]
+        elif dec.as_tuple().exponent < -4:
+            errors[field] = ["Ensure that there are no more than 4 decimal places."]
+        elif dec < -bound or dec > bound:
+            errors[field] = [f"{field} must be in [-{bound}.0, {bound}.0]"]
+        else:
+            attrs[field] = dec
+
+    value = raw.get("date_time")
+    try:
+        dt = datetime.datetime.strptime(value, DATETIME_FMT)
+    except (TypeError, ValueError):
+        errors["date_time"] = [
+            f"date_time must match format {DATETIME_FMT} (e.g. 2024-10-12T14:30:15.123456)"
+        ]
+    else:
+        attrs["date_time"] = dt.replace(tzinfo=dt_timezone.utc)
+
+    if errors:
+        return None, errors
+    return attrs, None
+
+
+@functools.lru_cache(maxsize=None)
+def _collectible_row_validator():
+    serializer = CollectibleItemSerializer()
+    fields = {name: f for name, f in serializer.fields.items() if not f.read_only}
+    # уникальность uid импорт проверяет сам, одним запросом на пачку строк
+    fields["uid"].validators = [
+        v for v in fields["uid"].validators if not isinstance(v, UniqueValidator)
+    ]
+    return serializer, fields
+
+
+def validate_collectible_row(data):
+    """
+    Проверка строки импорта по правилам CollectibleItemSerializer, но без
+    сериализатора на строку и без запроса в БД. None — строка невалидна.
+    """
+    serializer, fields = _collectible_row_validator()
+    attrs = {}
+    try:
+        for name, field in fields.items():
+            value = field.run_validation(data.get(name))
+            validate_field = getattr(serializer, f"validate_{name}", None)
+            attrs[name] = validate_field(value) if validate_field else value
+    except serializers.ValidationError:
+        return None
+    return attrs
@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalogue, conditional, metrics
+from .models import Challenge, CollectibleItem, Run
+
+
+@receiver(post_save, sender=CollectibleItem)
+@receiver(post_delete, sender=CollectibleItem)
+def bump_catalogue_version(sender, **kwargs):
+    catalogue.bump_on_commit()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_users_version(sender, **kwargs):
+    # имена и роли пользователей входят в списки забегов и пользователей
+    conditional.bump_on_commit(conditional.USERS, conditional.RUNS)
+
+
+@receiver(post_save, sender=Run)
+@receiver(post_delete, sender=Run)
+def bump_runs_version(sender, update_fields=None, **kwargs):
+    # итоги трека (app_run.tracking) пишутся на каждую точку, но в список забегов не входят
+    if update_fields and set(update_fields) <= {*Run.TRACK_FIELDS, "updated_at"}:
+        return
+    conditional.bump_on_commit(conditional.RUNS)
+
+
+@receiver(post_save, sender=Challenge)
+@receiver(post_delete, sender=Challenge)
+def bump_challenges_version(sender, **kwargs):
+    conditional.bump_on_commit(conditional.CHALLENGES)
+
+
+@receiver(connection_created)
+def count_sql(sender, connection, **kwargs):
+    metrics.install_sql_wrapper(connection)
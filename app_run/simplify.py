@@ -0,0 +1,127 @@
+"""
+Упрощение трека для отрисовки на карте (Douglas-Peucker).
+
+Один проход DP считает для каждой точки «важность» — отклонение в метрах,
+при котором точка ещё остаётся в треке. Дальше любой допуск (tolerance_m)
+или лимит точек (max_points) — это просто отбор по важности, без повторного DP.
+Точки проецируются на локальную плоскость (равнопромежуточная проекция
+вокруг средней широты), для трека забега погрешность пренебрежимо мала.
+
+Упрощённые треки завершённых забегов кэшируются в общем для процессов кэше
+TRACK_CACHE; ключ включает версию трека, которую invalidate() сдвигает при
+удалении точек, — после удаления ни один воркер не отдаст старый трек.
+"""
+import hashlib
+import math
+import uuid
+
+from django.core.cache import caches
+from django.db import connection
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy опционален
+    np = None
+
+from .track_metrics import EARTH_RADIUS_KM
+
+
+_R_M = EARTH_RADIUS_KM * 1000.0
+CACHE_TTL = 60 * 60 * 24
+TRACK_CACHE = "tracks"
+
+
+def track_cache():
+    return caches[TRACK_CACHE]
+
+
+def _key(suffix):
+    # кэш общий и переживает пересоздание БД — привязываем ключи к ней, как catalogue._key
+    db = hashlib.md5(str(connection.settings_dict["NAME"]).encode()).hexdigest()[:8]
+    return f"track:{db}:{suffix}"
+
+
+def cache_key(run_id, tolerance_m, max_points):
+    version_key = _key(f"version:{run_id}")
+    version = track_cache().get(version_key)
+    if version is None:
+        # add, а не set: версию, выставленную invalidate() другого процесса, не затираем
+        track_cache().add(version_key, uuid.uuid4().hex, None)
+        version = track_cache().get(version_key)
+    return _key(f"simplified:{run_id}:{version}:{tolerance_m}:{max_points}")
+
+
+def invalidate(run_id):
+    # новый токен, а не incr: у файлового кэша incr — это get и set, не атомарно
+    track_cache().set(_key(f"version:{run_id}"), uuid.uuid4().hex, None)
+
+
+def _project(lat, lon):
+    if not len(lat):
+        return [], []
+    k = math.cos(math.radians(sum(lat) / len(lat)))
+    xs = [math.radians(lo) * _R_M * k for lo in lon]
+    ys = [math.radians(la) * _R_M for la in lat]
+    return xs, ys
+
+
+def importance(lat, lon):
+    """Важность каждой точки в метрах; концы трека — inf."""
+    n = len(lat)
+    xs, ys = _project(list(lat), list(lon))
+    imp = [0.0] * n
+    if n == 0:
+        return imp
+    imp[0] = imp[-1] = math.inf
+    farthest = _farthest_np if np is not None else _farthest_py
+    if np is not None:
+        xs, ys = np.asarray(xs), np.asarray(ys)
+
+    stack = [(0, n - 1, math.inf)]
+    while stack:
+        i, j, parent = stack.pop()
+        if j - i < 2:
+            continue
+        k, d = farthest(xs, ys, i, j)
+        # дочерняя точка не важнее родительской — иначе отбор по порогу разойдётся с DP
+        imp[k] = min(d, parent)
+        stack.append((i, k, imp[k]))
+        stack.append((k, j, imp[k]))
+    return imp
+
+
+def select(imp, tolerance_m=None, max_points=None):
+    """Индексы оставленных точек по возрастанию."""
+    keep = range(len(imp))
+    if tolerance_m is not None:
+        keep = [i for i in keep if imp[i] > tolerance_m]
+    if max_points is not None and len(keep) > max_points:
+        keep = sorted(sorted(keep, key=lambda i: imp[i], reverse=True)[:max_points])
+    return list(keep)
+
+
+def _farthest_py(xs, ys, i, j):
+    ax, ay, bx, by = xs[i], ys[i], xs[j], ys[j]
+    dx, dy = bx - ax, by - ay
+    seg2 = dx * dx + dy * dy
+    best_k, best_d = i + 1, -1.0
+    for k in range(i + 1, j):
+        px, py = xs[k] - ax, ys[k] - ay
+        t = (px * dx + py * dy) / seg2 if seg2 else 0.0
+        t = 0.0 if t < 0.0 else 1.0 if t > 1.0 else t
+        ex, ey = px - t * dx, py - t * dy
+        d = ex * ex + ey * ey
+        if d > best_d:
+            best_k, best_d = k, d
+    return best_k, math.sqrt(best_d)
+
+
+def _farthest_np(xs, ys, i, j):
+    ax, ay = xs[i], ys[i]
+    dx, dy = xs[j] - ax, ys[j] - ay
+    seg2 = dx * dx + dy * dy
+    px, py = xs[i + 1:j] - ax, ys[i + 1:j] - ay
+    t = np.clip((px * dx + py * dy) / seg2, 0.0, 1.0) if seg2 else 0.0
+    d = (px - t * dx) ** 2 + (py - t * dy) ** 2
+    k = int(d.argmax())
+    return i + 1 + k, math.sqrt(float(d[k]))
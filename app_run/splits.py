@@ -0,0 +1,109 @@
+"""
+Сплиты забега: отрезки по SPLIT_KM с темпом, временем в движении и общим.
+
+Трек читается тем же запросом, что и для метрик (track_metrics.load_track),
+длины сегментов считаются той же векторной haversine; сами сплиты — один
+проход по сегментам. Граница километра обычно лежит внутри сегмента, время
+в этой точке интерполируется линейно. Точки без date_time берут время
+предыдущей точки (в начале трека — первой известной).
+
+Остановку забега сплиты не задерживают: для завершённого забега они
+считаются и сохраняются в RunSplit при первом чтении (RunSplitsView).
+"""
+import math
+from typing import NamedTuple
+
+from .models import RunSplit
+from .track_metrics import load_track, segment_distances_km
+
+
+SPLIT_KM = 1.0
+# сегмент медленнее этого считается стоянкой (светофор, дрожание GPS на месте)
+MOVING_SPEED_KMH = 2.0
+
+
+class Split(NamedTuple):
+    index: int
+    distance: float
+    elapsed_seconds: float
+    moving_seconds: float
+
+    @property
+    def pace(self):
+        return self.elapsed_seconds / self.distance if self.distance > 0 else None
+
+
+def _filled_times(t):
+    known = next((x for x in t if not math.isnan(x)), None)
+    if known is None:
+        return [0.0] * len(t)
+    out = []
+    for x in t:
+        if not math.isnan(x):
+            known = x
+        out.append(known)
+    return out
+
+
+def compute_splits(lat, lon, t, split_km=SPLIT_KM):
+    seg = segment_distances_km(lat, lon)
+    seg = seg.tolist() if hasattr(seg, "tolist") else seg
+    t = _filled_times([float(x) for x in t])
+
+    splits = []
+    km_in = elapsed = moving = 0.0
+    for km, t0, t1 in zip(seg, t, t[1:]):
+        dt = t1 - t0
+        is_moving = dt > 0 and km / dt * 3600.0 >= MOVING_SPEED_KMH
+        while km_in + km >= split_km:
+            take = split_km - km_in
+            part = dt * take / km
+            elapsed += part
+            moving += part if is_moving else 0.0
+            splits.append(Split(len(splits) + 1, split_km, elapsed, moving))
+            km, dt = km - take, dt - part
+            km_in = elapsed = moving = 0.0
+        km_in += km
+        elapsed += dt
+        moving += dt if is_moving else 0.0
+    if km_in > 1e-9:
+        splits.append(Split(len(splits) + 1, km_in, elapsed, moving))
+    return splits
+
+
+def run_splits(run_id):
+    return compute_splits(*load_track(run_id))
+
+
+def build(run_id, splits):
+    """Несохранённые RunSplit с округлением, как в БД."""
+    return [
+        RunSplit(
+            run_id=run_id,
+            index=s.index,
+            distance=round(s.distance, 4),
+            elapsed_seconds=round(s.elapsed_seconds, 2),
+            moving_seconds=round(s.moving_seconds, 2),
+            pace=round(s.pace, 2) if s.pace is not None else None,
+        )
+        for s in splits
+    ]
+
+
+def store(run_id, splits):
+    """Заменяет сохранённые сплиты забега. Вызывать внутри transaction.atomic()."""
+    RunSplit.objects.filter(run_id=run_id).delete()
+    # первое чтение сплитов может прийти одновременно из двух запросов — строки у них одинаковые
+    return RunSplit.objects.bulk_create(build(run_id, splits), ignore_conflicts=True)
+
+
+def summary(splits):
+    """Итог по сплитам (Split или RunSplit): дистанция, время, самый быстрый полный км."""
+    full = [s for s in splits if s.distance >= SPLIT_KM and s.pace is not None]
+    fastest = min(full, key=lambda s: s.pace).index if full else None
+    return {
+        "distance": round(sum(s.distance for s in splits), 4),
+        "elapsed_seconds": round(sum(s.elapsed_seconds for s in splits), 2),
+        "moving_seconds": round(sum(s.moving_seconds for s in splits), 2),
+        "fastest_split": fastest,
+    }
@@ -0,0 +1,57 @@
+"""
+Материализованная статистика атлетов (AthleteStats).
+
+Строка обновляется атомарно при завершении забега; любые другие правки
+завершённых забегов (удаление, PUT) пересчитывают строку атлета целиком.
+runs_finished входит в список пользователей, поэтому каждая запись сдвигает
+его версию (conditional.USERS).
+"""
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from . import conditional
+from .models import AthleteStats, Run
+
+
+FINISHED = Run.STATUS_CHOICES[2][0]
+
+
+def record_finished_run(run):
+    """Учитывает только что завершённый run. Вызывать внутри transaction.atomic()."""
+    finished_at = run.last_date_time or timezone.now()
+    AthleteStats.objects.get_or_create(athlete_id=run.athlete_id)
+    AthleteStats.objects.filter(athlete_id=run.athlete_id).update(
+        runs_finished=F("runs_finished") + 1,
+        total_distance=F("total_distance") + (run.distance or 0.0),
+        total_seconds=F("total_seconds") + (run.run_time_seconds or 0),
+        last_run_at=Coalesce(Greatest(F("last_run_at"), Value(finished_at)), Value(finished_at)),
+        updated_at=timezone.now(),
+    )
+    conditional.bump_on_commit(conditional.USERS)
+
+
+def aggregate_finished_runs():
+    """Итоги по завершённым забегам, сгруппированные по атлету — эталон для rebuild."""
+    return (
+        Run.objects
+        .filter(status=FINISHED)
+        .values("athlete_id")
+        .annotate(
+            runs_finished=Count("id"),
+            total_distance=Coalesce(Sum("distance"), 0.0),
+            total_seconds=Coalesce(Sum("run_time_seconds"), 0),
+            last_run_at=Coalesce(Max("last_date_time"), Max("created_at")),
+        )
+        .order_by()
+    )
+
+
+def refresh_athlete(athlete_id):
+    conditional.bump_on_commit(conditional.USERS)
+    rows = list(aggregate_finished_runs().filter(athlete_id=athlete_id))
+    if not rows:
+        AthleteStats.objects.filter(athlete_id=athlete_id).delete()
+        return None
+    stats, _ = AthleteStats.objects.update_or_create(athlete_id=rows[0].pop("athlete_id"), defaults=rows[0])
+    return stats
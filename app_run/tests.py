@@ -1,3 +1,1751 @@
-from django.test import TestCase
+"""
+Тесты app_run.
 
-# Create your tests here.
+QueryBudgetTests — бюджеты SQL-запросов по маршрутам project_run/urls.py.
+Каждый маршрут вызывается на двух размерах данных: число запросов должно
+совпадать (не расти с числом строк) и не превышать бюджет. При провале
+в сообщении — SQL обоих прогонов, по нему видно, какой запрос размножился.
+
+Остальные классы — поведение по модулям: быстрые списки против
+сериализатора, гонки переходов статуса, выдача предметов по истории, буфер
+приёма точек, гео-сетка, итоги и метрики трека, упрощение и упаковка трека,
+выгрузки, условные GET, лидерборды, сплиты, async-вьюхи, live-лента,
+метрики, bench_suite, статистика, челленджи, keyset-пагинация и импорт.
+Гонки и фоновые потоки — в TransactionTestCase: потокам нужны закоммиченные
+строки, поэтому тестовая БД — файл (project_run/settings/local.py). Кэши на
+время тестов подменяются locmem (setUpModule), общие файловые кэши не трогаются.
+
+Запуск: python manage.py test app_run
+"""
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import types
+import zipfile
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, reset_queries, transaction
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils import timezone
+from geopy.distance import geodesic
+from haversine import haversine
+from openpyxl import Workbook
+
+from . import (
+    backfill, challenges, geo, importing, leaderboards, live, metrics, packed_track, simplify, splits, stats, track_metrics, tracking, transitions,
+    views,
+)
+from .fastlist import FastJSONRenderer
+from .management.commands import bench_suite
+from .management.commands._bench import percentile
+from .models import (
+    AthleteInfo, AthleteStats, Challenge, CollectibleAward, CollectibleItem, ImportJob, LeaderboardEntry, Position,
+    Run, RunSplit, RunTrack,
+)
+
+START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+POINTS_PER_RUN = 6
+STEP_DEG = 0.0005
+
+# тесты чистят кэши — поэтому свои locmem-кэши, а не файловые из settings под /tmp,
+# которыми пользуется dev-сервер на той же машине
+_test_caches = override_settings(CACHES={
+    alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"app_run-tests-{alias}"}
+    for alias in settings.CACHES
+})
+
+
+def setUpModule():
+    _test_caches.enable()
+
+
+def tearDownModule():
+    _test_caches.disable()
+
+
+class World:
+    """
+    Синтетические данные, которые можно наращивать.
+
+    grow() добавляет атлета со всем, что бывает у атлета, и заодно ещё по
+    забегу, точке трека и предмету у «главных» объектов (self.athlete,
+    self.run) — на них смотрят detail-маршруты.
+    """
+
+    def __init__(self):
+        self.units = 0
+        self._uid = itertools.count()
+        self.athlete = self._athlete()
+        self.run = self._run(self.athlete, "finished")
+        self.item = self._items(self.athlete, 1)[0]
+        self.challenge = Challenge.objects.create(full_name="Сделай 10 Забегов!", athlete=self.athlete)
+        self.job = ImportJob.objects.create(status="done", file_name="items.xlsx", invalid_rows=[])
+
+    def grow(self, units=1):
+        for _ in range(units):
+            self.units += 1
+            athlete = self._athlete()
+            self._run(athlete, "finished")
+            self._run(athlete, "in_progress")
+            self._run(athlete, "init")
+            Challenge.objects.create(full_name="Пробеги 50 километров!", athlete=athlete)
+            self._items(athlete, 2)
+
+            self._run(self.athlete, "finished")
+            self._items(self.athlete, 1)
+            self._extend(self.run, 1)
+        call_command("rebuild_athlete_stats", stdout=io.StringIO())
+        leaderboards.rebuild()
+
+    def fresh_run(self, status, points=None, athlete=None):
+        """Забег под пишущий запрос; трек растёт вместе с миром."""
+        return self._run(athlete or self.athlete, status, POINTS_PER_RUN + self.units if points is None else points)
+
+    def fresh_athlete(self, runs):
+        """Атлет с фиксированным числом завершённых забегов — для выгрузок «все забеги»."""
+        athlete = self._athlete()
+        for _ in range(runs):
+            self._run(athlete, "finished", POINTS_PER_RUN + self.units)
+        return athlete
+
+    def _athlete(self):
+        n = next(self._uid)
+        user = User.objects.create(username=f"athlete{n}", first_name=f"Имя{n}", last_name=f"Фамилия{n}")
+        AthleteInfo.objects.create(user=user, goals="марафон", weight=70)
+        return user
+
+    def _run(self, athlete, status, points=POINTS_PER_RUN):
+        run = Run.objects.create(athlete=athlete, comment="budget", status=status)
+        if status != "init":
+            self._extend(run, points)
+        if status == "finished":
+            run.distance, run.run_time_seconds = tracking.finalize(run)
+            run.save(update_fields=["distance", "run_time_seconds"])
+        return run
+
+    def _extend(self, run, points):
+        have = run.positions.count()
+        Position.objects.bulk_create(
+            Position(
+                run=run,
+                latitude=round(55.75 + STEP_DEG * i, 4),
+                longitude=round(37.62 + STEP_DEG * i, 4),
+                date_time=START + datetime.timedelta(seconds=10 * i),
+            )
+            for i in range(have, have + points)
+        )
+        tracking.recompute_totals(run)
+
+    def _items(self, athlete, count):
+        items = []
+        for _ in range(count):
+            n = next(self._uid)
+            item = CollectibleItem(
+                name=f"item {n}", uid=f"budget-{n}", picture="https://example.com/item.png", value=n,
+                latitude=round(56.5 + 0.001 * n, 4), longitude=round(38.5 + 0.001 * n, 4),
+            )
+            item.fill_grid_cell()
+            items.append(item)
+        items = CollectibleItem.objects.bulk_create(items)
+        CollectibleAward.objects.bulk_create(CollectibleAward(collectibleitem=i, user=athlete) for i in items)
+        return items
+
+
+_uploads = itertools.count()
+
+
+def _upload_rows(count):
+    """Строки с новыми uid на каждый вызов — чтобы каждый прогон действительно вставлял строки."""
+    batch = next(_uploads)
+    return [(f"upload {i}", f"upload-{batch}-{i}", i, 57.0, 39.0, "https://example.com/item.png") for i in range(count)]
+
+
+def _xlsx(rows, header=("Name", "UID", "Value", "Latitude", "Longitude", "URL")):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(list(header))
+    for row in rows:
+        ws.append(list(row))
+    out = io.BytesIO()
+    wb.save(out)
+    out.seek(0)
+    out.name = "items.xlsx"
+    return out
+
+
+def _point(i):
+    return {
+        "latitude": 55.9, "longitude": 37.9,
+        "date_time": (START + datetime.timedelta(hours=1, seconds=i)).strftime("%Y-%m-%dT%H:%M:%S.%f"),
+    }
+
+
+def _with_splits(run):
+    splits.store(run.id, splits.run_splits(run.id))
+    return run
+
+
+# маршрут (как в urlpatterns) -> [(метод, запрос, бюджет[, подготовка])].
+# запрос(world, client, **kw) возвращает ответ; подготовка(world) создаёт объекты для пишущих
+# запросов и отдаёт их как kw — её запросы в бюджет не входят (см. _measure).
+BUDGETS = {
+    "": [
+        ("GET", lambda w, c: c.get("/"), 0),
+    ],
+    "api/company_details/": [
+        ("GET", lambda w, c: c.get("/api/company_details/"), 0),
+    ],
+    "api/metrics/": [
+        ("GET", lambda w, c: c.get("/api/metrics/"), 0),
+    ],
+    "api/runs/<int:run_id>/start/": [
+        ("POST", lambda w, c, run=None: c.post(f"/api/runs/{run.id}/start/"), 1,
+         lambda w: {"run": w.fresh_run("init")}),
+    ],
+    "api/runs/<int:run_id>/stop/": [
+        # у нового атлета: иначе по мере роста мира забег то и дело выдаёт челлендж
+        ("POST", lambda w, c, run=None: c.post(f"/api/runs/{run.id}/stop/"), 14,
+         lambda w: {"run": w.fresh_run("in_progress", athlete=w.fresh_athlete(runs=0))}),
+    ],
+    "api/runs/<int:run_id>/positions/batch/": [
+        ("POST", lambda w, c, run=None: c.post(
+            f"/api/runs/{run.id}/positions/batch/", [_point(i) for i in range(3)], content_type="application/json"
+        ), 7, lambda w: {"run": w.fresh_run("in_progress")}),
+    ],
+    "api/runs/<int:run_id>/splits/": [
+        ("GET", lambda w, c, run=None: c.get(f"/api/runs/{run.id}/splits/"), 2,
+         lambda w: {"run": _with_splits(w.fresh_run("finished"))}),
+        # завершённый забег без сохранённых сплитов — досчитываются при первом чтении
+        ("GET", lambda w, c, run=None: c.get(f"/api/runs/{run.id}/splits/"), 7,
+         lambda w: {"run": w.fresh_run("finished")}),
+        ("GET", lambda w, c, run=None: c.get(f"/api/runs/{run.id}/splits/"), 2,
+         lambda w: {"run": w.fresh_run("in_progress")}),
+    ],
+    "api/runs/<int:run_id>/live/": [
+        # завершённый забег: лента отдаёт snapshot, пропущенные точки, finished и закрывается;
+        # у идущего забега запросы те же, но поток бесконечен
+        ("GET", lambda w, c, run=None: c.get(f"/api/runs/{run.id}/live/", HTTP_LAST_EVENT_ID="0"), 4,
+         lambda w: {"run": w.fresh_run("finished")}),
+    ],
+    "api/runs/<int:run_id>/export.gpx": [
+        ("GET", lambda w, c: c.get(f"/api/runs/{w.run.id}/export.gpx"), 2),
+    ],
+    "api/runs/<int:run_id>/export.geojson": [
+        ("GET", lambda w, c: c.get(f"/api/runs/{w.run.id}/export.geojson"), 3),
+    ],
+    "api/users/<int:user_id>/runs/export.zip": [
+        # по запросу трека на забег — потоковый zip иначе не собрать; поэтому атлет с двумя забегами
+        ("GET", lambda w, c, user=None: c.get(f"/api/users/{user.id}/runs/export.zip"), 4,
+         lambda w: {"user": w.fresh_athlete(runs=2)}),
+    ],
+    "api/athlete_info/<int:user_id>/": [
+        ("GET", lambda w, c: c.get(f"/api/athlete_info/{w.athlete.id}/"), 2),
+        ("PUT", lambda w, c: c.put(
+            f"/api/athlete_info/{w.athlete.id}/", {"goals": "ultra", "weight": 71}, content_type="application/json"
+        ), 3),
+    ],
+    "api/collectible_item/": [
+        ("GET", lambda w, c: c.get("/api/collectible_item/"), 1),
+    ],
+    "api/upload_file/": [
+        ("POST", lambda w, c: c.post("/api/upload_file/", {"file": _xlsx(_upload_rows(3))}), 4),
+        ("POST", lambda w, c: c.post("/api/upload_file/?async=1", {"file": _xlsx(_upload_rows(3))}), 1),
+    ],
+    "api/upload_jobs/<int:pk>/": [
+        ("GET", lambda w, c: c.get(f"/api/upload_jobs/{w.job.id}/"), 1),
+    ],
+    "api/upload_jobs/<int:pk>/invalid_rows/": [
+        ("GET", lambda w, c: c.get(f"/api/upload_jobs/{w.job.id}/invalid_rows/"), 1),
+    ],
+    "api/leaderboards/<str:metric>/": [
+        ("GET", lambda w, c: c.get("/api/leaderboards/distance/?period=all"), 1),
+        ("GET", lambda w, c: c.get("/api/leaderboards/collectibles/?period=all"), 1),
+    ],
+    "api/leaderboards/<str:metric>/users/<int:user_id>/": [
+        ("GET", lambda w, c: c.get(f"/api/leaderboards/runs/users/{w.athlete.id}/?period=all"), 3),
+    ],
+    "^api/runs/$": [
+        ("GET", lambda w, c: c.get("/api/runs/"), 2),
+        ("GET", lambda w, c: c.get(f"/api/runs/?athlete={w.athlete.id}&status=finished"), 4),
+        ("POST", lambda w, c: c.post("/api/runs/", {"athlete": w.athlete.id, "comment": "new"}), 2),
+    ],
+    "^api/runs/(?P<pk>[^/.]+)/$": [
+        ("GET", lambda w, c: c.get(f"/api/runs/{w.run.id}/"), 2),
+        # правка комментария итоги не трогает, правка дистанции пересчитывает статистику и лидерборды
+        ("PATCH", lambda w, c: c.patch(
+            f"/api/runs/{w.run.id}/", {"comment": "edited"}, content_type="application/json"
+        ), 4),
+        ("PATCH", lambda w, c, run=None: c.patch(
+            f"/api/runs/{run.id}/", {"distance": run.distance + 1}, content_type="application/json"
+        ), 17, lambda w: {"run": w.fresh_run("finished")}),
+        ("DELETE", lambda w, c, run=None: c.delete(f"/api/runs/{run.id}/"), 20,
+         lambda w: {"run": w.fresh_run("finished")}),
+    ],
+    "^api/users/$": [
+        ("GET", lambda w, c: c.get("/api/users/"), 2),
+        ("GET", lambda w, c: c.get("/api/users/?type=athlete&size=5"), 3),
+    ],
+    "^api/users/(?P<pk>[^/.]+)/$": [
+        ("GET", lambda w, c: c.get(f"/api/users/{w.athlete.id}/"), 3),
+    ],
+    "^api/challenges/$": [
+        ("GET", lambda w, c: c.get("/api/challenges/"), 2),
+        ("GET", lambda w, c: c.get(f"/api/challenges/?athlete={w.athlete.id}"), 4),
+    ],
+    "^api/challenges/(?P<pk>[^/.]+)/$": [
+        ("GET", lambda w, c: c.get(f"/api/challenges/{w.challenge.id}/"), 2),
+    ],
+    "^api/positions/$": [
+        ("GET", lambda w, c: c.get("/api/positions/"), 1),
+        ("GET", lambda w, c: c.get(f"/api/positions/?run={w.run.id}"), 3),
+        ("GET", lambda w, c: c.get(f"/api/positions/?run={w.run.id}&max_points=3"), 3),
+        ("POST", lambda w, c, run=None: c.post(
+            "/api/positions/", {"run": run.id, **_point(0)}, content_type="application/json"
+        ), 7, lambda w: {"run": w.fresh_run("in_progress")}),
+    ],
+    "^api/positions/(?P<pk>[^/.]+)/$": [
+        ("GET", lambda w, c: c.get(f"/api/positions/{w.run.positions.values_list('id', flat=True).first()}/"), 2),
+        ("DELETE", lambda w, c, position=None: c.delete(f"/api/positions/{position.id}/"), 11,
+         lambda w: {"position": w.fresh_run("in_progress").positions.last()}),
+    ],
+}
+
+SIZES = (1, 4)
+
+
+def _routes(resolver=None, prefix=""):
+    """Маршруты urlconf без админки и без дублей DRF с суффиксом формата."""
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            if route.startswith("admin/"):
+                continue
+            yield from _routes(pattern, route)
+        elif isinstance(pattern, URLPattern) and "<drf_format_suffix" not in route and "format>" not in route:
+            yield route
+
+
+def _consume(response):
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
+
+
+class QueryBudgetTests(TestCase):
+    maxDiff = None
+
+    def setUp(self):
+        for cache in caches.all(initialized_only=True):
+            cache.clear()
+
+    def _measure(self, world, request, prepare):
+        kwargs = prepare(world) if prepare else {}
+        for cache in caches.all(initialized_only=True):
+            cache.clear()
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as ctx:
+            response = _consume(request(world, self.client, **kwargs))
+        self.assertLess(response.status_code, 400, getattr(response, "content", b"")[:500])
+        return [q["sql"] for q in ctx.captured_queries]
+
+    def test_queries_do_not_grow_with_data(self):
+        world = World()
+        specs = [(route, *spec) for route, entries in BUDGETS.items() for spec in entries]
+        runs = {}
+        for size in SIZES:
+            world.grow(size - world.units)
+            for index, (route, method, request, budget, *prepare) in enumerate(specs):
+                runs.setdefault(index, []).append(self._measure(world, request, prepare[0] if prepare else None))
+
+        for index, (route, method, request, budget, *_) in enumerate(specs):
+            small, large = runs[index]
+            with self.subTest(route=route, method=method, case=index):
+                report = "\n".join(
+                    f"--- size {size}: {len(sql)} queries\n" + "\n".join(f"  {q}" for q in sql)
+                    for size, sql in zip(SIZES, (small, large))
+                )
+                self.assertEqual(len(small), len(large), f"{method} {route}: queries grow with data\n{report}")
+                self.assertLessEqual(len(large), budget, f"{method} {route}: over budget {budget}\n{report}")
+
+    def test_every_route_has_budget(self):
+        missing = sorted(set(_routes()) - set(BUDGETS))
+        self.assertEqual(missing, [], "routes without a query budget")
+
+
+class FastListTests(TestCase):
+    """app_run.fastlist: ответ list тот же, что через сериализатор, байт в байт."""
+
+    def setUp(self):
+        athlete = User.objects.create(username="бегун", first_name="Имя ", last_name="O'Neil \"quote\"")
+        for i, distance in enumerate((None, 0.0, 12.3456, 3.0, 42.195)):
+            run = Run.objects.create(
+                athlete=athlete, comment=f"забег {i}   <tag>", status="finished" if i else "in_progress",
+                distance=distance, run_time_seconds=i * 60 or None,
+            )
+            Challenge.objects.create(full_name=f"Челлендж {i}", athlete=athlete)
+        self.run = run
+        Position.objects.bulk_create(
+            Position(run=run, latitude="-0.0001", longitude="179.9999",
+                     date_time=START + datetime.timedelta(seconds=i, microseconds=i * 7))
+            for i in range(5)
+        )
+        Position.objects.create(run=run, latitude="55.7500", longitude="37.6200", date_time=None)
+
+    def assertSameBody(self, url, fast=True):
+        with self.settings(FAST_LIST_JSON=False):
+            expected = self.client.get(url)
+        render = mock.patch.object(FastJSONRenderer, "render", autospec=True, side_effect=FastJSONRenderer.render)
+        with self.settings(FAST_LIST_JSON=True), render as rendered:
+            actual = self.client.get(url)
+        self.assertEqual(rendered.called, fast, f"{url}: fast path {'not ' if fast else ''}taken")
+        self.assertEqual(actual.status_code, expected.status_code)
+        self.assertEqual(actual["Content-Type"], expected["Content-Type"])
+        self.assertEqual(actual.content, expected.content, url)
+
+    def test_runs(self):
+        for url in ("/api/runs/", "/api/runs/?size=2&page=2", "/api/runs/?cursor=&size=2",
+                    "/api/runs/?status=finished&ordering=-created_at", "/api/runs/?format=json"):
+            self.assertSameBody(url)
+
+    def test_challenges(self):
+        for url in ("/api/challenges/", "/api/challenges/?cursor=&size=2", "/api/challenges/?size=3"):
+            self.assertSameBody(url)
+
+    def test_positions(self):
+        for url in ("/api/positions/", f"/api/positions/?run={self.run.id}",
+                    f"/api/positions/?run={self.run.id}&cursor=&size=2", "/api/positions/?size=4&page=2"):
+            self.assertSameBody(url)
+
+    def test_exponent_float_falls_back(self):
+        # 1e-05 stdlib пишет как 1e-05, orjson — как 1e-5
+        Run.objects.filter(distance=3.0).update(distance=1e-05)
+        self.assertSameBody("/api/runs/", fast=False)
+
+    def test_keyset_next_page(self):
+        with self.settings(FAST_LIST_JSON=True):
+            first = self.client.get("/api/runs/?cursor=&size=2").json()
+            second = self.client.get(first["next"]).json()
+        self.assertEqual(len(second["results"]), 2)
+        self.assertNotEqual(first["results"][-1]["id"], second["results"][0]["id"])
+
+    def test_browsable_api_keeps_serializer_path(self):
+        with self.settings(FAST_LIST_JSON=True):
+            response = self.client.get("/api/runs/", HTTP_ACCEPT="text/html")
+        self.assertContains(response, "забег 1")
+
+
+class RunTransitionRaceTests(TransactionTestCase):
+    """transitions: из одновременных start/stop забег меняет ровно один запрос."""
+    threads = 16
+
+    def setUp(self):
+        self.athlete = User.objects.create(username="racer")
+        self.run = Run.objects.create(athlete=self.athlete, comment="race", status=transitions.IN_PROGRESS)
+        Position.objects.bulk_create(
+            Position(run=self.run, latitude=round(55.75 + STEP_DEG * i, 4), longitude=37.62,
+                     date_time=START + datetime.timedelta(seconds=30 * i))
+            for i in range(20)
+        )
+        tracking.recompute_totals(self.run)
+
+    def hammer(self, url):
+        barrier = threading.Barrier(self.threads)
+        responses = [None] * self.threads
+
+        def worker(i):
+            try:
+                barrier.wait()
+                responses[i] = Client().post(url)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(self.threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return responses
+
+    def test_concurrent_stop_finishes_once(self):
+        responses = self.hammer(f"/api/runs/{self.run.id}/stop/")
+
+        codes = sorted(r.status_code for r in responses)
+        self.assertEqual(codes, [200] + [400] * (self.threads - 1))
+        refused = [r.json() for r in responses if r.status_code == 400]
+        self.assertTrue(all(body["status"] == transitions.FINISHED for body in refused), refused)
+
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.status, transitions.FINISHED)
+        self.assertAlmostEqual(self.run.distance, round(self.run.track_distance, 4))
+        self.assertEqual(self.run.run_time_seconds, 19 * 30)
+        self.assertEqual(AthleteStats.objects.get(athlete=self.athlete).runs_finished, 1)
+        self.assertEqual(
+            LeaderboardEntry.objects.get(athlete=self.athlete, metric="runs", period="all").value, 1
+        )
+        # сплиты остановку не задерживают — считаются при первом чтении
+        self.assertFalse(RunSplit.objects.filter(run=self.run).exists())
+
+    def test_concurrent_start_starts_once(self):
+        Run.objects.filter(pk=self.run.pk).update(status=transitions.INIT)
+        responses = self.hammer(f"/api/runs/{self.run.id}/start/")
+
+        codes = sorted(r.status_code for r in responses)
+        self.assertEqual(codes, [200] + [400] * (self.threads - 1))
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.status, transitions.IN_PROGRESS)
+
+    def test_repeated_calls_are_deterministic(self):
+        self.assertEqual(self.client.post(f"/api/runs/{self.run.id}/start/").json(),
+                         {"detail": "Run already started or finished!", "id": self.run.id,
+                          "status": transitions.IN_PROGRESS})
+        first = self.client.post(f"/api/runs/{self.run.id}/stop/")
+        again = self.client.post(f"/api/runs/{self.run.id}/stop/")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(again.status_code, 400)
+        self.assertEqual(again.json()["status"], transitions.FINISHED)
+        self.assertEqual(self.client.post("/api/runs/999999/stop/").json(),
+                         {"detail": "No Run matches the given query."})
+        self.assertEqual(self.client.post("/api/runs/999999/start/").status_code, 404)
+
+
+class BackfillTests(TransactionTestCase):
+    """backfill: новые предметы выдаются по старым точкам так же, как при POST."""
+
+    def setUp(self):
+        self.near = self._item("near", 55.7505, 37.6200, 7)
+        self.far = self._item("far", 56.5000, 38.5000, 11)
+        self.first, self.second = User.objects.create(username="first"), User.objects.create(username="second")
+        for athlete, lon in ((self.first, 37.6205), (self.second, 37.6195)):
+            run = Run.objects.create(athlete=athlete, comment="history", status=transitions.FINISHED)
+            Position.objects.bulk_create(
+                Position(run=run, latitude=round(55.74 + STEP_DEG * i, 4), longitude=lon,
+                         date_time=START + datetime.timedelta(seconds=10 * i))
+                for i in range(40)
+            )
+        # уже выданный при POST предмет не должен второй раз попасть в лидерборд
+        self.owned = self._item("owned", 55.7450, 37.6205, 5)
+        CollectibleAward.objects.create(collectibleitem=self.owned, user=self.first)
+
+    def _item(self, uid, lat, lon, value):
+        return CollectibleItem.objects.create(name=uid, uid=uid, picture="https://example.com/item.png",
+                                              value=value, latitude=lat, longitude=lon)
+
+    def test_run_pending_awards_historical_positions(self):
+        result = backfill.run_pending(workers=4, chunk_size=7)
+
+        self.assertEqual(result.items, 3)
+        self.assertEqual(result.awards, 3)
+        self.assertEqual(
+            set(CollectibleAward.objects.values_list("user_id", "collectibleitem_id")),
+            {(self.first.id, self.near.id), (self.second.id, self.near.id),
+             (self.first.id, self.owned.id), (self.second.id, self.owned.id)},
+        )
+        collectibles = dict(
+            LeaderboardEntry.objects.filter(metric="collectibles", period="all").values_list("athlete_id", "value")
+        )
+        self.assertEqual(collectibles, {self.first.id: 7, self.second.id: 12})
+        self.assertFalse(backfill.pending_items().exists())
+        self.assertEqual(backfill.run_pending(), (0, 0, 0))
+
+    def test_award_committed_during_scan_counted_once(self):
+        atomic = transaction.atomic
+
+        @contextlib.contextmanager
+        def racing_atomic(*args, **kwargs):
+            # POST точки выдал near первому атлету, пока backfill читал историю
+            if not CollectibleAward.objects.filter(collectibleitem=self.near, user=self.first).exists():
+                with atomic():
+                    views.award_items(self.first.id, [self.near])
+            with atomic(*args, **kwargs):
+                yield
+
+        with mock.patch.object(backfill, "transaction", types.SimpleNamespace(atomic=racing_atomic)):
+            result = backfill.backfill(CollectibleItem.objects.filter(pk=self.near.pk), workers=1)
+
+        self.assertEqual(result.awards, 1)
+        collectibles = dict(
+            LeaderboardEntry.objects.filter(metric="collectibles", period="all").values_list("athlete_id", "value")
+        )
+        self.assertEqual(collectibles, {self.first.id: 7, self.second.id: 7})
+
+    def test_matches_geodesic_at_radius_boundary(self):
+        rnd = random.Random(7)
+        points = [
+            (round(55.7505 + rnd.uniform(-0.0012, 0.0012), 4), round(37.62 + rnd.uniform(-0.0018, 0.0018), 4))
+            for _ in range(2000)
+        ]
+        inside = [i for i, pt in enumerate(points) if geodesic(pt, (55.7505, 37.62)).meters < geo.COLLECT_RADIUS_M]
+        self.assertTrue(0 < len(inside) < len(points))
+        lat, lon = [p[0] for p in points], [p[1] for p in points]
+        moments = [len(points) - i for i in range(len(points))]
+        queryset = CollectibleItem.objects.filter(pk__in=[self.near.id, self.far.id])
+        cases = [
+            # у каждой точки свой атлет — пара на каждую точку внутри радиуса
+            ((range(len(points)), lat, lon, moments), {(i, self.near.id): moments[i] for i in inside}),
+            # один атлет — одна пара с временем самой ранней точки
+            (([1] * len(points), lat, lon, moments), {(1, self.near.id): min(moments[i] for i in inside)}),
+        ]
+        for args, expected in cases:
+            self.assertEqual(backfill._match_np(backfill._load_items(queryset, geo.COLLECT_RADIUS_M), *args,
+                                                geo.COLLECT_RADIUS_M), expected)
+            with mock.patch.object(backfill, "np", None):
+                self.assertEqual(backfill._match_py(backfill._load_items(queryset, geo.COLLECT_RADIUS_M), *args,
+                                                    geo.COLLECT_RADIUS_M), expected)
+
+    def test_awards_dated_by_position(self):
+        # пробежка двухмесячной давности, точки пронумерованы назад во времени
+        base = timezone.now() - datetime.timedelta(days=60)
+        positions = list(Position.objects.filter(run__athlete=self.second))
+        for position in positions:
+            position.date_time = base - datetime.timedelta(seconds=position.id)
+        Position.objects.bulk_update(positions, ["date_time"])
+        found = min(p.date_time for p in positions
+                    if geodesic((p.latitude, p.longitude), (55.7505, 37.62)).meters < geo.COLLECT_RADIUS_M)
+
+        backfill.run_pending(workers=1)
+        award = CollectibleAward.objects.get(user=self.second, collectibleitem=self.near)
+        self.assertEqual(award.awarded_at, found)
+        # в неделю и месяц находки, а не прохода backfill
+        entries = LeaderboardEntry.objects.filter(metric="collectibles", athlete=self.second)
+        self.assertEqual(sorted(entries.values_list("period", "bucket")),
+                         sorted((period, leaderboards.bucket(period, found)) for period in leaderboards.PERIODS))
+        incremental = sorted(entries.values_list("period", "bucket", "value"))
+        leaderboards.rebuild()
+        self.assertEqual(sorted(entries.values_list("period", "bucket", "value")), incremental)
+
+
+@override_settings(POSITION_BUFFER=True, POSITION_BUFFER_MAX_POINTS=1000, POSITION_BUFFER_MAX_DELAY_MS=60_000)
+class PositionBufferTests(TransactionTestCase):
+    """ingest: точки из буфера пишутся пачкой, а stop видит их все."""
+
+    def setUp(self):
+        self.athlete = User.objects.create(username="buffered")
+        self.run = Run.objects.create(athlete=self.athlete, comment="buffer", status=transitions.IN_PROGRESS)
+        self.item = CollectibleItem.objects.create(name="near", uid="near", picture="https://example.com/item.png",
+                                                   value=3, latitude=55.7515, longitude=37.62)
+
+    def tearDown(self):
+        views.position_buffer.flush()
+
+    def post_points(self, count, first=0):
+        for i in range(first, first + count):
+            response = self.client.post("/api/positions/", {
+                "run": self.run.id, "latitude": round(55.75 + STEP_DEG * i, 4), "longitude": 37.62,
+                "date_time": (START + datetime.timedelta(seconds=30 * i)).strftime("%Y-%m-%dT%H:%M:%S.%f"),
+            }, content_type="application/json")
+            self.assertEqual(response.status_code, 202, response.content)
+        self.assertNotIn("id", response.json())
+
+    def test_stop_sees_buffered_points(self):
+        self.post_points(10)
+        self.assertFalse(Position.objects.exists())
+
+        response = self.client.post(f"/api/runs/{self.run.id}/stop/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Position.objects.filter(run=self.run).count(), 10)
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.run_time_seconds, 9 * 30)
+        self.assertAlmostEqual(self.run.track_distance, tracking.compute_totals(self.run.id)["track_distance"])
+        self.assertTrue(CollectibleAward.objects.filter(user=self.athlete, collectibleitem=self.item).exists())
+
+    def wait_for_positions(self, count):
+        for _ in range(200):
+            if Position.objects.count() == count:
+                break
+            time.sleep(0.01)
+        self.assertEqual(Position.objects.count(), count)
+
+    def test_flush_by_size_and_by_time(self):
+        with self.settings(POSITION_BUFFER_MAX_POINTS=3):
+            self.post_points(3)
+            self.wait_for_positions(3)
+
+        with self.settings(POSITION_BUFFER_MAX_DELAY_MS=20):
+            self.post_points(2, first=3)
+            self.wait_for_positions(5)
+        self.run.refresh_from_db()
+        self.assertAlmostEqual(self.run.track_distance, tracking.compute_totals(self.run.id)["track_distance"])
+
+    def test_points_of_stopped_run_are_dropped(self):
+        self.post_points(2)
+        Run.objects.filter(pk=self.run.pk).update(status=transitions.FINISHED)
+        with self.assertLogs("app_run.ingest", "WARNING"):
+            self.assertEqual(views.position_buffer.flush(), 0)
+        self.assertFalse(Position.objects.exists())
+
+
+    def failing_write(self, failures):
+        write = views.position_buffer._write
+        side_effect = [OperationalError("database is locked")] * failures
+
+        def flaky(batch):
+            if side_effect:
+                raise side_effect.pop()
+            return write(batch)
+
+        return mock.patch.object(views.position_buffer, "_write", side_effect=flaky)
+
+    def test_failed_flush_keeps_points_for_retry(self):
+        self.post_points(3)
+        with self.failing_write(1), self.assertRaises(OperationalError):
+            views.position_buffer.flush()
+        self.assertEqual(len(views.position_buffer), 3)
+        self.post_points(1, first=3)
+
+        # stop тоже сбрасывает буфер: при сбое он отвечает ошибкой и забег не завершает
+        with self.failing_write(1), self.assertRaises(OperationalError):
+            self.client.post(f"/api/runs/{self.run.id}/stop/")
+        self.assertEqual(Run.objects.get(pk=self.run.pk).status, transitions.IN_PROGRESS)
+
+        self.assertEqual(self.client.post(f"/api/runs/{self.run.id}/stop/").status_code, 200)
+        self.assertEqual(list(self.run.positions.order_by("id").values_list("date_time", flat=True)),
+                         [START + datetime.timedelta(seconds=30 * i) for i in range(4)])
+
+    def test_timer_retries_failed_batch(self):
+        with self.settings(POSITION_BUFFER_MAX_DELAY_MS=20), self.failing_write(2), \
+                self.assertLogs("app_run.ingest", "ERROR") as logs:
+            self.post_points(2)
+            self.wait_for_positions(2)
+        self.assertEqual(len(logs.records), 2)
+
+
+class GeoGridTests(TestCase):
+    """geo: выборка по сетке находит те же предметы, что и перебор всего каталога geodesic."""
+
+    def test_collect_nearby_matches_brute_force(self):
+        rnd = random.Random(1)
+        # средние широты, высокие широты и антимеридиан — там bbox и ячейки устроены сложнее всего
+        centers = [(55.75, 37.62), (78.2, 15.6), (-0.0005, 179.9995), (64.0, -179.999)]
+        items = []
+        for n in range(200):
+            lat, lon = centers[n % len(centers)]
+            lon = (lon + rnd.uniform(-0.01, 0.01) + 180.0) % 360.0 - 180.0
+            item = CollectibleItem(name=f"g{n}", uid=f"grid-{n}", picture="https://example.com/item.png", value=1,
+                                   latitude=round(lat + rnd.uniform(-0.004, 0.004), 4), longitude=round(lon, 4))
+            item.fill_grid_cell()
+            items.append(item)
+        items = CollectibleItem.objects.bulk_create(items)
+
+        hits = 0
+        for n in range(40):
+            lat, lon = centers[n % len(centers)]
+            point = (lat + rnd.uniform(-0.003, 0.003), (lon + rnd.uniform(-0.008, 0.008) + 180.0) % 360.0 - 180.0)
+            expected = {
+                item.id for item in items
+                if geodesic(point, (float(item.latitude), float(item.longitude))).meters < geo.COLLECT_RADIUS_M
+            }
+            found = {item.id for item in geo.collect_nearby([point], CollectibleItem.objects.all())}
+            self.assertEqual(found, expected, point)
+            hits += len(found)
+        self.assertGreater(hits, 0)
+
+    def test_cell_ranges_cover_bbox(self):
+        for lat, lon in ((55.75, 37.62), (89.9995, 10.0), (0.0, 179.9999), (-33.9, -180.0)):
+            box = geo.bbox(lat, lon, geo.COLLECT_RADIUS_M)
+            cells = {c for lo, hi in geo.merge_ranges(geo.cell_ranges(box)) for c in range(lo, hi + 1)}
+            half = box[1] - lat
+            for dlat in (-half, 0.0, half):
+                for dlon in (-box[3], 0.0, box[3]):
+                    corner = (lat + dlat if abs(lat + dlat) <= 90 else lat, lon + dlon)
+                    self.assertIn(geo.grid_cell(*corner), cells, (lat, lon, corner))
+
+
+class PositionBatchTests(TestCase):
+    """Пакетная загрузка: валидные точки пишутся одним INSERT, ошибки — по индексу."""
+
+    def setUp(self):
+        self.athlete = User.objects.create(username="batch")
+        self.run = Run.objects.create(athlete=self.athlete, comment="batch", status=transitions.IN_PROGRESS)
+        self.item = CollectibleItem.objects.create(name="near", uid="near", picture="https://example.com/item.png",
+                                                   value=4, latitude=55.9, longitude=37.9)
+
+    def post(self, points, run=None):
+        return self.client.post(f"/api/runs/{(run or self.run).id}/positions/batch/", points,
+                                content_type="application/json")
+
+    def test_partial_batch(self):
+        points = [_point(0), {**_point(1), "latitude": 91}, _point(2), "junk", {**_point(3), "longitude": "1.23456"}]
+        response = self.post({"positions": points})
+
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(body["created"], 2)
+        self.assertEqual(body["collected_items"], [self.item.id])
+        self.assertEqual([e["index"] for e in body["errors"]], [1, 3, 4])
+        self.assertEqual(body["errors"][0]["errors"], {"latitude": ["latitude must be in [-90.0, 90.0]"]})
+        self.assertEqual(Position.objects.filter(run=self.run).count(), 2)
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.last_date_time, START + datetime.timedelta(hours=1, seconds=2))
+        self.assertTrue(CollectibleAward.objects.filter(user=self.athlete, collectibleitem=self.item).exists())
+
+    def test_rejected_batches(self):
+        finished = Run.objects.create(athlete=self.athlete, comment="done", status=transitions.FINISHED)
+        self.assertEqual(self.post([_point(0)], run=finished).json()["run"], "Run must be in status 'in_progress'")
+        self.assertEqual(self.post({"positions": "x"}).status_code, 400)
+        with mock.patch.object(views.PositionBatchApiView, "max_batch_size", 2):
+            self.assertEqual(self.post([_point(i) for i in range(3)]).status_code, 400)
+        response = self.post([{"latitude": 1}])
+        self.assertEqual((response.status_code, response.json()["created"]), (400, 0))
+        self.assertFalse(Position.objects.exists())
+
+
+class TrackTotalsTests(TestCase):
+    """tracking: накопленные итоги совпадают с полным пересчётом при любом порядке точек."""
+
+    def assertTotalsMatch(self, run):
+        run.refresh_from_db()
+        expected = tracking.compute_totals(run.id)
+        self.assertAlmostEqual(run.track_distance, expected.pop("track_distance"), places=9)
+        self.assertEqual({f: getattr(run, f) for f in expected}, expected)
+
+    def test_out_of_order_points(self):
+        rnd = random.Random(3)
+        run = Run.objects.create(athlete=User.objects.create(username="order"), status=transitions.IN_PROGRESS)
+        order = list(range(30))
+        rnd.shuffle(order)
+        for i in order:
+            position = Position.objects.create(
+                run=run, latitude=round(55.75 + rnd.uniform(-0.01, 0.01), 4),
+                longitude=round(37.62 + rnd.uniform(-0.01, 0.01), 4),
+                date_time=START + datetime.timedelta(seconds=10 * i),
+            )
+            tracking.add_positions(run.id, [position])
+            self.assertTotalsMatch(run)
+
+        # пачка из прошлого пересчитывается целиком, пачка в конец — докладывается
+        for seconds in ((-50, 5, 1000), (2000, 3000)):
+            batch = Position.objects.bulk_create(
+                Position(run=run, latitude=55.7, longitude=37.6, date_time=START + datetime.timedelta(seconds=s))
+                for s in seconds
+            )
+            tracking.add_positions(run.id, batch)
+            self.assertTotalsMatch(run)
+
+        self.assertEqual(tracking.finalize(run), (round(run.track_distance, 4), 3050))
+
+
+class TrackMetricsTests(TestCase):
+    """track_metrics: NumPy и чистый Python дают то же, что поточечный haversine."""
+
+    def test_numpy_and_python_agree_with_haversine(self):
+        rnd = random.Random(4)
+        lat, lon, t = [55.75], [37.62], [0.0]
+        for i in range(1, 500):
+            lat.append(lat[-1] + rnd.uniform(-0.001, 0.001))
+            lon.append(lon[-1] + rnd.uniform(-0.001, 0.001))
+            t.append(math.nan if i % 97 == 0 else t[-1] + rnd.choice((0.0, 1.0, 5.0)))
+        expected_km = sum(haversine(a, b) for a, b in zip(zip(lat, lon), zip(lat[1:], lon[1:])))
+
+        fast = track_metrics.compute_metrics(lat, lon, t)
+        with mock.patch.object(track_metrics, "np", None):
+            slow = track_metrics.compute_metrics(lat, lon, t)
+        self.assertAlmostEqual(fast.distance_km, expected_km, places=9)
+        for a, b in zip(fast, slow):
+            self.assertAlmostEqual(a, b, places=6)
+        self.assertEqual(fast.duration_s, max(x for x in t if not math.isnan(x)))
+        self.assertGreater(fast.max_speed_kmh, 0)
+
+    def test_short_tracks(self):
+        for lat, lon, t in (([], [], []), ([55.0], [37.0], [0.0])):
+            self.assertEqual(tuple(track_metrics.compute_metrics(lat, lon, t)), (len(lat), 0.0, 0.0, 0.0, 0.0))
+
+    def test_run_metrics_reads_track_in_time_order(self):
+        run = Run.objects.create(athlete=User.objects.create(username="metrics"), status=transitions.FINISHED)
+        for i in (2, 0, 1):
+            Position.objects.create(run=run, latitude=55.75 + STEP_DEG * i, longitude=37.62,
+                                    date_time=START + datetime.timedelta(seconds=60 * i))
+        metrics = track_metrics.run_metrics(run.id)
+        self.assertEqual((metrics.points, metrics.duration_s), (3, 120.0))
+        self.assertAlmostEqual(metrics.distance_km, haversine((55.75, 37.62), (55.751, 37.62)), places=6)
+
+
+def _dp(xs, ys, i, j, tolerance, keep):
+    """Классический рекурсивный Douglas-Peucker — эталон для отбора по важности."""
+    if j - i < 2:
+        return
+    k, d = simplify._farthest_py(xs, ys, i, j)
+    if d > tolerance:
+        keep.add(k)
+        _dp(xs, ys, i, k, tolerance, keep)
+        _dp(xs, ys, k, j, tolerance, keep)
+
+
+class SimplifyTests(TestCase):
+    """Douglas-Peucker: отбор по важности совпадает с DP, кэш упрощённого трека сбрасывается удалением точки."""
+
+    def setUp(self):
+        simplify.track_cache().clear()
+
+    def _track(self, n=400, seed=7):
+        rnd = random.Random(seed)
+        lat, lon = [55.75], [37.62]
+        for _ in range(n - 1):
+            lat.append(lat[-1] + rnd.uniform(-0.0005, 0.001))
+            lon.append(lon[-1] + rnd.uniform(-0.0005, 0.001))
+        return lat, lon
+
+    def test_selection_matches_recursive_dp(self):
+        lat, lon = self._track()
+        imp = simplify.importance(lat, lon)
+        with mock.patch.object(simplify, "np", None):
+            self.assertEqual(simplify.importance(lat, lon), imp)
+        xs, ys = simplify._project(lat, lon)
+        for tolerance in (0.0, 1.0, 5.0, 20.0, 100.0):
+            keep = {0, len(lat) - 1}
+            _dp(xs, ys, 0, len(lat) - 1, tolerance, keep)
+            self.assertEqual(simplify.select(imp, tolerance_m=tolerance), sorted(keep), tolerance)
+
+    def test_max_points_keeps_most_important(self):
+        lat, lon = self._track()
+        imp = simplify.importance(lat, lon)
+        keep = simplify.select(imp, max_points=10)
+        self.assertEqual(len(keep), 10)
+        self.assertEqual((keep[0], keep[-1]), (0, len(lat) - 1))
+        dropped = max(imp[i] for i in range(len(imp)) if i not in keep)
+        self.assertTrue(all(imp[i] >= dropped for i in keep))
+        self.assertEqual(simplify.select([], tolerance_m=1.0), [])
+
+    def test_cached_track_invalidated_by_delete(self):
+        run = Run.objects.create(athlete=User.objects.create(username="simplify"), status=transitions.FINISHED)
+        lat, lon = self._track(50)
+        Position.objects.bulk_create(
+            Position(run=run, latitude=round(la, 4), longitude=round(lo, 4),
+                     date_time=START + datetime.timedelta(seconds=i))
+            for i, (la, lo) in enumerate(zip(lat, lon))
+        )
+        url = f"/api/positions/?run={run.id}&max_points=5"
+        first = self.client.get(url).json()
+        self.assertEqual(len(first), 5)
+        self.assertEqual(self.client.get(url).json(), first)
+
+        self.assertEqual(self.client.delete(f"/api/positions/{first[-1]['id']}/").status_code, 204)
+        second = self.client.get(url).json()
+        self.assertEqual(len(second), 5)
+        self.assertNotIn(first[-1]["id"], [p["id"] for p in second])
+
+
+class PackedTrackTests(TestCase):
+    """RunTrack: упаковка без потерь, ответ из копии совпадает с ответом из строк, упаковка воркером."""
+
+    def _run(self, status=transitions.FINISHED):
+        run = Run.objects.create(athlete=User.objects.create(username=f"packed{Run.objects.count()}"), status=status)
+        for i in range(30):
+            Position.objects.create(run=run, latitude=round(-33.9 + STEP_DEG * i, 4),
+                                    longitude=round(-0.01 + STEP_DEG * i, 4),
+                                    date_time=START + datetime.timedelta(seconds=i, microseconds=7 * i))
+        return run
+
+    def test_pack_round_trip(self):
+        rows = list(self._run().positions.order_by("id").values_list(
+            "id", "latitude", "longitude", "date_time", "created_at"))
+        for compress in (True, False):
+            columns = packed_track.unpack(packed_track.pack(rows, compress))
+            self.assertEqual(columns["id"], [r[0] for r in rows])
+            self.assertEqual(columns["latitude"], [int(r[1] * 1_000_000) for r in rows])
+            self.assertEqual(columns["longitude"], [int(r[2] * 1_000_000) for r in rows])
+            self.assertEqual(columns["date_time"], [packed_track._to_us(r[3]) for r in rows])
+        with self.assertRaises(packed_track.PackError):
+            packed_track.unpack(b"XXXX" + bytes(8))
+
+    def test_packed_list_matches_rows(self):
+        run = self._run()
+        from_rows = self.client.get(f"/api/positions/?run={run.id}").json()
+        packed_track.compact_run(run.id)
+        with self.assertNumQueries(1):
+            from_track = self.client.get(f"/api/positions/?run={run.id}").json()
+        self.assertEqual(from_track, from_rows)
+
+    def test_worker_packs_finished_tracks(self):
+        run = self._run(transitions.IN_PROGRESS)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(f"/api/runs/{run.id}/stop/").status_code, 200)
+        # остановка трек не читает — его упаковывает воркер
+        self.assertFalse(RunTrack.objects.filter(run=run).exists())
+
+        broken = self._run()
+        Position.objects.filter(run=broken).update(date_time=None)
+        self._run(transitions.IN_PROGRESS)
+        self.assertEqual(list(packed_track.pending_runs()), [run])
+
+        out = io.StringIO()
+        call_command("run_import_worker", "--once", stdout=out)
+        self.assertIn("packed 1 tracks, 30 points", out.getvalue())
+        self.assertEqual(list(RunTrack.objects.values_list("run_id", "points")), [(run.id, 30)])
+        self.assertEqual(packed_track.compact_pending(), (0, 0))
+
+
+class ExportTests(TestCase):
+    """Выгрузки: GPX/GeoJSON с точками в порядке времени, zip всех забегов; ASGI отдаёт то же итератором."""
+
+    def setUp(self):
+        self.athlete = User.objects.create(username="export")
+        self.runs = []
+        for n in range(2):
+            run = Run.objects.create(athlete=self.athlete, status=transitions.FINISHED)
+            for i in (2, 0, 1):
+                Position.objects.create(run=run, latitude=55.75 + STEP_DEG * i, longitude=37.62,
+                                        date_time=START + datetime.timedelta(seconds=60 * i))
+            self.runs.append(run)
+
+    def test_formats(self):
+        run = self.runs[0]
+        gpx = self.client.get(f"/api/runs/{run.id}/export.gpx")
+        self.assertEqual(gpx["Content-Type"], "application/gpx+xml")
+        body = b"".join(gpx.streaming_content).decode()
+        self.assertEqual([body.index(f'lat="{55.75 + STEP_DEG * i:.4f}"') for i in range(3)],
+                         sorted(body.index(f'lat="{55.75 + STEP_DEG * i:.4f}"') for i in range(3)))
+
+        geojson = json.loads(b"".join(self.client.get(f"/api/runs/{run.id}/export.geojson").streaming_content))
+        coords = geojson["geometry"]["coordinates"]
+        self.assertEqual([lat for _, lat in coords], [55.75, 55.7505, 55.751])
+
+        url = f"/api/users/{self.athlete.id}/runs/export.zip"
+        archive = b"".join(self.client.get(url, {"type": "geojson"}).streaming_content)
+        with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+            self.assertEqual(zf.namelist(), [f"run_{r.id}.geojson" for r in self.runs])
+        self.assertEqual(self.client.get(url, {"type": "kml"}).status_code, 400)
+
+    async def test_asgi_streams_same_bytes(self):
+        urls = [f"/api/runs/{self.runs[0].id}/export.gpx", f"/api/runs/{self.runs[0].id}/export.geojson",
+                f"/api/users/{self.athlete.id}/runs/export.zip"]
+
+        def sync_get(url):
+            response = self.client.get(url)
+            return response["Content-Type"], b"".join(response.streaming_content)
+
+        expected = [await sync_to_async(sync_get)(url) for url in urls]
+
+        client = AsyncClient()
+        with override_settings(ROOT_URLCONF="project_run.urls_asgi"):
+            for url, (content_type, body) in zip(urls, expected):
+                response = await client.get(url)
+                self.assertTrue(response.is_async, url)
+                self.assertEqual(response["Content-Type"], content_type)
+                self.assertEqual(b"".join([chunk async for chunk in response.streaming_content]), body, url)
+            self.assertEqual((await client.get("/api/runs/0/export.gpx")).status_code, 404)
+
+
+class CatalogueCacheTests(TestCase):
+    """Каталог предметов: 304 по ETag и If-Modified-Since без запросов, новая версия после коммита правки и каждой пачки импорта."""
+
+    def setUp(self):
+        caches["catalogue"].clear()
+        self.item = CollectibleItem.objects.create(name="item", uid="cat-1", value=1, latitude=55.0, longitude=37.0,
+                                                   picture="https://example.com/i.png")
+
+    def test_conditional_get(self):
+        first = self.client.get("/api/collectible_item/")
+        self.assertEqual([row["uid"] for row in first.json()], ["cat-1"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/collectible_item/").content, first.content)
+            cached = self.client.get("/api/collectible_item/", HTTP_IF_NONE_MATCH=first["ETag"])
+            since = self.client.get("/api/collectible_item/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual((cached.status_code, cached["ETag"]), (304, first["ETag"]))
+        self.assertEqual(since.status_code, 304)
+        self.assertEqual(self.client.get("/api/collectible_item/", HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_edit_and_import_invalidate(self):
+        etag = self.client.get("/api/collectible_item/")["ETag"]
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.item.value = 5
+            self.item.save()
+        # до коммита версия прежняя — старое тело не попадёт в кэш под новым токеном
+        self.assertEqual(self.client.get("/api/collectible_item/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        for callback in callbacks:
+            callback()
+        edited = self.client.get("/api/collectible_item/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((edited.status_code, edited.json()[0]["value"]), (200, 5))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/upload_file/",
+                             {"file": _xlsx([("new", "cat-2", 2, 56.0, 38.0, "https://e.com/n.png")])})
+        imported = self.client.get("/api/collectible_item/", HTTP_IF_NONE_MATCH=edited["ETag"])
+        self.assertEqual([row["uid"] for row in imported.json()], ["cat-1", "cat-2"])
+
+    def test_failed_import_shows_committed_chunks(self):
+        etag = self.client.get("/api/collectible_item/")["ETag"]
+        real_chunk = importing._import_chunk
+        calls = itertools.count()
+
+        def chunk(*args):
+            if next(calls) == 1:
+                raise OperationalError("disk I/O error")
+            return real_chunk(*args)
+
+        rows = [("new", "cat-2", 2, 56.0, 38.0, "https://e.com/n.png"),
+                ("lost", "cat-3", 3, 56.0, 38.0, "https://e.com/l.png")]
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(importing, "_import_chunk", side_effect=chunk):
+            with self.assertRaises(OperationalError):
+                importing.import_collectibles(_xlsx(rows), chunk_size=1)
+        response = self.client.get("/api/collectible_item/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual([row["uid"] for row in response.json()], ["cat-1", "cat-2"])
+
+
+class ConditionalGetTests(TestCase):
+    """ETag списков и карточек: 304 без изменений, новый ETag после правки забега, атлета и его итогов."""
+
+    def setUp(self):
+        caches["versions"].clear()
+        self.world = World()
+        self.world.grow(1)
+
+    def assertChanged(self, url, etag, changed=True):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200 if changed else 304, url)
+        return response.get("ETag", etag)
+
+    def test_not_modified(self):
+        # карточка — одна строка по первичному ключу, список — только токен версии из кэша
+        for url, queries in (("/api/runs/", 0), (f"/api/runs/{self.world.run.id}/", 1), ("/api/users/", 0),
+                             (f"/api/users/{self.world.athlete.id}/", 1), ("/api/challenges/", 0)):
+            etag = self.client.get(url)["ETag"]
+            with self.assertNumQueries(queries):
+                self.assertChanged(url, etag, changed=False)
+
+    def test_run_edit_and_athlete_rename(self):
+        etag = self.client.get("/api/runs/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/runs/{self.world.run.id}/", {"comment": "edited"},
+                              content_type="application/json")
+        etag = self.assertChanged("/api/runs/", etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.world.athlete.first_name = "Другое"
+            self.world.athlete.save()
+        response = self.client.get("/api/runs/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Другое", response.content.decode())
+
+    def test_run_transitions_and_points(self):
+        # десятый завершённый забег приносит челлендж
+        run = self.world.fresh_run("init", points=0, athlete=self.world.fresh_athlete(runs=9))
+        call_command("rebuild_athlete_stats", stdout=io.StringIO())
+        etags = {url: self.client.get(url)["ETag"] for url in ("/api/runs/", "/api/challenges/")}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/runs/{run.id}/start/")
+        etags["/api/runs/"] = self.assertChanged("/api/runs/", etags["/api/runs/"])
+
+        # итоги трека в список не входят — точка версию не сдвигает
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/positions/", {"run": run.id, **_point(0)}, content_type="application/json")
+        self.assertChanged("/api/runs/", etags["/api/runs/"], changed=False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/runs/{run.id}/stop/")
+        self.assertChanged("/api/runs/", etags["/api/runs/"])
+        self.assertChanged("/api/challenges/", etags["/api/challenges/"])
+
+    def test_user_list_follows_stats_and_user_edits(self):
+        athlete = self.world.fresh_athlete(runs=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_athlete_stats", stdout=io.StringIO())
+        etag = self.client.get("/api/users/")["ETag"]
+
+        # последний завершённый забег удалён — строка AthleteStats тоже
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/runs/{athlete.runs.get().id}/")
+        self.assertFalse(AthleteStats.objects.filter(athlete=athlete).exists())
+        etag = self.assertChanged("/api/users/", etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            athlete.is_staff = True
+            athlete.save()
+        etag = self.assertChanged("/api/users/", etag)
+        self.assertChanged("/api/users/", etag, changed=False)
+
+    def test_version_moves_after_commit(self):
+        etag = self.client.get("/api/runs/")["ETag"]
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.world.run.comment = "uncommitted"
+            self.world.run.save()
+        # до коммита токен прежний: GET в этот момент видит старые строки
+        self.assertChanged("/api/runs/", etag, changed=False)
+        for callback in callbacks:
+            callback()
+        self.assertChanged("/api/runs/", etag)
+
+
+class LeaderboardTests(TestCase):
+    """Лидерборды: инкременты при остановке и выдаче предметов совпадают с полной перестройкой."""
+
+    def _entries(self):
+        return sorted(LeaderboardEntry.objects.values_list("metric", "period", "bucket", "athlete_id", "value"))
+
+    def test_increments_match_rebuild(self):
+        item = CollectibleItem(name="flag", uid="lb-1", value=7, latitude=55.75, longitude=37.62,
+                               picture="https://example.com/i.png")
+        item.fill_grid_cell()
+        item.save()
+        athletes = [User.objects.create(username=f"lb{n}") for n in range(3)]
+        for n, athlete in enumerate(athletes):
+            for k in range(n + 1):
+                run = Run.objects.create(athlete=athlete)
+                self.client.post(f"/api/runs/{run.id}/start/")
+                for i in range(3 + n):
+                    self.client.post("/api/positions/", {
+                        "run": run.id, "latitude": round(55.75 + STEP_DEG * i, 4), "longitude": 37.62,
+                        "date_time": (START + datetime.timedelta(days=40 * k, seconds=30 * i)).strftime("%Y-%m-%dT%H:%M:%S.%f"),
+                    }, content_type="application/json")
+                self.assertEqual(self.client.post(f"/api/runs/{run.id}/stop/").status_code, 200)
+
+        incremental = self._entries()
+        self.assertIn(("collectibles", "all", leaderboards.ALL_TIME, athletes[0].id, 7.0), incremental)
+        leaderboards.rebuild()
+        self.assertEqual(self._entries(), incremental)
+
+        board = self.client.get("/api/leaderboards/runs/?period=all").json()["results"]
+        self.assertEqual([row["athlete"] for row in board][:3], [a.id for a in reversed(athletes)])
+        rank = self.client.get(f"/api/leaderboards/runs/users/{athletes[0].id}/?period=all").json()
+        self.assertEqual((rank["rank"], rank["value"]), (3, 1))
+
+    def test_refresh_after_delete(self):
+        world = World()
+        world.grow(2)
+        self.client.delete(f"/api/runs/{world.run.id}/")
+        refreshed = self._entries()
+        leaderboards.rebuild()
+        self.assertEqual(self._entries(), refreshed)
+
+
+class SplitsTests(TestCase):
+    """Сплиты: граница километра внутри сегмента интерполируется, стоянки не идут во время в движении."""
+
+    def test_even_pace_with_a_stop(self):
+        lat = [55.0 + 0.001 * i for i in range(24)]
+        lon = [37.0] * 24
+        # 10 км/ч по всему треку, затем минута на месте
+        km = [0.0]
+        for a, b in zip(lat, lat[1:]):
+            km.append(km[-1] + haversine((a, 37.0), (b, 37.0)))
+        t = [d * 360.0 for d in km]
+        lat.append(lat[-1])
+        lon.append(lon[-1])
+        t.append(t[-1] + 60.0)
+
+        result = splits.compute_splits(lat, lon, t)
+        self.assertEqual([s.index for s in result], [1, 2, 3])
+        for s in result[:2]:
+            self.assertEqual(s.distance, 1.0)
+            self.assertAlmostEqual(s.elapsed_seconds, 360.0, places=6)
+            self.assertAlmostEqual(s.moving_seconds, 360.0, places=6)
+            self.assertAlmostEqual(s.pace, 360.0, places=6)
+        last = result[2]
+        self.assertAlmostEqual(last.distance, km[-1] - 2.0, places=9)
+        self.assertAlmostEqual(last.elapsed_seconds - last.moving_seconds, 60.0, places=6)
+        self.assertEqual(splits.compute_splits([55.0], [37.0], [0.0]), [])
+
+    def test_finished_run_splits_stored_on_first_read(self):
+        run = Run.objects.create(athlete=User.objects.create(username="splits"), status=transitions.IN_PROGRESS)
+        for i in range(30):
+            Position.objects.create(run=run, latitude=round(55.0 + 0.001 * i, 4), longitude=37.0,
+                                    date_time=START + datetime.timedelta(seconds=40 * i))
+        live_splits = self.client.get(f"/api/runs/{run.id}/splits/").json()
+        self.assertEqual(self.client.post(f"/api/runs/{run.id}/stop/").status_code, 200)
+        self.assertFalse(RunSplit.objects.filter(run=run).exists())
+
+        self.assertEqual(self.client.get(f"/api/runs/{run.id}/splits/").json(), live_splits)
+        self.assertEqual(RunSplit.objects.filter(run=run).count(), len(live_splits["splits"]))
+        self.assertEqual(live_splits["fastest_split"], 1)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(f"/api/runs/{run.id}/splits/").json(), live_splits)
+
+
+class AsyncViewsTests(TestCase):
+    """ASGI-маршруты start / stop / создания точки отвечают так же, как DRF-вьюхи, и пишут то же."""
+
+    def setUp(self):
+        item = CollectibleItem(name="flag", uid="async-1", value=3, latitude=55.75, longitude=37.62,
+                               picture="https://example.com/i.png")
+        item.fill_grid_cell()
+        item.save()
+
+    async def _scenario(self, post):
+        athlete = await User.objects.acreate(username=f"async{await User.objects.acount()}")
+        run = await Run.objects.acreate(athlete=athlete)
+        point = {"run": run.id, "latitude": 55.75, "longitude": 37.62,
+                 "date_time": START.strftime("%Y-%m-%dT%H:%M:%S.%f")}
+        steps = [
+            (f"/api/runs/{run.id}/start/", None),
+            (f"/api/runs/{run.id}/start/", None),
+            ("/api/positions/", {**point, "latitude": 123}),
+            ("/api/positions/", point),
+            ("/api/positions/", {**point, "latitude": 55.7505,
+                                 "date_time": (START + datetime.timedelta(seconds=30)).strftime("%Y-%m-%dT%H:%M:%S.%f")}),
+            (f"/api/runs/{run.id}/stop/", None),
+            (f"/api/runs/{run.id}/stop/", None),
+            ("/api/runs/0/start/", None),
+            ("/api/positions/", point),
+        ]
+        out = []
+        for url, body in steps:
+            response = await post(url, body)
+            data = response.json()
+            if isinstance(data, dict):
+                data = {k: v for k, v in data.items() if k not in ("id", "run", "created_at")}
+            out.append((response.status_code, data))
+        run = await Run.objects.aget(pk=run.pk)
+        items = [pk async for pk in athlete.items.values_list("uid", flat=True)]
+        return out, (run.status, run.distance, run.run_time_seconds, await run.positions.acount(), items)
+
+    async def test_same_responses_and_effects(self):
+        def sync_post(url, body):
+            return self.client.post(url, body, content_type="application/json") if body else self.client.post(url)
+
+        client = AsyncClient()
+
+        async def async_post(url, body):
+            if body is None:
+                return await client.post(url)
+            return await client.post(url, body, content_type="application/json")
+
+        expected = await self._scenario(sync_to_async(sync_post))
+        with override_settings(ROOT_URLCONF="project_run.urls_asgi"):
+            actual = await self._scenario(async_post)
+        self.assertEqual(actual, expected)
+        self.assertEqual([code for code, _ in expected[0]], [200, 400, 400, 201, 201, 200, 400, 404, 400])
+        self.assertEqual(expected[1][3:], (2, ["async-1"]))
+
+
+def _drain(watcher):
+    events = []
+    while not watcher.queue.empty():
+        event = watcher.queue.get_nowait()
+        events.append("close" if event is live._CLOSE else re.search(r"^event: (\w+)$", event, re.M)[1])
+    return events
+
+
+class LiveFeedTests(TestCase):
+    """SSE-лента: snapshot, новые точки одним чтением, finished и закрытие потока."""
+
+    def setUp(self):
+        self.run = Run.objects.create(athlete=User.objects.create(username="live"), status=transitions.IN_PROGRESS)
+        self.first = Position.objects.create(run=self.run, latitude=55.75, longitude=37.62, date_time=START)
+        Position.objects.create(run=self.run, latitude=55.7505, longitude=37.62,
+                                date_time=START + datetime.timedelta(seconds=10))
+        self.addCleanup(setattr, live, "hub", live.hub)
+        live.hub = live.Hub(max_watchers=2)
+
+    def test_finished_run_closes_after_snapshot(self):
+        Run.objects.filter(pk=self.run.pk).update(status=transitions.FINISHED)
+        response = self.client.get(f"/api/runs/{self.run.id}/live/")
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual([line for line in body.split("\n") if line.startswith(("retry", "event"))],
+                         ["retry: 3000", "event: snapshot", "event: finished"])
+        self.assertEqual((live.hub.watchers, live.hub.is_watched(self.run.id)), (0, False))
+
+    def test_positions_then_finished(self):
+        watcher = live.SyncWatcher()
+        live.hub.subscribe(self.run.id, watcher, last_event_id=self.first.id)
+        self.assertEqual(_drain(watcher), ["snapshot", "positions"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/positions/", {
+                "run": self.run.id, "latitude": 55.751, "longitude": 37.62,
+                "date_time": (START + datetime.timedelta(seconds=20)).strftime("%Y-%m-%dT%H:%M:%S.%f"),
+            }, content_type="application/json")
+        event = watcher.queue.get_nowait()
+        self.assertIn(f"id: {Position.objects.latest('id').id}\n", event)
+        self.assertIn('"latitude":"55.7510"', event)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/runs/{self.run.id}/stop/")
+        # stream() отдаёт finished, на закрытии выходит и отписывает зрителя
+        events = list(live.stream(self.run.id, watcher))
+        self.assertEqual(events[0], "retry: 3000\n\n")
+        self.assertEqual([re.search(r"^event: (\w+)$", e, re.M)[1] for e in events[1:]], ["finished"])
+        self.assertEqual((live.hub.watchers, live.hub.is_watched(self.run.id)), (0, False))
+
+    def test_watcher_limit_and_unsubscribe(self):
+        watchers = [live.SyncWatcher() for _ in range(2)]
+        for watcher in watchers:
+            live.hub.subscribe(self.run.id, watcher)
+        self.assertEqual(self.client.get(f"/api/runs/{self.run.id}/live/").status_code, 503)
+        for watcher in watchers:
+            live.hub.unsubscribe(self.run.id, watcher)
+        self.assertEqual((live.hub.watchers, live.hub.is_watched(self.run.id)), (0, False))
+
+    def test_subscribe_survives_last_watcher_leaving(self):
+        leaving, late = live.SyncWatcher(), live.SyncWatcher()
+        live.hub.subscribe(self.run.id, leaving)
+        push = late.push
+
+        def push_and_race(event):
+            # пока late читает snapshot, единственный зритель канала уходит
+            if live.hub.watchers == 2:
+                live.hub.unsubscribe(self.run.id, leaving)
+            push(event)
+
+        late.push = push_and_race
+        live.hub.subscribe(self.run.id, late)
+        self.assertTrue(live.hub.is_watched(self.run.id))
+        _drain(late)
+        Position.objects.create(run=self.run, latitude=55.751, longitude=37.62,
+                                date_time=START + datetime.timedelta(seconds=20))
+        live.hub.publish(self.run.id)
+        self.assertEqual(_drain(late), ["positions"])
+
+
+class MetricsTests(TestCase):
+    """Метрики: формат Prometheus, счёт SQL на маршрут, лог медленных запросов."""
+
+    def setUp(self):
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def test_render_format(self):
+        registry = metrics.Registry()
+        registry.observe("GET", 'api/x/"<id>"', 200, 0.02, 3, 0.001, 10)
+        registry.observe("GET", 'api/x/"<id>"', 404, 20.0, 1, 0.5, 5)
+        lines = registry.render().splitlines()
+        labels = 'method="GET",route="api/x/\\"<id>\\""'
+        self.assertEqual(lines[:2], ["# HELP http_request_duration_seconds Request latency by route.",
+                                     "# TYPE http_request_duration_seconds histogram"])
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="0.01"}} 0', lines)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="0.025"}} 1', lines)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', lines)
+        self.assertIn(f"http_request_duration_seconds_count{{{labels}}} 2", lines)
+        self.assertIn(f'http_responses_total{{{labels},status="404"}} 1', lines)
+        self.assertIn(f"http_request_db_queries_total{{{labels}}} 4", lines)
+        self.assertIn(f"http_response_bytes_total{{{labels}}} 15", lines)
+
+    def test_middleware_counts_route_queries(self):
+        World()
+        # request_started чистит лог запросов: начинаем с пустого и считаем ctx до следующего запроса
+        reset_queries()
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as ctx:
+            self.client.get("/api/runs/")
+        per_request = len(ctx)
+        self.client.get("/api/runs/")
+        response = self.client.get("/api/metrics/")
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="^api/runs/$"} 2', body)
+        self.assertIn(f'http_request_db_queries_total{{method="GET",route="^api/runs/$"}} {2 * per_request}', body)
+        self.assertIn('http_responses_total{method="GET",route="^api/runs/$",status="200"} 2', body)
+
+    def test_slow_request_log(self):
+        with override_settings(METRICS_SLOW_REQUEST_MS=0), self.assertLogs("app_run.metrics", "WARNING") as logs:
+            self.client.get("/api/challenges/")
+        self.assertRegex(logs.output[0], r"slow request GET /api/challenges/ \(route \^api/challenges/\$\) -> 200")
+        self.assertIn(" x1 ", logs.output[0])
+
+
+class BenchSuiteTests(TestCase):
+    """bench_suite: сценарии проходят без ошибок на малом наборе, отчёт сравнивается с прошлым."""
+
+    OPTS = {"athletes": 3, "runs": 4, "positions": 20, "items": 50, "requests": 4, "upload_requests": 1,
+            "upload_rows": 5, "seed": 1}
+
+    def test_percentile_nearest_rank(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual([percentile(values, p) for p in (0, 20, 50, 95, 100)], [1, 1, 3, 5, 5])
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_scenarios_and_report(self):
+        command = bench_suite.Command(stdout=io.StringIO())
+        rnd = random.Random(self.OPTS["seed"])
+        data = command._seed(rnd, self.OPTS)
+        self.assertEqual((len(data["finished"]), len(data["open"]), len(data["to_stop"])), (4, 3, 4))
+
+        results = {name: command._drive(requests)
+                   for name, requests in command._scenarios(Client(), rnd, data, self.OPTS)}
+        self.assertEqual(list(results), ["position_post", "run_stop", "users_list", "positions_list", "upload_file"])
+        for name, r in results.items():
+            self.assertEqual(r["errors"], 0, name)
+            self.assertLessEqual(r["p50_ms"], r["p95_ms"])
+            self.assertLessEqual(r["p95_ms"], r["p99_ms"])
+        self.assertEqual(Run.objects.filter(pk__in=data["to_stop"], status=transitions.FINISHED).count(), 4)
+
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as fh:
+            baseline = {name: {**r, "p95_ms": r["p95_ms"] * 2} for name, r in results.items()}
+            json.dump({"endpoints": baseline}, fh)
+        self.addCleanup(os.remove, fh.name)
+        command._print(results, fh.name)
+        lines = command.stdout.getvalue().splitlines()
+        self.assertTrue(lines[0].endswith("p95 vs base"))
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(all(line.endswith("-50.0%") for line in lines[1:]), lines)
+
+
+class AthleteStatsTests(TestCase):
+    """AthleteStats: инкременты при остановке и пересчёты при правках сходятся с агрегатом по забегам."""
+
+    def assertStatsMatchRuns(self):
+        expected = {row.pop("athlete_id"): row for row in stats.aggregate_finished_runs()}
+        actual = {
+            row.pop("athlete_id"): row
+            for row in AthleteStats.objects.values(
+                "athlete_id", "runs_finished", "total_distance", "total_seconds", "last_run_at"
+            )
+        }
+        self.assertEqual(actual.keys(), expected.keys())
+        for athlete_id, row in expected.items():
+            self.assertAlmostEqual(actual[athlete_id].pop("total_distance"), row.pop("total_distance"), places=6)
+            self.assertEqual(actual[athlete_id], row)
+
+    def test_stop_edit_and_delete(self):
+        world = World()
+        world.grow(0)
+        athlete = world.fresh_athlete(runs=0)
+        runs = [world.fresh_run(transitions.IN_PROGRESS, athlete=athlete) for _ in range(3)]
+        for run in runs:
+            self.assertEqual(self.client.post(f"/api/runs/{run.id}/stop/").status_code, 200)
+        self.assertStatsMatchRuns()
+        self.assertEqual(AthleteStats.objects.get(athlete=athlete).runs_finished, 3)
+
+        self.client.patch(f"/api/runs/{runs[0].id}/", {"status": transitions.IN_PROGRESS},
+                          content_type="application/json")
+        self.client.delete(f"/api/runs/{runs[1].id}/")
+        self.assertStatsMatchRuns()
+        self.assertEqual(AthleteStats.objects.get(athlete=athlete).runs_finished, 1)
+
+        # правка комментария итоги не пересчитывает; перенос забега — у обоих атлетов
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.patch(f"/api/runs/{runs[2].id}/", {"comment": "edited"}, content_type="application/json")
+        self.assertFalse([q for q in ctx.captured_queries if "app_run_athletestats" in q["sql"]])
+        other = world.fresh_athlete(runs=0)
+        self.client.patch(f"/api/runs/{runs[2].id}/", {"athlete": other.id}, content_type="application/json")
+        self.assertStatsMatchRuns()
+        self.assertFalse(AthleteStats.objects.filter(athlete=athlete).exists())
+        self.client.patch(f"/api/runs/{runs[2].id}/", {"athlete": athlete.id}, content_type="application/json")
+
+        self.client.delete(f"/api/runs/{runs[2].id}/")
+        self.assertFalse(AthleteStats.objects.filter(athlete=athlete).exists())
+
+        call_command("rebuild_athlete_stats", stdout=io.StringIO())
+        self.assertStatsMatchRuns()
+
+
+class ChallengeRulesTests(TestCase):
+    """challenges: все правила считаются одним запросом метрик и выдаются без повторов."""
+
+    def setUp(self):
+        self.athlete = User.objects.create(username="challenger")
+        for day in (0, 1, 2, 4):
+            Run.objects.create(athlete=self.athlete, status=transitions.FINISHED, distance=12.5,
+                               run_time_seconds=600, last_date_time=START + datetime.timedelta(days=day))
+        item = CollectibleItem.objects.create(name="i", uid="i", picture="https://example.com/item.png",
+                                              value=1, latitude=1, longitude=1)
+        CollectibleAward.objects.create(collectibleitem=item, user=self.athlete)
+        call_command("rebuild_athlete_stats", stdout=io.StringIO())
+
+    def test_metrics(self):
+        metrics = challenges.athlete_metrics(self.athlete.id)
+        self.assertEqual(
+            {k: metrics[k] for k in ("runs_finished", "total_km", "total_seconds", "collectibles", "longest_run_km")},
+            {"runs_finished": 4, "total_km": 50.0, "total_seconds": 2400, "collectibles": 1, "longest_run_km": 12.5},
+        )
+        # последний забег — день 4, перед ним разрыв
+        self.assertEqual(challenges.streak_days(self.athlete.id, limit=10), 1)
+        Run.objects.create(athlete=self.athlete, status=transitions.FINISHED,
+                           last_date_time=START + datetime.timedelta(days=3))
+        self.assertEqual(challenges.streak_days(self.athlete.id, limit=10), 5)
+        self.assertEqual(challenges.streak_days(self.athlete.id, limit=2), 2)
+
+    def test_award_once(self):
+        rules = [
+            challenges.ChallengeRule(challenges.FIFTY_KM_CHALLENGE, "total_km", 50),
+            challenges.ChallengeRule(challenges.TEN_RUNS_CHALLENGE, "runs_finished", 10),
+            challenges.ChallengeRule("Собери предмет", "collectibles", 1),
+            challenges.ChallengeRule("Три дня подряд", "streak_days", 3),
+        ]
+        with mock.patch.object(challenges, "RULES", rules):
+            earned = challenges.award_challenges(self.athlete.id)
+            challenges.award_challenges(self.athlete.id)
+        self.assertEqual(earned, [challenges.FIFTY_KM_CHALLENGE, "Собери предмет"])
+        self.assertEqual(sorted(Challenge.objects.filter(athlete=self.athlete).values_list("full_name", flat=True)),
+                         sorted(earned))
+
+    def test_unknown_metric(self):
+        with self.assertRaises(ValueError):
+            challenges.register("x", "elevation", 1)
+
+
+class KeysetPaginationTests(TestCase):
+    """Keyset-курсоры: обход по next даёт все строки ровно по разу и в порядке ключа."""
+
+    def setUp(self):
+        athlete = User.objects.create(username="pager")
+        # одинаковые created_at / date_time — порядок внутри группы решает id
+        stamps = [START + datetime.timedelta(minutes=i // 3) for i in range(11)]
+        runs = [Run.objects.create(athlete=athlete, status=transitions.FINISHED) for _ in stamps]
+        challenge_rows = [Challenge.objects.create(athlete=athlete, full_name=f"c{i}") for i in range(len(stamps))]
+        for run, challenge, stamp in zip(runs, challenge_rows, stamps):
+            Run.objects.filter(pk=run.pk).update(created_at=stamp)
+            Challenge.objects.filter(pk=challenge.pk).update(created_at=stamp)
+        self.run = Run.objects.create(athlete=athlete, status=transitions.IN_PROGRESS)
+        Position.objects.bulk_create(
+            Position(run=self.run, latitude=55.7, longitude=37.6, date_time=None if i == 4 else stamp)
+            for i, stamp in enumerate(reversed(stamps))
+        )
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            body = self.client.get(url).json()
+            ids += [row["id"] for row in body["results"]]
+            url, pages = body["next"], pages + 1
+        return ids, pages
+
+    def test_round_trips(self):
+        cases = [
+            ("/api/runs/?cursor=&size=3", Run.objects.order_by("created_at", "id")),
+            ("/api/challenges/?cursor=&size=3", Challenge.objects.order_by("-created_at", "-id")),
+            (f"/api/positions/?run={self.run.id}&cursor=&size=3",
+             Position.objects.filter(date_time__isnull=False).order_by("date_time", "id")),
+        ]
+        for fast in (False, True):
+            for url, expected in cases:
+                with self.subTest(url=url, fast=fast), self.settings(FAST_LIST_JSON=fast):
+                    ids, pages = self.walk(url)
+                    self.assertEqual(ids, list(expected.values_list("id", flat=True)))
+                    self.assertEqual(pages, math.ceil(len(ids) / 3))
+
+    def test_invalid_cursor(self):
+        for cursor in ("garbage", "WzFd"):  # не base64 JSON / список не той длины
+            self.assertEqual(self.client.get(f"/api/runs/?cursor={cursor}").status_code, 404)
+
+
+class ChunkedImportTests(TestCase):
+    """importing: пачки по chunk_size дают те же невалидные строки, что и построчный импорт."""
+
+    ROWS = [
+        ("a", "u1", 1, 55.0, 37.0, "https://example.com/a.png"),
+        ("dup in file", "u1", 2, 55.0, 37.0, "https://example.com/a.png"),
+        ("existing", "old", 3, 55.0, 37.0, "https://example.com/a.png"),
+        None,
+        ("bad lat", "u2", 4, 95.0, 37.0, "https://example.com/a.png"),
+        ("bad url", "u3", 5, 55.0, 37.0, "not a url"),
+        ("b", "u4", 6, -33.5, 151.2, "https://example.com/b.png"),
+        ("c", "u5", 7, 0.0, -179.9, "https://example.com/c.png"),
+    ]
+
+    def setUp(self):
+        CollectibleItem.objects.create(name="old", uid="old", picture="https://example.com/o.png",
+                                       value=1, latitude=1, longitude=1)
+
+    def test_chunks(self):
+        progress = []
+        invalid = importing.import_collectibles(
+            _xlsx([r or (None,) * 6 for r in self.ROWS]), chunk_size=2,
+            on_chunk=lambda read, processed, inserted, rows: progress.append((read, processed, inserted, len(rows))),
+        )
+        self.assertEqual([row[1] for row in invalid], ["u1", "old", "u2", "u3"])
+        self.assertEqual(progress, [(2, 2, 1, 1), (4, 3, 1, 1), (6, 5, 1, 2), (8, 7, 3, 0)])
+        items = CollectibleItem.objects.exclude(uid="old").order_by("uid")
+        self.assertEqual(list(items.values_list("uid", flat=True)), ["u1", "u4", "u5"])
+        self.assertTrue(all(item.grid_cell == geo.grid_cell(item.latitude, item.longitude) for item in items))
+
+    def test_upload_view(self):
+        response = self.client.post("/api/upload_file/", {"file": _xlsx(self.ROWS[:3])})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row[1] for row in response.json()], ["u1", "old"])
+
+        # без нужных колонок невалидны все строки
+        response = self.client.post("/api/upload_file/", {"file": _xlsx(self.ROWS[5:], header=("Name", "UID"))})
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(self.client.post("/api/upload_file/", {"file": io.BytesIO(b"nope")}).status_code, 400)
+
+
+class ImportJobTests(TransactionTestCase):
+    """Фоновый импорт: счётчики по пачкам, heartbeat во время работы, потеря lease и продолжение с rows_read."""
+
+    ROWS = [(f"item {i}", f"job-{i}", i, 55.0, 37.0, "https://example.com/i.png") for i in range(5)]
+
+    def enqueue(self):
+        response = self.client.post("/api/upload_file/?async=1", {"file": _xlsx(self.ROWS + [("bad",)])})
+        self.assertEqual(response.status_code, 202)
+        return response.json()["id"]
+
+    @staticmethod
+    def requeue():
+        try:
+            importing.requeue_stale(datetime.timedelta(seconds=-1))
+        finally:
+            connection.close()
+
+    def test_job_runs_to_done(self):
+        job_id = self.enqueue()
+        job = importing.run_job(importing.claim_next_job(), chunk_size=2)
+
+        self.assertEqual((job.id, job.status, job.rows_processed, job.rows_inserted, job.invalid_count),
+                         (job_id, "done", 6, 5, 1))
+        self.assertIsNone(job.payload)
+        self.assertEqual(self.client.get(f"/api/upload_jobs/{job_id}/invalid_rows/").json(),
+                         [["bad", None, None, None, None, None]])
+        self.assertIsNone(importing.claim_next_job())
+
+    def test_heartbeat_keeps_slow_job(self):
+        self.enqueue()
+        job = importing.claim_next_job()
+        slow_chunk = importing._import_chunk
+
+        def chunk(*args):
+            time.sleep(0.3)
+            return slow_chunk(*args)
+
+        with mock.patch.object(importing, "_import_chunk", side_effect=chunk):
+            worker = threading.Thread(target=importing.run_job, args=(job, 10, 0.05))
+            worker.start()
+            time.sleep(0.2)
+            # пачка идёт дольше stale_after, но heartbeat свежий — задачу не забирают
+            self.assertEqual(importing.requeue_stale(datetime.timedelta(seconds=0.15)), 0)
+            worker.join()
+        self.assertEqual(ImportJob.objects.get(pk=job.pk).status, "done")
+
+    def test_requeued_job_is_left_to_the_next_worker(self):
+        job_id = self.enqueue()
+        job = importing.claim_next_job()
+        real_chunk = importing._import_chunk
+        calls = itertools.count()
+
+        def chunk(*args):
+            # воркер «завис» на второй пачке: другой процесс вернул задачу в очередь, пока он её вставлял
+            if next(calls) == 1:
+                requeue = threading.Thread(target=self.requeue)
+                requeue.start()
+                requeue.join()
+            return real_chunk(*args)
+
+        with mock.patch.object(importing, "_import_chunk", side_effect=chunk):
+            stale = importing.run_job(job, chunk_size=2)
+        # первая пачка закоммичена вместе с прогрессом, вторая откатилась
+        self.assertEqual((stale.status, stale.lease, stale.rows_read, stale.rows_inserted), ("queued", "", 2, 2))
+        self.assertEqual(CollectibleItem.objects.count(), 2)
+
+        rerun = importing.run_job(importing.claim_next_job(), chunk_size=2)
+        self.assertEqual((rerun.status, rerun.rows_read, rerun.rows_processed, rerun.rows_inserted, rerun.invalid_count),
+                         ("done", 6, 6, 5, 1))
+        self.assertEqual(self.client.get(f"/api/upload_jobs/{job_id}/invalid_rows/").json(),
+                         [["bad", None, None, None, None, None]])
+        self.assertEqual(CollectibleItem.objects.count(), 5)
+
+    def test_resume_keeps_duplicate_check(self):
+        # дубль UID из уже закоммиченной части файла остаётся невалидным после продолжения
+        rows = [("a", "dup", 1, 55.0, 37.0, "https://example.com/a.png"), ("bad lat", "x", 2, 95.0, 37.0, "")]
+        rows += [("b", "dup", 3, 55.0, 37.0, "https://example.com/b.png")]
+        job = ImportJob.objects.create(payload=_xlsx(rows).read(), rows_read=2, rows_processed=2, rows_inserted=1,
+                                       invalid_count=1, invalid_rows=[list(rows[1])])
+        CollectibleItem.objects.create(name="a", uid="dup", value=1, latitude=55.0, longitude=37.0,
+                                       picture="https://example.com/a.png")
+        job = importing.run_job(importing.claim_next_job(), chunk_size=2)
+        self.assertEqual((job.status, job.rows_processed, job.rows_inserted, job.invalid_count), ("done", 3, 1, 2))
+        self.assertEqual([row[1] for row in job.invalid_rows], ["x", "dup"])
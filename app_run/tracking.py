@@ -0,0 +1,112 @@
+"""
+Накопительные итоги трека забега (Run.TRACK_FIELDS).
+
+Итоги обновляются при каждом приёме точек, поэтому остановка забега
+не читает трек целиком. Порядок точек тот же, что и при полном пересчёте:
+по (date_time, id), точки без date_time идут первыми.
+"""
+from django.db.models import F, Max, Min, Q
+from haversine import haversine, Unit
+
+from . import live, track_metrics
+from .models import Position, Run
+
+
+def _km(a, b):
+    return haversine((float(a[0]), float(a[1])), (float(b[0]), float(b[1])), unit=Unit.KILOMETERS)
+
+
+def compute_totals(run_id):
+    """Итоги трека по сырым точкам — эталон для reconcile."""
+    track = track_metrics.ordered_track(run_id)
+    bounds = track.aggregate(first=Min("date_time"), last=Max("date_time"))
+    last_point = track.values_list("latitude", "longitude").last()
+    totals = {
+        "track_distance": track_metrics.run_metrics(run_id).distance_km,
+        "first_date_time": bounds["first"],
+        "last_date_time": bounds["last"],
+        "last_latitude": None,
+        "last_longitude": None,
+    }
+    if last_point is not None:
+        totals["last_latitude"], totals["last_longitude"] = last_point
+    return totals
+
+
+def recompute_totals(run):
+    for field, value in compute_totals(run.pk).items():
+        setattr(run, field, value)
+    run.save(update_fields=Run.TRACK_FIELDS)
+    return run
+
+
+def add_positions(run_id, positions):
+    """
+    Учитывает в итогах забега уже сохранённые точки positions.
+    Вызывать внутри transaction.atomic(): строка забега блокируется.
+    """
+    run = Run.objects.select_for_update().only("id", *Run.TRACK_FIELDS).get(pk=run_id)
+    live.publish_on_commit(run_id)
+    new = sorted(positions, key=lambda p: (p.date_time is not None, p.date_time, p.pk))
+    if not new:
+        return run
+
+    if run.last_latitude is None:
+        prev = None
+    elif new[0].date_time is None or (
+        run.last_date_time is not None and new[0].date_time < run.last_date_time
+    ):
+        # точка из прошлого: одиночную вставляем между соседями, пачку пересчитываем
+        if len(new) == 1 and new[0].date_time is not None:
+            _insert_between_neighbours(run, new[0])
+            run.save(update_fields=Run.TRACK_FIELDS)
+            return run
+        return recompute_totals(run)
+    else:
+        prev = (run.last_latitude, run.last_longitude)
+
+    for p in new:
+        if prev is not None:
+            run.track_distance += _km(prev, (p.latitude, p.longitude))
+        prev = (p.latitude, p.longitude)
+    if run.first_date_time is None:
+        run.first_date_time = new[0].date_time
+    run.last_date_time = new[-1].date_time
+    run.last_latitude, run.last_longitude = prev
+    run.save(update_fields=Run.TRACK_FIELDS)
+    return run
+
+
+def _insert_between_neighbours(run, position):
+    others = Position.objects.filter(run_id=run.pk).exclude(pk=position.pk)
+    prev = (
+        others.filter(Q(date_time__lte=position.date_time) | Q(date_time__isnull=True))
+        .order_by(F("date_time").desc(nulls_last=True), "-id")
+        .values_list("latitude", "longitude")
+        .first()
+    )
+    nxt = (
+        others.filter(date_time__gt=position.date_time)
+        .order_by("date_time", "id")
+        .values_list("latitude", "longitude")
+        .first()
+    )
+    point = (position.latitude, position.longitude)
+    delta = 0.0
+    if prev is not None:
+        delta += _km(prev, point)
+    if nxt is not None:
+        delta += _km(point, nxt)
+    if prev is not None and nxt is not None:
+        delta -= _km(prev, nxt)
+    run.track_distance += delta
+    if run.first_date_time is None or position.date_time < run.first_date_time:
+        run.first_date_time = position.date_time
+
+
+def finalize(run):
+    """(distance_km, run_time_seconds) для фиксации при остановке — без чтения трека."""
+    run_time_seconds = 0
+    if run.first_date_time and run.last_date_time:
+        run_time_seconds = int((run.last_date_time - run.first_date_time).total_seconds())
+    return round(run.track_distance, 4), run_time_seconds
@@ -0,0 +1,91 @@
+"""
+Переходы статуса забега: init → in_progress → finished.
+
+Переход — условный UPDATE ... WHERE id = <id> AND status = <откуда>: из
+одновременных запросов строку меняет ровно один, остальные видят 0
+изменённых строк и получают InvalidTransition с текущим статусом. Повтор
+уже выполненного перехода отвечает так же — детерминированно, без побочных
+эффектов.
+
+start — один запрос. finish сначала «захватывает» забег тем же UPDATE, а
+уже потом в той же транзакции фиксирует итоги, статистику, лидерборды и
+челленджи: пересчёт делает только победивший запрос, и строка
+забега до коммита заблокирована его UPDATE — select_for_update не нужен.
+Лишний SELECT за статусом бывает только на отказе.
+
+Перед захватом finish сбрасывает буфер приёма точек (app_run.ingest), чтобы
+итоги учли все точки, принятые процессом до остановки; буфер в памяти
+процесса, поэтому этот режим — только при одном процессе приёма. Трек в
+RunTrack упаковывает воркер (packed_track.compact_pending): упаковка читает
+весь трек, а остановка не должна зависеть от его длины.
+"""
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from . import challenges, conditional, ingest, leaderboards, live, stats, tracking
+from .models import Run
+
+
+INIT, IN_PROGRESS, FINISHED = (value for value, _ in Run.STATUS_CHOICES)
+
+
+class InvalidTransition(Exception):
+    def __init__(self, run_id, status):
+        super().__init__(f"run {run_id} is {status}")
+        self.run_id = run_id
+        self.status = status
+
+
+def _claim(run_id, source, target):
+    # update() не шлёт сигналов и не трогает auto_now, а по ним считаются ETag
+    claimed = Run.objects.filter(pk=run_id, status=source).update(status=target, updated_at=timezone.now())
+    if claimed:
+        conditional.bump_on_commit(conditional.RUNS)
+    return claimed
+
+
+def _refuse(run_id):
+    status = Run.objects.filter(pk=run_id).values_list("status", flat=True).first()
+    if status is None:
+        raise Run.DoesNotExist(f"run {run_id} does not exist")
+    raise InvalidTransition(run_id, status)
+
+
+async def _arefuse(run_id):
+    status = await Run.objects.filter(pk=run_id).values_list("status", flat=True).afirst()
+    if status is None:
+        raise Run.DoesNotExist(f"run {run_id} does not exist")
+    raise InvalidTransition(run_id, status)
+
+
+def start(run_id):
+    """init → in_progress."""
+    if not _claim(run_id, INIT, IN_PROGRESS):
+        _refuse(run_id)
+
+
+async def astart(run_id):
+    if not await Run.objects.filter(pk=run_id, status=INIT).aupdate(status=IN_PROGRESS, updated_at=timezone.now()):
+        await _arefuse(run_id)
+    # aupdate уже закоммичен — ждать коммита не нужно
+    await sync_to_async(conditional.bump_version)(conditional.RUNS)
+
+
+def finish(run_id):
+    """in_progress → finished с фиксацией итогов. Возвращает завершённый Run."""
+    # до захвата: после него запись буфера сочла бы точки этого забега опоздавшими
+    ingest.flush_all()
+    with transaction.atomic():
+        if not _claim(run_id, IN_PROGRESS, FINISHED):
+            _refuse(run_id)
+        # итоги трека копятся при приёме точек — здесь только фиксация
+        run = Run.objects.get(pk=run_id)
+        run.distance, run.run_time_seconds = tracking.finalize(run)
+        run.save(update_fields=["distance", "run_time_seconds"])
+
+        stats.record_finished_run(run)
+        leaderboards.record_finished_run(run)
+        challenges.award_challenges(run.athlete_id)
+        live.publish_on_commit(run.pk)
+    return run
@@ -1,24 +1,36 @@
-from openpyxl.reader.excel import load_workbook
+import datetime
+from collections import defaultdict
+
 from rest_framework.decorators import api_view
 from rest_framework.filters import SearchFilter
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.filters import OrderingFilter
-from rest_framework.pagination import PageNumberPagination
 from rest_framework import viewsets, generics
 from rest_framework import status
 
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
-from django.http import Http404
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date, parse_http_date_safe
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db import transaction
-from django.db.models import Count, Q, Sum, Min, Max
-
-from haversine import haversine, Unit
-from geopy.distance import geodesic
+from django.db.models import Count, FloatField, Max, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce
 
-from .models import AthleteInfo, Challenge, Position, Run, CollectibleItem
+from . import (
+    catalogue, export, importing, ingest, leaderboards, live, metrics, packed_track, simplify, splits,
+    stats, track_metrics, tracking, transitions,
+)
+from .conditional import CHALLENGES, RUNS, USERS, ConditionalGetMixin, etag_matches, version
+from .fastlist import FastListMixin
+from .geo import collect_nearby
+from .pagination import KeysetPagination, OptionalPagePagination
+from .models import (
+    AthleteInfo, Challenge, Position, Run, RunSplit, RunTrack, CollectibleAward, CollectibleItem, ImportJob,
+)
 from .serializers import (
     RunSerializer, 
     UserSerializer,
@@ -26,13 +38,73 @@ from .serializers import (
     AthleteInfoSerializer, 
     ChallengeSerializer,
     PositionSerializer,
+    RunSplitSerializer,
     CollectibleItemSerializer,
+    ImportJobSerializer,
+    validate_position_point,
 )
 
 
 
-TEN_RUNS_CHALLENGE = "Сделай 10 Забегов!"
-FIFTY_KM_CHALLENGE = "Пробеги 50 километров!"
+def award_collectibles(athlete_id, points):
+    """Выдаёт атлету все предметы рядом с points, одним INSERT на всю пачку."""
+    items = collect_nearby(points, nearby_items_queryset())
+    award_items(athlete_id, items)
+    return items
+
+
+def nearby_items_queryset():
+    return CollectibleItem.objects.only("id", "latitude", "longitude", "value")
+
+
+def award_items(athlete_id, items):
+    """Выдаёт атлету items, ценность новых — в лидерборды. Вызывать внутри transaction.atomic()."""
+    if not items:
+        return
+    # уже выданные не должны второй раз попасть в лидерборд; под блокировкой атлета
+    # параллельная выдача того же предмета ждёт нашего коммита и увидит его
+    leaderboards.lock_athletes([athlete_id])
+    owned = set(
+        CollectibleAward.objects
+        .filter(user_id=athlete_id, collectibleitem_id__in=[item.pk for item in items])
+        .values_list("collectibleitem_id", flat=True)
+    )
+    new = [item for item in items if item.pk not in owned]
+    CollectibleAward.objects.bulk_create(
+        [CollectibleAward(collectibleitem_id=item.pk, user_id=athlete_id) for item in new],
+        ignore_conflicts=True,
+    )
+    leaderboards.record_awards(athlete_id, sum(item.value for item in new))
+
+
+def store_buffered_positions(positions):
+    """
+    Запись пачки из буфера app_run.ingest: один INSERT на все точки, итоги
+    трека и предметы — по забегу. Точки забегов, которые уже не in_progress,
+    отбрасываются. Возвращает число записанных точек.
+    """
+    with transaction.atomic():
+        athletes = dict(
+            Run.objects
+            .filter(pk__in={p.run_id for p in positions}, status=transitions.IN_PROGRESS)
+            .values_list("id", "athlete_id")
+        )
+        by_run = defaultdict(list)
+        for position in Position.objects.bulk_create([p for p in positions if p.run_id in athletes]):
+            by_run[position.run_id].append(position)
+        # блокировки — по возрастанию id: сначала забеги, потом атлеты (как у POST точки),
+        # иначе две пачки с одними забегами в разном порядке ждали бы друг друга
+        by_athlete = defaultdict(list)
+        for run_id in sorted(by_run):
+            tracking.add_positions(run_id, by_run[run_id])
+            by_athlete[athletes[run_id]] += [(p.latitude, p.longitude) for p in by_run[run_id]]
+        for athlete_id in sorted(by_athlete):
+            award_collectibles(athlete_id, by_athlete[athlete_id])
+    return sum(len(created) for created in by_run.values())
+
+
+position_buffer = ingest.PositionBuffer(store_buffered_positions)
+
 
 @api_view(['GET'])
 def contacts_view(request):
@@ -45,146 +117,202 @@ def contacts_view(request):
     )
 
 
-class PagePagination(PageNumberPagination):
-    page_size = 5
-    page_size_query_param = 'size'
-    max_page_size = 50
+def metrics_view(request):
+    """Метрики процесса (app_run.metrics) в текстовом формате Prometheus."""
+    return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
-class OptionalPagePagination(PageNumberPagination):
-    page_size = None
-    page_size_query_param = 'size'
-    max_page_size = 50
 
-    def get_page_size(self, request):
-        if self.page_size_query_param in request.query_params:
-            try:
-                return self._get_size_from_query(request)
-            except ValueError:
-                return None
-        return None
-
-    def _get_size_from_query(self, request):
-        raw = request.query_params[self.page_size_query_param]
-        size = int(raw)
-        if size <= 0:
-            raise ValueError("size must be positive")
-        if self.max_page_size:
-            size = min(size, self.max_page_size)
-        return size
+def _transition_refused(exc):
+    return Response(
+        {"detail": "Run already started or finished!", "id": exc.run_id, "status": exc.status},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
 
 
 class StartRunApiView(APIView):
     def post(self, request, run_id):
-        current = get_object_or_404(Run, id=run_id)
+        try:
+            transitions.start(run_id)
+        except Run.DoesNotExist:
+            raise Http404("No Run matches the given query.")
+        except transitions.InvalidTransition as exc:
+            return _transition_refused(exc)
 
-        if current.status != Run.STATUS_CHOICES[0][0]:
-            return Response(
-                {
-                    "detail": "Run already started or finished!",
-                    "id": current.id,
-                    "status": current.status,
-                },
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        return Response({"id": run_id, "status": transitions.IN_PROGRESS}, status=status.HTTP_200_OK)
 
-        current.status = Run.STATUS_CHOICES[1][0]
-        current.save(update_fields=["status"])
+
+class StopRunApiView(APIView):
+    def post(self, request, run_id):
+        try:
+            current = transitions.finish(run_id)
+        except Run.DoesNotExist:
+            raise Http404("No Run matches the given query.")
+        except transitions.InvalidTransition as exc:
+            return _transition_refused(exc)
 
         return Response(
             {
                 "id": current.id,
                 "status": current.status,
+                "distance": current.distance,
+                "run_time_seconds": current.run_time_seconds,   # ← отдаем длительность
             },
             status=status.HTTP_200_OK,
         )
 
 
-class StopRunApiView(APIView):
-    def post(self, request, run_id):
-        current = get_object_or_404(Run, id=run_id)
+class RunLiveView(APIView):
+    """SSE-лента забега (app_run.live); под ASGI её отдаёт async_views.run_live."""
 
-        if current.status != Run.STATUS_CHOICES[1][0]:
+    def perform_content_negotiation(self, request, force=False):
+        # EventSource шлёт Accept: text/event-stream — ошибки всё равно отдаём JSON
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, run_id):
+        get_object_or_404(Run.objects.only("id"), id=run_id)
+        watcher = live.SyncWatcher()
+        try:
+            live.hub.subscribe(run_id, watcher, live.last_event_id(request))
+        except live.TooManyWatchers:
+            return Response({"detail": "Too many live watchers, retry later."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "5"})
+        return live_response(live.stream(run_id, watcher))
+
+
+def live_response(events):
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class RunSplitsView(APIView):
+    """Сплиты по километрам: завершённого забега — сохранённые, пока забег идёт — по текущему треку."""
+
+    def get(self, request, run_id):
+        run = get_object_or_404(Run.objects.only("id", "status"), id=run_id)
+        if run.status == stats.FINISHED:
+            rows = list(run.splits.all())
+            if not rows:
+                # первое чтение после остановки или после удаления точек
+                with transaction.atomic():
+                    rows = splits.store(run.id, splits.run_splits(run.id))
+        else:
+            rows = splits.build(run.id, splits.run_splits(run.id))
+        return Response({
+            "run": run.id,
+            "split_km": splits.SPLIT_KM,
+            **splits.summary(rows),
+            "splits": RunSplitSerializer(rows, many=True).data,
+        })
+
+
+class PositionBatchApiView(APIView):
+    """Пакетная загрузка точек забега: одна проверка статуса, один INSERT."""
+    max_batch_size = 1000
+
+    def post(self, request, run_id):
+        run = get_object_or_404(Run.objects.only("id", "status", "athlete_id"), id=run_id)
+        if run.status != Run.STATUS_CHOICES[1][0]:
             return Response(
-                {
-                    "detail": "Run already started or finished!",
-                    "id": current.id,
-                    "status": current.status,
-                },
+                {"run": "Run must be in status 'in_progress'", "id": run.id, "status": run.status},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        with transaction.atomic():
-            # 1) считаем длительность по date_time
-            agg = Position.objects.filter(run=current).aggregate(
-                min_dt=Min("date_time"),
-                max_dt=Max("date_time"),
-            )
-            min_dt, max_dt = agg["min_dt"], agg["max_dt"]
-            run_time_seconds = int((max_dt - min_dt).total_seconds()) if (min_dt and max_dt) else 0
-
-            pts = list(
-                Position.objects
-                .filter(run=current)
-                .order_by("date_time", "id")  # ← ТУТ ВАЖНО
-                .values_list("latitude", "longitude")
-            )
+        points = request.data if isinstance(request.data, list) else request.data.get("positions")
+        if not isinstance(points, list):
+            return Response({"detail": "Expected a list of positions."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(points) > self.max_batch_size:
+            return Response({"detail": f"At most {self.max_batch_size} positions per batch."},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-            distance_km = 0.0
-            if len(pts) >= 2:
-                prev = (float(pts[0][0]), float(pts[0][1]))
-                for lat, lon in pts[1:]:
-                    cur = (float(lat), float(lon))
-                    distance_km += haversine(prev, cur, unit=Unit.KILOMETERS)
-                    prev = cur
-
-            # фиксация статуса + метрик
-            current.status = Run.STATUS_CHOICES[2][0]
-            current.distance = round(distance_km, 4)
-            current.run_time_seconds = run_time_seconds
-            current.save(update_fields=["status", "distance", "run_time_seconds"])
-
-            # челленджи — как было
-            finished_count = Run.objects.filter(
-                athlete=current.athlete, status="finished"
-            ).count()
-
-            if finished_count == 10 and not Challenge.objects.filter(
-                athlete=current.athlete, full_name=TEN_RUNS_CHALLENGE
-            ).exists():
-                Challenge.objects.create(
-                    athlete=current.athlete, full_name=TEN_RUNS_CHALLENGE
-                )
-
-            total_km = Run.objects.filter(
-                athlete=current.athlete, status="finished"
-            ).aggregate(s=Sum("distance"))["s"] or 0.0
-
-            if total_km >= 50 and not Challenge.objects.filter(
-                athlete=current.athlete, full_name=FIFTY_KM_CHALLENGE
-            ).exists():
-                Challenge.objects.create(athlete=current.athlete, full_name=FIFTY_KM_CHALLENGE)
+        valid, errors = [], []
+        for index, raw in enumerate(points):
+            attrs, point_errors = validate_position_point(raw)
+            if point_errors:
+                errors.append({"index": index, "errors": point_errors})
+            else:
+                valid.append(Position(run=run, **attrs))
+
+        items = []
+        with transaction.atomic():
+            created = Position.objects.bulk_create(valid)
+            if created:
+                tracking.add_positions(run.id, created)
+                items = award_collectibles(run.athlete_id, [(p.latitude, p.longitude) for p in created])
 
         return Response(
             {
-                "id": current.id,
-                "status": current.status,
-                "distance": current.distance,
-                "run_time_seconds": current.run_time_seconds,   # ← отдаем длительность
+                "id": run.id,
+                "created": len(created),
+                "collected_items": [item.id for item in items],
+                "errors": errors,
             },
-            status=status.HTTP_200_OK,
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
         )
 
 
-class RunViewSet(viewsets.ModelViewSet):
+class RunKeysetPagination(KeysetPagination):
+    keyset_fields = ("created_at", "id")
+
+
+class ChallengeKeysetPagination(KeysetPagination):
+    keyset_fields = ("-created_at", "-id")
+
+
+class PositionKeysetPagination(KeysetPagination):
+    # точки без date_time (API таких не создаёт) в keyset-страницы не попадают
+    keyset_fields = ("date_time", "id")
+    offset_fallback = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            queryset = queryset.filter(date_time__isnull=False)
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RunViewSet(ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Run.objects.select_related('athlete').all()
     serializer_class = RunSerializer
-    pagination_class = OptionalPagePagination
+    pagination_class = RunKeysetPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['status', 'athlete']
     ordering_fields = ['created_at']
 
+    def get_etag_parts(self):
+        if self.action == 'retrieve':
+            lookup = self.get_etag_object_filter()
+            return lookup and Run.objects.filter(**lookup).values_list(
+                'updated_at', 'athlete__username', 'athlete__first_name', 'athlete__last_name'
+            ).first()
+        return (version(RUNS),)
+
+    # поля забега, от которых зависят AthleteStats и лидерборды
+    TOTALS_FIELDS = ('status', 'distance', 'run_time_seconds', 'athlete_id')
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+    def perform_update(self, serializer):
+        before = {f: getattr(serializer.instance, f) for f in self.TOTALS_FIELDS}
+        with transaction.atomic():
+            run = serializer.save()
+            # правка комментария итогов не меняет — пересчёт только при смене итоговых полей
+            if stats.FINISHED not in (before['status'], run.status):
+                return
+            if all(getattr(run, f) == before[f] for f in self.TOTALS_FIELDS):
+                return
+            for athlete_id in {before['athlete_id'], run.athlete_id}:
+                stats.refresh_athlete(athlete_id)
+                leaderboards.refresh_athlete(athlete_id)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            if instance.status == stats.FINISHED:
+                stats.refresh_athlete(instance.athlete_id)
+                leaderboards.refresh_athlete(instance.athlete_id)
+
+
+class UserViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = OptionalPagePagination
@@ -194,7 +322,7 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
 
     def get_queryset(self):
         qs = (self.queryset.exclude(is_superuser=True)
-              .annotate(runs_finished=Count('runs', filter=Q(runs__status='finished'), distinct=True)))
+              .annotate(runs_finished=Coalesce('athlete_stats__runs_finished', 0)))
         t = self.request.query_params.get('type')
         if t == 'coach': qs = qs.filter(is_staff=True)
         elif t == 'athlete': qs = qs.filter(is_staff=False)
@@ -207,6 +335,24 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
             return UserDetailSerializer
         return UserSerializer
 
+    def get_etag_parts(self):
+        if self.action == 'retrieve':
+            lookup = self.get_etag_object_filter()
+            if lookup is None:
+                return None
+            items = (CollectibleItem.athletes.through.objects
+                     .filter(user_id=OuterRef('pk')).order_by().values('user_id'))
+            row = User.objects.filter(**lookup).annotate(
+                items_n=Subquery(items.annotate(n=Count('id')).values('n')),
+                items_top=Subquery(items.annotate(m=Max('id')).values('m')),
+            ).values_list(
+                'username', 'first_name', 'last_name', 'is_staff',
+                'athlete_stats__updated_at', 'items_n', 'items_top',
+            ).first()
+            # в ответе и поля самих предметов — учитываем версию каталога
+            return row and (*row, catalogue.version()[0])
+        return (version(USERS),)
+
 
 class AthleteInfoView(APIView):
     def get_user(self, user_id: int) -> User:
@@ -227,43 +373,110 @@ class AthleteInfoView(APIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class ChallengeViewSet(viewsets.ReadOnlyModelViewSet):
+class ChallengeViewSet(ConditionalGetMixin, FastListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Challenge.objects.select_related("athlete").order_by("-created_at")
     serializer_class = ChallengeSerializer
-    pagination_class = OptionalPagePagination
+    pagination_class = ChallengeKeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["athlete"]
 
+    def get_etag_parts(self):
+        # челленджи не редактируются — только появляются и удаляются
+        if self.action == "retrieve":
+            lookup = self.get_etag_object_filter()
+            return lookup and Challenge.objects.filter(**lookup).values_list("id", "created_at").first()
+        return (version(CHALLENGES),)
+
 
-class PositionViewSet(viewsets.ModelViewSet):
+class PositionViewSet(FastListMixin, viewsets.ModelViewSet):
     queryset = Position.objects.select_related("run", "run__athlete").order_by("id")
     serializer_class = PositionSerializer
+    pagination_class = PositionKeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["run"]
     http_method_names = ["get", "post", "delete", "head", "options"]
 
     def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
-        
-        if response.status_code == status.HTTP_201_CREATED:
-            position = Position.objects.select_related('run__athlete').get(id=response.data['id'])
-            athlete = position.run.athlete
-            position_lat = float(position.latitude)
-            position_lon = float(position.longitude)
-            
-            for item in CollectibleItem.objects.all():
-                item_lat = float(item.latitude)
-                item_lon = float(item.longitude)
-                
-                distance_m = geodesic(
-                    (position_lat, position_lon),
-                    (item_lat, item_lon)
-                ).meters
-                
-                if distance_m < 100:
-                    item.athletes.add(athlete)
-        
-        return response
+        if not ingest.enabled():
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        position_buffer.add(Position(**serializer.validated_data))
+        # точка ещё в буфере: id и created_at у неё появятся при записи
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            position = serializer.save()
+            tracking.add_positions(position.run_id, [position])
+            award_collectibles(position.run.athlete_id, [(position.latitude, position.longitude)])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            tracking.recompute_totals(Run.objects.select_for_update().get(pk=instance.run_id))
+            RunTrack.objects.filter(run_id=instance.run_id).delete()
+            RunSplit.objects.filter(run_id=instance.run_id).delete()
+        simplify.invalidate(instance.run_id)
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        if "simplify" not in params and "max_points" not in params:
+            # весь трек завершённого забега — из упакованной копии, без строк Position
+            if "run" in params and set(params) <= {"run", "format"}:
+                data = self._packed_track(params["run"])
+                if data is not None:
+                    return Response(data)
+            return super().list(request, *args, **kwargs)
+
+        try:
+            run_id = int(params["run"])
+            tolerance = float(params["simplify"]) if "simplify" in params else None
+            max_points = int(params["max_points"]) if "max_points" in params else None
+            if (tolerance is not None and not tolerance >= 0) or (max_points is not None and max_points < 2):
+                raise ValueError
+        except (KeyError, ValueError):
+            return Response(
+                {"detail": "simplify=<tolerance_m> and max_points=<N> need run=<id>, tolerance >= 0, N >= 2."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        run = get_object_or_404(Run.objects.only("id", "status"), pk=run_id)
+        # трек завершённого забега больше не растёт — упрощённый вариант можно кэшировать
+        key = None
+        if run.status == Run.STATUS_CHOICES[2][0]:
+            key = simplify.cache_key(run.id, tolerance, max_points)
+            data = simplify.track_cache().get(key)
+            if data is not None:
+                return Response(data)
+
+        data = self._simplified_track(run.id, tolerance, max_points)
+        if key:
+            simplify.track_cache().set(key, data, simplify.CACHE_TTL)
+        return Response(data)
+
+    def _packed_track(self, run_id):
+        try:
+            run_id = int(run_id)
+        except ValueError:
+            return None
+        data = (
+            RunTrack.objects
+            .filter(run_id=run_id, run__status=Run.STATUS_CHOICES[2][0])
+            .values_list("data", flat=True)
+            .first()
+        )
+        return packed_track.serialized_positions(run_id, data) if data is not None else None
+
+    def _simplified_track(self, run_id, tolerance, max_points):
+        rows = list(track_metrics.ordered_track(run_id).values_list(
+            "id", Cast("latitude", FloatField()), Cast("longitude", FloatField())
+        ))
+        ids, lat, lon = zip(*rows) if rows else ((), (), ())
+        keep = simplify.select(simplify.importance(lat, lon), tolerance, max_points)
+        kept_ids = [ids[i] for i in keep]
+        positions = Position.objects.in_bulk(kept_ids)
+        return list(PositionSerializer([positions[i] for i in kept_ids], many=True).data)
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -277,6 +490,26 @@ class CollectibleItemListView(generics.ListAPIView):
     queryset = CollectibleItem.objects.all()
     serializer_class = CollectibleItemSerializer
 
+    def list(self, request, *args, **kwargs):
+        # готовый JSON из кэша каталога; ETag/Last-Modified — версия каталога
+        token, last_modified = catalogue.version()
+        etag = f'"{token}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": http_date(last_modified.timestamp()),
+            "Cache-Control": "no-cache",
+        }
+
+        if "If-None-Match" in request.headers:
+            not_modified = etag_matches(request, etag)
+        else:
+            since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+            not_modified = since is not None and since >= int(last_modified.timestamp())
+        if not_modified:
+            return HttpResponseNotModified(headers=headers)
+
+        return HttpResponse(catalogue.body(token), content_type="application/json", headers=headers)
+
 
 class UploadFileView(APIView):
     def post(self, request, *args, **kwargs):
@@ -285,64 +518,125 @@ class UploadFileView(APIView):
             return Response({"detail": "No file provided under 'file'."},
                             status=status.HTTP_400_BAD_REQUEST)
 
+        # ?async=1 — не держим воркер: кладём файл в очередь и сразу отдаём id задачи
+        if request.query_params.get("async") in ("1", "true"):
+            job = importing.enqueue(file)
+            return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
         try:
-            wb = load_workbook(filename=file, read_only=True, data_only=True)
-        except Exception as e:
-            return Response({"detail": f"Failed to read workbook: {e}"},
-                            status=status.HTTP_400_BAD_REQUEST)
+            invalid_rows = importing.import_collectibles(file)
+        except importing.WorkbookError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        ws = wb.active
-        rows_iter = ws.iter_rows(values_only=True)
+        return Response(invalid_rows, status=status.HTTP_200_OK)
 
-        try:
-            header = next(rows_iter)
-        except StopIteration:
-            return Response([], status=status.HTTP_200_OK)
-
-        header_map = {str(h).strip(): idx for idx, h in enumerate(header)}
-        required = ["Name", "UID", "Value", "Latitude", "Longitude", "URL"]
-        missing = [h for h in required if h not in header_map]
-        if missing:
-            invalid_rows = [list(r) for r in rows_iter if r and any(c is not None for c in r)]
-            return Response(invalid_rows, status=status.HTTP_200_OK)
-
-        invalid_rows = []
-        valid_instances = []
-        seen_uids = set()
-
-        for row in rows_iter:
-            if row is None or all(cell is None for cell in row):
-                continue
-
-            data = {
-                "name": row[header_map["Name"]],
-                "uid": row[header_map["UID"]],
-                "value": row[header_map["Value"]],
-                "latitude": row[header_map["Latitude"]],
-                "longitude": row[header_map["Longitude"]],
-                "picture": row[header_map["URL"]],
-            }
-
-            uid_val = str(data.get("uid") or "").strip()
-            if uid_val in seen_uids:
-                invalid_rows.append(list(row))
-                continue
-            if uid_val:
-                seen_uids.add(uid_val)
-
-            ser = CollectibleItemSerializer(data=data)
-            if ser.is_valid():
-                valid_instances.append(CollectibleItem(**ser.validated_data))
-            else:
-                invalid_rows.append(list(row))
 
-        with transaction.atomic():
-            for inst in valid_instances:
-                try:
-                    inst.save()
-                except Exception:
-                    invalid_rows.append([
-                        inst.name, inst.uid, inst.value, inst.latitude, inst.longitude, inst.picture
-                    ])
+class ImportJobView(generics.RetrieveAPIView):
+    queryset = ImportJob.objects.defer("payload", "invalid_rows")
+    serializer_class = ImportJobSerializer
 
-        return Response(invalid_rows, status=status.HTTP_200_OK)
+
+class ImportJobInvalidRowsView(APIView):
+    def get(self, request, pk):
+        job = get_object_or_404(ImportJob.objects.only("id", "status", "invalid_rows"), pk=pk)
+        if job.status != "done":
+            return Response(
+                {"detail": "Import job is not finished yet!", "id": job.id, "status": job.status},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(job.invalid_rows or [], status=status.HTTP_200_OK)
+
+
+class RunExportView(APIView):
+    """Потоковая выгрузка трека: /api/runs/<id>/export.gpx и .geojson."""
+
+    def get(self, request, run_id, fmt):
+        run = get_object_or_404(Run, id=run_id)
+        response = StreamingHttpResponse(
+            export.encoded(export.FORMATS[fmt](run)), content_type=export.CONTENT_TYPES[fmt]
+        )
+        response["Content-Disposition"] = f'attachment; filename="run_{run.id}.{fmt}"'
+        return response
+
+
+class AthleteRunsExportView(APIView):
+    """Все забеги атлета одним потоковым zip: ?type=gpx (по умолчанию) или geojson."""
+
+    def get(self, request, user_id):
+        user = get_object_or_404(User, pk=user_id)
+        # не ?format= — его перехватывает content negotiation DRF
+        fmt = request.query_params.get("type", "gpx")
+        if fmt not in export.FORMATS:
+            return Response({"detail": f"type must be one of: {', '.join(export.FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        runs = Run.objects.filter(athlete=user).order_by("id").iterator()
+        response = StreamingHttpResponse(export.zip_chunks(runs, fmt), content_type="application/zip")
+        response["Content-Disposition"] = f'attachment; filename="runs_{user.id}_{fmt}.zip"'
+        return response
+
+
+class LeaderboardMixin:
+    """Общий разбор ?period=week|month|all и ?date=YYYY-MM-DD (по умолчанию — сегодня)."""
+    default_period = "week"
+
+    def parse_board(self, request, metric):
+        if metric not in leaderboards.METRICS:
+            raise Http404
+        period = request.query_params.get("period", self.default_period)
+        if period not in leaderboards.PERIODS:
+            raise ValueError(f"period must be one of: {', '.join(leaderboards.PERIODS)}")
+        raw = request.query_params.get("date")
+        moment = timezone.now()
+        if raw:
+            day = parse_date(raw)
+            if day is None:
+                raise ValueError("date must be YYYY-MM-DD")
+            moment = timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+        return period, leaderboards.bucket(period, moment)
+
+    @staticmethod
+    def bad_request(exc):
+        return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class LeaderboardView(LeaderboardMixin, APIView):
+    """Топ атлетов: /api/leaderboards/<distance|runs|collectibles>/?period=&date=&limit="""
+    default_limit = 10
+    max_limit = 100
+
+    def get(self, request, metric):
+        try:
+            period, bucket = self.parse_board(request, metric)
+        except ValueError as exc:
+            return self.bad_request(exc)
+        try:
+            limit = int(request.query_params.get("limit", self.default_limit))
+            if not 1 <= limit <= self.max_limit:
+                raise ValueError
+        except ValueError:
+            return self.bad_request(f"limit must be between 1 and {self.max_limit}")
+        return Response({
+            "metric": metric,
+            "period": period,
+            "bucket": bucket.isoformat() if period != "all" else None,
+            "results": leaderboards.top(metric, period, bucket, limit),
+        })
+
+
+class LeaderboardRankView(LeaderboardMixin, APIView):
+    """Место атлета: /api/leaderboards/<metric>/users/<id>/; rank = null, если результатов нет."""
+
+    def get(self, request, metric, user_id):
+        try:
+            period, bucket = self.parse_board(request, metric)
+        except ValueError as exc:
+            return self.bad_request(exc)
+        user = get_object_or_404(User.objects.only("id"), pk=user_id)
+        place = leaderboards.rank_of(metric, period, bucket, user.id) or {"rank": None, "value": 0}
+        return Response({
+            "metric": metric,
+            "period": period,
+            "bucket": bucket.isoformat() if period != "all" else None,
+            "athlete": user.id,
+            **place,
+        })
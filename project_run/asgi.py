@@ -2,6 +2,8 @@
 ASGI config for project_run project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests are routed with project_run.urls_asgi, which serves the ingest
+endpoints (start, stop, position create) with async views.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -9,8 +11,26 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project_run.settings')
 
-application = get_asgi_application()
+ASGI_URLCONF = 'project_run.urls_asgi'
+
+
+class ProjectASGIHandler(ASGIHandler):
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = ASGI_URLCONF
+        return request, error_response
+
+
+def get_application():
+    # то же, что django.core.asgi.get_asgi_application(), но со своим handler
+    django.setup(set_prefix=False)
+    return ProjectASGIHandler()
+
+
+application = get_application()
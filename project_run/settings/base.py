@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app_run.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +57,20 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'project_run.urls'
 
+# Порог лога медленных запросов (логгер app_run.metrics) в мс; None — выключен.
+METRICS_SLOW_REQUEST_MS = None
+
+# list runs/challenges/positions без сериализатора на строку (app_run.fastlist); ответ тот же.
+# Выключено по умолчанию; включается на развёртывании после сверки ответов (bench_fast_list).
+FAST_LIST_JSON = False
+
+# POST /api/positions/ через буфер процесса (app_run.ingest): ответ 202, запись пачкой
+# по POSITION_BUFFER_MAX_POINTS точек или не позже POSITION_BUFFER_MAX_DELAY_MS.
+# Только для одного процесса приёма: stop сбрасывает буфер лишь своего процесса.
+POSITION_BUFFER = False
+POSITION_BUFFER_MAX_POINTS = 500
+POSITION_BUFFER_MAX_DELAY_MS = 200
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -93,6 +109,29 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# каталог предметов кэшируется в файлах, чтобы сброс версии видели все воркеры хоста
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogue': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'project_run_catalogue',
+    },
+    'tracks': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'project_run_tracks',
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'project_run_versions',
+    },
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
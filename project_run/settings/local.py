@@ -7,5 +7,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # тестовая БД файлом: in-memory shared cache на записи из нескольких потоков
+        # (тесты гонок в app_run/tests.py) отвечает "table is locked", не дожидаясь блокировки
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
\ No newline at end of file
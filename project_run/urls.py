@@ -31,10 +31,21 @@ router.register('api/positions', views.PositionViewSet)
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/company_details/', views.contacts_view),
+    path('api/metrics/', views.metrics_view),
     path('api/runs/<int:run_id>/start/', views.StartRunApiView.as_view(),),
     path('api/runs/<int:run_id>/stop/', views.StopRunApiView.as_view(),),
+    path('api/runs/<int:run_id>/positions/batch/', views.PositionBatchApiView.as_view()),
+    path('api/runs/<int:run_id>/splits/', views.RunSplitsView.as_view()),
+    path('api/runs/<int:run_id>/live/', views.RunLiveView.as_view()),
+    path('api/runs/<int:run_id>/export.gpx', views.RunExportView.as_view(), {'fmt': 'gpx'}),
+    path('api/runs/<int:run_id>/export.geojson', views.RunExportView.as_view(), {'fmt': 'geojson'}),
+    path('api/users/<int:user_id>/runs/export.zip', views.AthleteRunsExportView.as_view()),
     path('api/athlete_info/<int:user_id>/', views.AthleteInfoView.as_view()),
     path('api/collectible_item/', views.CollectibleItemListView.as_view()),
     path('api/upload_file/', views.UploadFileView.as_view()),
+    path('api/upload_jobs/<int:pk>/', views.ImportJobView.as_view()),
+    path('api/upload_jobs/<int:pk>/invalid_rows/', views.ImportJobInvalidRowsView.as_view()),
+    path('api/leaderboards/<str:metric>/', views.LeaderboardView.as_view()),
+    path('api/leaderboards/<str:metric>/users/<int:user_id>/', views.LeaderboardRankView.as_view()),
     path('', include(router.urls))
 ]
\ No newline at end of file
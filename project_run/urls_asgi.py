@@ -0,0 +1,22 @@
+"""
+URL configuration for the ASGI entry point (project_run.asgi).
+
+Same routes as project_run.urls; start, stop, position create, the live
+feed and the track exports are served by the async views from
+app_run.async_views.
+"""
+from django.urls import path
+
+from app_run import async_views
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/runs/<int:run_id>/start/', async_views.start_run),
+    path('api/runs/<int:run_id>/stop/', async_views.stop_run),
+    path('api/positions/', async_views.positions),
+    path('api/runs/<int:run_id>/live/', async_views.run_live),
+    path('api/runs/<int:run_id>/export.gpx', async_views.run_export, {'fmt': 'gpx'}),
+    path('api/runs/<int:run_id>/export.geojson', async_views.run_export, {'fmt': 'geojson'}),
+    path('api/users/<int:user_id>/runs/export.zip', async_views.athlete_runs_export),
+] + sync_urlpatterns